@@ -0,0 +1,70 @@
+"""
+Measures encoding a 10k-event delivery with and without serializing the
+shared aws fields once.
+
+    python benchmarks/bench_envelope.py [events]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import ingest  # noqa: E402
+import jsoncodec  # noqa: E402
+
+aws_fields = {
+    "owner": "123456789012",
+    "logGroup": "/aws/lambda/checkout-service",
+    "logStream": "2024/01/01/[$LATEST]0123456789abcdef0123456789abcdef",
+    "messageType": "DATA_MESSAGE",
+    "subscriptionFilters": ["axiom-cloudwatch-forwarder"],
+    "serviceName": "lambda",
+    "logGroupName": "checkout-service",
+    "tags": {"env": "production", "team": "payments"},
+}
+
+
+def delivery(n: int) -> list:
+    request_id = "b3be449c-8bd7-11e7-bb30-4f271af95c46"
+    return [
+        {
+            "_time": 1700000000000000 + i * 1000,
+            "aws": aws_fields,
+            "message": f"2024-01-01T00:00:00.000Z\t{request_id}\tINFO\torder {i}",
+            "lambda": {"requestID": request_id},
+        }
+        for i in range(n)
+    ]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    events = delivery(n)
+    envelope = len(jsoncodec.dumps(aws_fields))
+    print(f"{n} events, aws fields {envelope} bytes")
+    print(f"{'backend':<8} {'per event':>10} {'shared':>10} {'speedup':>8}")
+    for name, (_, dumps) in jsoncodec.backends.items():
+        if name != "json" and getattr(jsoncodec, name) is None:
+            continue
+        jsoncodec.dumps = dumps
+        per_event = min(
+            timeit.repeat(lambda: list(ingest.iter_encoded(events)), number=1, repeat=5)
+        )
+        shared = min(
+            timeit.repeat(
+                lambda: list(ingest.iter_encoded(events, shared_key="aws")),
+                number=1,
+                repeat=5,
+            )
+        )
+        print(
+            f"{name:<8} {per_event * 1000:>8.1f}ms {shared * 1000:>8.1f}ms "
+            f"{per_event / shared:>7.2f}x"
+        )
+    print(f"aws fields encoded {n - 1} times less, {(n - 1) * envelope} bytes")
+
+
+if __name__ == "__main__":
+    main()
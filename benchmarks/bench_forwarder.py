@@ -0,0 +1,267 @@
+"""
+End-to-end benchmark of the forwarder against a local ingest server.
+
+    python benchmarks/bench_forwarder.py [--runs 5] [--output results.json]
+        [--ingest-url http://127.0.0.1:3400] [--src path/to/src]
+
+For every scenario a synthetic delivery is sent through lambda_handler, and
+the cost of its stages is measured on their own:
+
+- decode: base64, gzip and JSON decoding of the awslogs payload
+- parse: building the events sent to Axiom from the log events
+- serialize: encoding the events to JSON and compressing the request bodies
+- upload: sending the requests, the push time minus serialization
+
+The peak memory of a scenario is the growth of the peak RSS of a fresh
+process over its first invocation, so allocations of native JSON and
+compression libraries are counted as well. It is only measured on Linux.
+
+Results are printed as JSON (or written to --output) so runs of different
+commits can be compared with compare.py. --src benchmarks the forwarder of
+another source tree, e.g. a worktree of an older commit; stages are only
+measured if that tree has the streaming decoder and ingest modules.
+
+The benchmark starts its own ingest server unless --ingest-url points to one,
+e.g. an ingest_server.py that injects faults. Received events and bytes are
+only reported for the server it starts.
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, "..", "testing"))
+
+from deliveries import make_delivery  # noqa: E402
+from ingest_server import IngestServer  # noqa: E402
+
+# name -> (kind of messages, number of events)
+scenarios = {
+    "lambda_1k": ("lambda", 1_000),
+    "json_1k": ("json", 1_000),
+    "text_large": ("text", 2_000),
+    "lambda_max_delivery": ("lambda", 100_000),
+}
+
+
+class Context:
+    """The parts of the Lambda context the forwarder uses."""
+
+    def get_remaining_time_in_millis(self) -> int:
+        return 300_000
+
+
+def _median_ms(fn, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def _commit(src: str) -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=src,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def _memory_bytes(field: str) -> int:
+    """VmRSS, or VmHWM for the peak, of this process."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    raise ValueError(f"No {field} in /proc/self/status")
+
+
+def measure_peak_rss(src: str, event: dict) -> Optional[int]:
+    """
+    Invokes the handler once in a fresh process, see invoke_once. Only Linux
+    reports the peak RSS of a process since a point in time.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(event, f)
+    try:
+        out = subprocess.run(
+            [sys.executable, __file__, "--src", src, "--invoke-once", f.name],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    finally:
+        os.unlink(f.name)
+    return int(out.split()[-1])
+
+
+def invoke_once(path: str):
+    """Prints how much the first invocation of the handler grows the peak RSS."""
+    with open(path) as f:
+        event = json.load(f)
+    import forwarder
+
+    forwarder.logger.setLevel("WARNING")
+    # reset the peak RSS to the current RSS, the peak of the imports and of
+    # loading the event is not counted
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    before = _memory_bytes("VmRSS")
+    # memory freed by an earlier invocation would stay resident and hide
+    # the peak of a warm one, so the first invocation is measured
+    forwarder.lambda_handler(event, Context())
+    print(_memory_bytes("VmHWM") - before)
+
+
+def measure_stages(forwarder, payload: str, runs: int) -> dict:
+    import awslogs
+    import ingest
+
+    delivery = awslogs.Delivery(payload)
+    log_events = list(delivery.log_events)
+    aws_fields = forwarder.get_aws_fields(
+        delivery.get("owner"),
+        delivery.get("logGroup"),
+        delivery.get("logStream"),
+        delivery.get("messageType"),
+        forwarder._as_tuple(delivery.get("subscriptionFilters")),
+    )
+    events = list(forwarder.transform_events(log_events, aws_fields))
+
+    def serialize():
+        items = ingest.iter_encoded(events, shared_key=forwarder.shared_event_key)
+        for chunk in ingest.iter_chunks(items):
+            ingest.compress(ingest.json_array(chunk.items))
+
+    stages = {
+        "decode": _median_ms(lambda: list(awslogs.Delivery(payload).log_events), runs),
+        "parse": _median_ms(
+            lambda: list(forwarder.transform_events(log_events, aws_fields)), runs
+        ),
+        "serialize": _median_ms(serialize, runs),
+    }
+    push = _median_ms(lambda: forwarder.push_events_to_axiom(events), runs)
+    stages["upload"] = max(push - stages["serialize"], 0.0)
+    return stages
+
+
+def run_scenario(
+    forwarder, server: Optional[IngestServer], event: dict, runs: int, src: str
+) -> dict:
+    payload = event["awslogs"]["data"]
+    try:
+        stages = measure_stages(forwarder, payload, runs)
+    except ImportError:
+        # a source tree from before the stages were split up
+        stages = {}
+
+    if server is not None:
+        server.reset()
+    context = Context()
+    total = _median_ms(lambda: forwarder.lambda_handler(event, context), runs)
+    received = sent_bytes = raw_bytes = None
+    if server is not None:
+        received = server.events // runs
+        sent_bytes = server.sent_bytes // runs
+        raw_bytes = server.raw_bytes // runs
+
+    peak_rss = measure_peak_rss(src, event)
+
+    log_events = json.loads(gzip.decompress(base64.b64decode(payload)))["logEvents"]
+    messages = sum(len(e["message"].encode("utf-8")) for e in log_events)
+    return {
+        "events": len(log_events),
+        "received_events": received,
+        "payload_bytes": len(payload),
+        "message_bytes": messages,
+        "raw_bytes": raw_bytes,
+        "sent_bytes": sent_bytes,
+        "stages_ms": {k: round(v, 3) for k, v in stages.items()},
+        "handler_ms": round(total, 3),
+        "events_per_second": round(len(log_events) / (total / 1000)),
+        "message_mb_per_second": round(messages / 1e6 / (total / 1000), 2),
+        "peak_rss_bytes": peak_rss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    parser.add_argument(
+        "--scenario", action="append", choices=sorted(scenarios), default=None
+    )
+    parser.add_argument("--ingest-url", default=None)
+    parser.add_argument("--src", default=os.path.join(here, "..", "src"))
+    parser.add_argument("--invoke-once", metavar="EVENT_FILE", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sys.path.insert(0, os.path.abspath(args.src))
+    if args.invoke_once:
+        # the configuration of the parent process is inherited
+        invoke_once(args.invoke_once)
+        return
+
+    server = None if args.ingest_url else IngestServer().start()
+    os.environ.update(
+        {
+            "AXIOM_URL": args.ingest_url or server.url,
+            "AXIOM_TOKEN": "benchmark",
+            "AXIOM_DATASET": "bench",
+        }
+    )
+    # older forwarders create a CloudWatch Logs client when they are imported
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    # configuration is read when the forwarder is imported
+    import forwarder
+
+    forwarder.logger.setLevel("WARNING")
+    ingest = sys.modules.get("ingest")
+    jsoncodec = sys.modules.get("jsoncodec")
+
+    results = {
+        "commit": _commit(args.src),
+        "python": platform.python_version(),
+        "json_backend": jsoncodec.backend if jsoncodec else None,
+        "compression": ingest.content_encoding if ingest else None,
+        "ingest_format": getattr(forwarder, "ingest_format", None),
+        "runs": args.runs,
+        "scenarios": {},
+    }
+    try:
+        for name in args.scenario or scenarios:
+            kind, count = scenarios[name]
+            event = make_delivery(kind, count)
+            results["scenarios"][name] = run_scenario(
+                forwarder, server, event, args.runs, args.src
+            )
+    finally:
+        if server is not None:
+            server.stop()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Measures the cold-start import time of the forwarder with python -X importtime.
+
+    python benchmarks/bench_importtime.py [--runs 5] [--max-ms 150]
+
+Exits with status 1 if boto3 or botocore are imported, or if the median
+import time exceeds --max-ms.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+src = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# modules the ingest path must not import
+forbidden = ("boto3", "botocore")
+
+
+def import_times(module: str) -> dict:
+    """Returns the cumulative import time in microseconds of every module."""
+    env = {k: v for k, v in os.environ.items() if not k.startswith("AWS_")}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=src,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative, name = line.split("|")
+        times[name.strip()] = (int(self_us.split(":")[1]), int(cumulative))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="forwarder")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    median_ms = statistics.median(r[args.module][1] for r in runs) / 1000
+    print(f"import {args.module}: {median_ms:.1f}ms median of {args.runs} runs")
+
+    last = runs[-1]
+    print("slowest modules (self time, last run):")
+    for name, (self_us, _) in sorted(last.items(), key=lambda kv: -kv[1][0])[
+        : args.top
+    ]:
+        print(f"  {self_us / 1000:7.2f}ms  {name}")
+
+    failed = False
+    loaded = [name for name in last if name.split(".")[0] in forbidden]
+    if loaded:
+        print(f"FAIL: {args.module} imports {', '.join(sorted(set(loaded))[:5])}")
+        failed = True
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print(f"FAIL: import time exceeds {args.max_ms}ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Compares loggroups.LogGroupMatcher with the per-group checks of
+build_groups_list it replaced, on synthetic log group names.
+
+    python benchmarks/bench_log_group_matcher.py [log groups]
+"""
+
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from loggroups import LogGroupMatcher  # noqa: E402
+
+_services = ["lambda", "apigateway", "rds", "eks", "ecs", "codebuild", "vpc"]
+_words = "orders payments users cart checkout search auth billing mail".split()
+
+
+def make_names(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        env = rng.choice(("prod", "staging", "dev"))
+        names.add(
+            f"/aws/{rng.choice(_services)}/{rng.choice(_words)}-{env}-"
+            f"{rng.randrange(10**6):06d}"
+        )
+    return sorted(names)
+
+
+def legacy_select(all_names, names, pattern, prefix):
+    """The checks build_groups_list made for every log group."""
+    selected = []
+    for name in all_names:
+        if names is None and pattern is None and prefix is None:
+            selected.append(name)
+        elif names is not None and name in names:
+            selected.append(name)
+        elif prefix is not None and name.startswith(prefix):
+            selected.append(name)
+        elif pattern is not None and re.match(pattern, name):
+            selected.append(name)
+    return selected
+
+
+def matcher_select(all_names, matcher):
+    matches = matcher.matches
+    return [name for name in all_names if matches(name)]
+
+
+def _best(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    all_names = make_names(count)
+    rng = random.Random(1)
+    configs = {
+        "prefix": ([], None, "/aws/lambda/"),
+        "names_200": (rng.sample(all_names, 200), None, None),
+        "names_200_prefix_pattern": (
+            rng.sample(all_names, 200),
+            r"^/aws/rds/.*-prod-",
+            "/aws/lambda/orders-",
+        ),
+        "pattern": ([], r"/aws/(ecs|eks)/.*-prod-\d+$", None),
+    }
+    print(f"{count} log groups, ms per pass (best of 5)")
+    print(f"{'config':<28} {'legacy':>10} {'matcher':>10} {'speedup':>8}")
+    for name, (names, pattern, prefix) in configs.items():
+        matcher = LogGroupMatcher.from_config(names, pattern, prefix)
+        expected = legacy_select(all_names, names or None, pattern, prefix)
+        assert matcher_select(all_names, matcher) == expected
+        legacy = _best(
+            lambda: legacy_select(all_names, names or None, pattern, prefix), 1
+        )
+        new = _best(lambda: matcher_select(all_names, matcher), 1)
+        print(f"{name:<28} {legacy:>10.2f} {new:>10.2f} {legacy / new:>7.1f}x")
+
+    # many prefixes, where a trie pays off against checking them one by one
+    prefixes = sorted({n[: n.rindex("-")] for n in rng.sample(all_names, 500)})
+    matcher = LogGroupMatcher(prefixes=prefixes)
+    as_tuple = tuple(prefixes)
+    trie = _best(lambda: matcher_select(all_names, matcher), 1)
+    startswith = _best(lambda: [n for n in all_names if n.startswith(as_tuple)], 1)
+    print(
+        f"{len(prefixes)} prefixes: trie {trie:.2f} ms, "
+        f"str.startswith(tuple) {startswith:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Compares lambda_logs.parse_message with the regex dispatch it replaced.
+
+    python benchmarks/bench_parse_message.py [iterations]
+"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import lambda_logs  # noqa: E402
+
+std_matcher = re.compile(r"\d\d\d\d-\d\d-\d\d\S+\s+(?P<requestID>\S+)")
+end_matcher = re.compile(r"END RequestId:\s+(?P<requestID>\S+)")
+start_matcher = re.compile(
+    r"START RequestId:\s+(?P<requestID>\S+)\s+" r"Version: (?P<version>\S+)"
+)
+report_matcher = re.compile(
+    r"REPORT RequestId:\s+(?P<requestID>\S+)\s+"
+    r"Duration: (?P<durationMS>\S+) ms\s+"
+    r"Billed Duration: (?P<billedDurationMS>\S+) ms\s+"
+    r"Memory Size: (?P<memorySizeMB>\S+) MB\s+"
+    r"Max Memory Used: (?P<maxMemoryMB>\S+) MB"
+)
+
+
+def legacy_parse_message(message):
+    if message.startswith("REPORT"):
+        m = report_matcher.match(message)
+        if m is not None:
+            m = m.groupdict()
+            m["durationMS"] = float(m["durationMS"])
+            m["billedDurationMS"] = int(m["billedDurationMS"])
+            m["memorySizeMB"] = int(m["memorySizeMB"])
+            m["maxMemoryMB"] = int(m["maxMemoryMB"])
+        return m
+    elif message.startswith("END"):
+        m = end_matcher.match(message)
+    elif message.startswith("START"):
+        m = start_matcher.match(message)
+    else:
+        m = std_matcher.match(message)
+    return {} if m is None else m.groupdict()
+
+
+request_id = "b3be449c-8bd7-11e7-bb30-4f271af95c46"
+messages = {
+    "start": f"START RequestId: {request_id} Version: $LATEST",
+    "end": f"END RequestId: {request_id}",
+    "report": (
+        f"REPORT RequestId: {request_id}\tDuration: 0.47 ms\tBilled Duration: 100 ms\t"
+        "Memory Size: 128 MB\tMax Memory Used: 20 MB\t"
+    ),
+    # the legacy parser ignores the init duration
+    "cold": (
+        f"REPORT RequestId: {request_id}\tDuration: 0.47 ms\tBilled Duration: 100 ms\t"
+        "Memory Size: 128 MB\tMax Memory Used: 20 MB\tInit Duration: 120.33 ms\t"
+    ),
+    "stdout": f"2017-04-27T20:03:27.281Z\t{request_id}\tINFO\tprocessing order 42",
+    "plain": "connection pool exhausted, waiting for a free connection",
+    "json": '{"level":"info","msg":"processing order 42"}',
+}
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f"{'message':<8} {'legacy ns':>10} {'new ns':>10} {'speedup':>8}")
+    for name, message in messages.items():
+        legacy = min(
+            timeit.repeat(
+                lambda: legacy_parse_message(message), number=number, repeat=5
+            )
+        )
+        new = min(
+            timeit.repeat(
+                lambda: lambda_logs.parse_message(message), number=number, repeat=5
+            )
+        )
+        print(
+            f"{name:<8} {legacy / number * 1e9:>10.0f} {new / number * 1e9:>10.0f} "
+            f"{legacy / new:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Compares two result files of bench_forwarder.py.
+
+    python benchmarks/compare.py before.json after.json
+"""
+
+import json
+import sys
+
+metrics = ("handler_ms", "peak_rss_bytes", "sent_bytes")
+
+
+def main():
+    with open(sys.argv[1]) as f:
+        before = json.load(f)
+    with open(sys.argv[2]) as f:
+        after = json.load(f)
+    print(f"{before['commit']} -> {after['commit']}")
+    for name, old in before["scenarios"].items():
+        new = after["scenarios"].get(name)
+        if new is None:
+            continue
+        print(name)
+        # results from before peak_rss_bytes lack it
+        rows = [(m, old.get(m), new.get(m)) for m in metrics]
+        rows += [
+            (f"{stage}_ms", old["stages_ms"][stage], new["stages_ms"].get(stage, 0))
+            for stage in old["stages_ms"]
+        ]
+        for metric, a, b in rows:
+            if a is None or b is None:
+                # not measured against an external ingest server
+                continue
+            change = (b - a) / a * 100 if a else 0.0
+            print(f"  {metric:<20} {a:>14,.1f} {b:>14,.1f} {change:>+7.1f}%")
+
+
+if __name__ == "__main__":
+    main()
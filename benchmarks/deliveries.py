@@ -0,0 +1,139 @@
+"""
+Synthetic CloudWatch Logs subscription deliveries.
+
+A delivery is the event CloudWatch Logs invokes the forwarder with: a base64
+encoded, gzip compressed JSON document holding up to 1 MB of log events.
+"""
+
+import base64
+import gzip
+import json
+import random
+import uuid
+from typing import Callable, Dict, List
+
+# CloudWatch Logs limit of a delivery: the size of the messages plus 26 bytes
+# per event
+max_delivery_bytes = 1024 * 1024
+event_overhead_bytes = 26
+# CloudWatch Logs limit of a single log event
+max_event_bytes = 256 * 1024 - event_overhead_bytes
+
+_words = (
+    "order payment user cart checkout request response cache db query retry "
+    "timeout session token inventory shipment invoice refund customer"
+).split()
+
+
+def _text(rng: random.Random, size: int) -> str:
+    words: List[str] = []
+    length = 0
+    while length < size:
+        word = rng.choice(_words)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def _json_line(rng: random.Random, request_id: str, size: int) -> str:
+    return json.dumps(
+        {
+            "level": rng.choice(("debug", "info", "info", "info", "warn", "error")),
+            "requestId": request_id,
+            "msg": _text(rng, max(size - 120, 8)),
+            "durationMs": round(rng.uniform(0.1, 900), 2),
+            "userId": rng.randint(1, 10**6),
+        },
+        separators=(",", ":"),
+    )
+
+
+def _invocation(rng: random.Random, lines: int, size: int) -> List[str]:
+    """The lines a Lambda invocation writes, framed by START, END and REPORT."""
+    request_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    out = [f"START RequestId: {request_id} Version: $LATEST"]
+    for _ in range(lines):
+        if rng.random() < 0.6:
+            out.append(_json_line(rng, request_id, size))
+        else:
+            out.append(
+                f"2024-01-01T00:00:00.000Z\t{request_id}\tINFO\t{_text(rng, size)}"
+            )
+    out.append(f"END RequestId: {request_id}")
+    report = (
+        f"REPORT RequestId: {request_id}\tDuration: {rng.uniform(1, 900):.2f} ms\t"
+        f"Billed Duration: {rng.randint(1, 900)} ms\tMemory Size: 512 MB\t"
+        f"Max Memory Used: {rng.randint(60, 500)} MB\t"
+    )
+    if rng.random() < 0.1:
+        report += f"Init Duration: {rng.uniform(100, 900):.2f} ms\t"
+    out.append(report)
+    return out
+
+
+def lambda_messages(rng: random.Random, events: int) -> List[str]:
+    """Mix of JSON logs, standard out and platform lines of Lambda functions."""
+    messages: List[str] = []
+    while len(messages) < events:
+        messages.extend(
+            _invocation(rng, rng.randint(1, 8), int(rng.lognormvariate(5, 1)) + 20)
+        )
+    return messages[:events]
+
+
+def json_messages(rng: random.Random, events: int) -> List[str]:
+    return [
+        _json_line(rng, str(uuid.UUID(int=rng.getrandbits(128))), 200)
+        for _ in range(events)
+    ]
+
+
+def text_messages(rng: random.Random, events: int) -> List[str]:
+    return [
+        _text(rng, min(int(rng.lognormvariate(7, 1.5)) + 10, max_event_bytes))
+        for _ in range(events)
+    ]
+
+
+generators: Dict[str, Callable[[random.Random, int], List[str]]] = {
+    "lambda": lambda_messages,
+    "json": json_messages,
+    "text": text_messages,
+}
+
+
+def make_delivery(
+    kind: str,
+    events: int,
+    seed: int = 0,
+    log_group: str = "/aws/lambda/checkout-service",
+) -> dict:
+    """
+    Returns a Lambda event carrying a delivery of up to events messages of
+    kind. Messages that would exceed the 1 MB delivery limit are left out.
+    """
+    rng = random.Random(seed)
+    log_events = []
+    size = 0
+    start = 1700000000000
+    for i, message in enumerate(generators[kind](rng, events)):
+        size += len(message.encode("utf-8")) + event_overhead_bytes
+        if size > max_delivery_bytes:
+            break
+        log_events.append(
+            {
+                "id": f"{start + i:020d}{i:016d}",
+                "timestamp": start + i,
+                "message": message,
+            }
+        )
+    data = {
+        "messageType": "DATA_MESSAGE",
+        "owner": "123456789012",
+        "logGroup": log_group,
+        "logStream": "2024/01/01/[$LATEST]0123456789abcdef0123456789abcdef",
+        "subscriptionFilters": [f"{log_group}-axiom"],
+        "logEvents": log_events,
+    }
+    payload = gzip.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+    return {"awslogs": {"data": base64.b64encode(payload).decode("ascii")}}
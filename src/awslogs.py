@@ -0,0 +1,191 @@
+"""
+Streaming decoder of the awslogs payload CloudWatch Logs sends to subscribed
+Lambda functions.
+
+The payload is a base64 encoded, gzip compressed JSON document:
+
+    {"messageType": "DATA_MESSAGE", "owner": "...", "logGroup": "...",
+     "logStream": "...", "subscriptionFilters": [...],
+     "logEvents": [{"id": "...", "timestamp": 1, "message": "..."}, ...]}
+
+It is decoded piece by piece, and the log events are yielded as soon as they
+are parsed, so the decompressed document is never held in memory as a whole.
+"""
+
+import binascii
+import codecs
+import json
+import zlib
+from typing import Iterator
+
+# base64 characters decoded at a time, a multiple of 4
+read_size = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_whitespace = " \t\n\r"
+# fields of the document that are needed before the log events are processed
+_header_fields = ("messageType", "owner", "logGroup", "logStream")
+
+
+class DecodeError(ValueError):
+    pass
+
+
+def iter_base64(data: str, size: int = read_size) -> Iterator[bytes]:
+    """Decodes base64 text in pieces of size characters."""
+    for start in range(0, len(data), size):
+        yield binascii.a2b_base64(data[start : start + size])
+
+
+def iter_text(data: str, size: int = read_size) -> Iterator[str]:
+    """Decodes the base64 encoded, gzip compressed UTF-8 payload in pieces."""
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    text = codecs.getincrementaldecoder("utf-8")()
+    for piece in iter_base64(data, size):
+        yield text.decode(inflater.decompress(piece))
+    yield text.decode(inflater.flush(), final=True)
+    if not inflater.eof:
+        raise DecodeError("Truncated awslogs payload")
+
+
+class _Reader:
+    """Buffer of decoded text the parser reads JSON values from."""
+
+    def __init__(self, pieces: Iterator[str]):
+        self.pieces = pieces
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        for piece in self.pieces:
+            if piece:
+                # drop what has been parsed before growing the buffer
+                self.buf = self.buf[self.pos :] + piece
+                self.pos = 0
+                return True
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        """Skips whitespace and returns the next character, "" at the end."""
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in _whitespace:
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise DecodeError(f"Expected {char!r} at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Parses the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if self._fill():
+                    continue
+                raise DecodeError(f"Invalid awslogs payload: {e}") from e
+            # numbers and literals may continue in the next piece
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+class Delivery:
+    """
+    The header fields of a delivery and an iterator over its log events.
+
+    The log events can be iterated once. Fields that follow the log events in
+    the document are only added to header once the events were iterated.
+    """
+
+    def __init__(self, data: str, size: int = read_size):
+        self._reader = _Reader(iter_text(data, size))
+        self.header: dict = {}
+        self.log_events: Iterator[dict] = iter(())
+        self._parse_header()
+
+    def get(self, key: str, default=None):
+        return self.header.get(key, default)
+
+    def _parse_header(self):
+        reader = self._reader
+        reader.expect("{")
+        if reader.peek() == "}":
+            reader.pos += 1
+            return
+        while True:
+            key = reader.value()
+            if not isinstance(key, str):
+                raise DecodeError("Expected an object key")
+            reader.expect(":")
+            if key == "logEvents":
+                if all(field in self.header for field in _header_fields):
+                    self.log_events = self._iter_events(trailing=True)
+                    return
+                # the header is incomplete, keep the events to get to the rest
+                self.log_events = iter(list(self._iter_events(trailing=False)))
+            else:
+                self.header[key] = reader.value()
+            if not self._after_value():
+                return
+
+    def _after_value(self) -> bool:
+        """Returns whether another key follows."""
+        reader = self._reader
+        char = reader.peek()
+        reader.pos += 1
+        if char == ",":
+            return True
+        if char == "}":
+            return False
+        raise DecodeError(f"Expected ',' or '}}' at offset {reader.pos - 1}")
+
+    def _iter_events(self, trailing: bool) -> Iterator[dict]:
+        reader = self._reader
+        reader.expect("[")
+        if reader.peek() == "]":
+            reader.pos += 1
+        else:
+            raw_decode = _decoder.raw_decode
+            while True:
+                # fast path, a complete event followed by a separator in the
+                # buffer; skips the whitespace that separators other than
+                # compact JSON leave before the event
+                buf, pos = reader.buf, reader.pos
+                if pos < len(buf) and buf[pos] in _whitespace:
+                    reader.peek()
+                    buf, pos = reader.buf, reader.pos
+                try:
+                    value, end = raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    end = len(buf)
+                if end < len(buf) and buf[end] in ",]":
+                    reader.pos = end + 1
+                    yield value
+                    if buf[end] == "]":
+                        break
+                    continue
+                yield reader.value()
+                char = reader.peek()
+                reader.pos += 1
+                if char == "]":
+                    break
+                if char != ",":
+                    raise DecodeError(f"Expected ',' or ']' at offset {reader.pos - 1}")
+        if trailing:
+            # fields that follow the log events
+            while self._after_value():
+                key = reader.value()
+                reader.expect(":")
+                self.header[key] = reader.value()
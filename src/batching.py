@@ -0,0 +1,163 @@
+"""In-container buffer that batches events across Forwarder invocations."""
+
+import time
+from typing import List, NamedTuple, Optional
+
+
+class Batch(NamedTuple):
+    dataset: str
+    events: list
+    size: int
+    reason: str
+    # False when the batch holds only the delivery that was just added and never
+    # went through the buffer
+    buffered: bool = True
+
+
+class _Buffer:
+    def __init__(self, started: float):
+        self.events: list = []
+        self.size = 0
+        self.started = started
+
+
+class Batcher:
+    """
+    Accumulates events per dataset and hands them back as batches once they
+    reach max_events, max_bytes or max_age_seconds.
+
+    Events of a delivery are never split across batches: when a delivery does
+    not fit in the buffer the buffer is flushed first, and a delivery that is
+    larger than the limits on its own is flushed right away. This way a failed
+    flush only ever contains events of the current delivery or of deliveries
+    that were already acknowledged, never a mix of both.
+
+    Events are only kept in the buffer while deliveries arrive at least every
+    max_age_seconds, so the next invocation is likely to come before they are
+    due. Otherwise nothing may thaw the container in time, and idle() tells
+    to flush everything before the invocation returns.
+    """
+
+    def __init__(self, max_events: int, max_bytes: int, max_age_seconds: float):
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.flushes = {"count": 0, "size": 0, "age": 0, "deadline": 0, "idle": 0}
+        self.flushed_events = 0
+        self.flushed_bytes = 0
+        self.restored = 0
+        self._buffers: dict = {}
+        self._arrivals: List[float] = []
+
+    def __len__(self) -> int:
+        return sum(len(b.events) for b in self._buffers.values())
+
+    def arrived(self, now: Optional[float] = None):
+        """Records the start of an invocation."""
+        if now is None:
+            now = time.monotonic()
+        self._arrivals = self._arrivals[-1:] + [now]
+
+    def idle(self) -> bool:
+        """
+        Whether the last two invocations were more than max_age_seconds apart,
+        or there was only one, so buffered events may not be flushed in time.
+        """
+        if len(self._arrivals) < 2:
+            return True
+        return self._arrivals[1] - self._arrivals[0] > self.max_age_seconds
+
+    def oversized(self, count: int, size: int) -> Optional[str]:
+        """Why a delivery is too large to be buffered, None if it is not."""
+        if count >= self.max_events:
+            return "count"
+        if size >= self.max_bytes:
+            return "size"
+        return None
+
+    def add(
+        self, dataset: str, events: list, size: int, now: Optional[float] = None
+    ) -> List[Batch]:
+        """
+        Adds the events of a delivery, size being their size in bytes, and
+        returns the batches that must be flushed.
+        """
+        if now is None:
+            now = time.monotonic()
+        ready = []
+        buf = self._buffers.get(dataset)
+        if buf is not None and buf.events:
+            if len(buf.events) + len(events) > self.max_events:
+                ready.append(self._take(dataset, "count"))
+            elif buf.size + size > self.max_bytes:
+                ready.append(self._take(dataset, "size"))
+
+        reason = self.oversized(len(events), size)
+        if reason is not None:
+            ready.append(self.record(Batch(dataset, events, size, reason, False)))
+            return ready
+
+        buf = self._buffers.get(dataset)
+        if buf is None:
+            buf = self._buffers[dataset] = _Buffer(now)
+        buf.events.extend(events)
+        buf.size += size
+        return ready
+
+    def full(self, dataset: str) -> bool:
+        """
+        Reports whether the buffer of dataset already reached its limits, which
+        only happens when flushing it failed and its events were restored.
+        """
+        buf = self._buffers.get(dataset)
+        if buf is None:
+            return False
+        return len(buf.events) >= self.max_events or buf.size >= self.max_bytes
+
+    def due(
+        self, remaining_ms: Optional[int] = None, margin_ms: int = 0, now=None
+    ) -> List[Batch]:
+        """
+        Returns the batches that are older than max_age_seconds, or all of them
+        when the invocation has less than margin_ms left to run.
+        """
+        if now is None:
+            now = time.monotonic()
+        if remaining_ms is not None and remaining_ms <= margin_ms:
+            return self.drain("deadline")
+        return [
+            self._take(dataset, "age")
+            for dataset, buf in list(self._buffers.items())
+            if buf.events and now - buf.started >= self.max_age_seconds
+        ]
+
+    def drain(self, reason: str) -> List[Batch]:
+        """Returns all buffered events."""
+        return [
+            self._take(dataset, reason)
+            for dataset, buf in list(self._buffers.items())
+            if buf.events
+        ]
+
+    def restore(self, batch: Batch):
+        """Puts back a batch that could not be flushed, ahead of newer events."""
+        buf = self._buffers.get(batch.dataset)
+        if buf is None:
+            buf = self._buffers[batch.dataset] = _Buffer(time.monotonic())
+        buf.events[:0] = batch.events
+        buf.size += batch.size
+        self.flushes[batch.reason] -= 1
+        self.flushed_events -= len(batch.events)
+        self.flushed_bytes -= batch.size
+        self.restored += 1
+
+    def _take(self, dataset: str, reason: str) -> Batch:
+        buf = self._buffers.pop(dataset)
+        return self.record(Batch(dataset, buf.events, buf.size, reason))
+
+    def record(self, batch: Batch) -> Batch:
+        """Counts a flushed batch."""
+        self.flushes[batch.reason] += 1
+        self.flushed_events += len(batch.events)
+        self.flushed_bytes += batch.size
+        return batch
@@ -0,0 +1,362 @@
+"""
+Checkpoints of Subscriber and Unsubscriber runs.
+
+A run over many log groups may not fit in one 300 second invocation. When
+the time runs low, the handler saves how far it got and invokes itself
+again, asynchronously, with the same event; the next invocation resumes
+from the checkpoint. A checkpoint holds the position in the listing of log
+groups, as the DescribeLogGroups query and the nextToken of the first page
+that still has unfinished log groups, and the names of the log groups
+finished from that page on.
+
+Without a store, the checkpoint is carried in the event of the next
+invocation. A store (a directory, S3 or DynamoDB) also keeps it when an
+invocation fails, so the next run with the same configuration resumes.
+"""
+
+import abc
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urlparse
+
+level = os.getenv("log_level", "INFO")
+logging.basicConfig(level=level)
+logger = logging.getLogger()
+logger.setLevel(level)
+
+store_url = os.getenv("AXIOM_CHECKPOINT_STORE", "").strip()
+# invocations a run may be continued in, after which it stops where it is;
+# CloudFormation waits an hour for the response of a custom resource, which
+# the first invocation and 10 continuations of 300 seconds each fit in
+max_continuations = int(os.getenv("AXIOM_MAX_CONTINUATIONS", "10"))
+# a run that took this long is not continued, whatever the timeout of the
+# invocations, so its last one still responds within the hour
+max_run_seconds = 50 * 60
+# checkpoints older than this are from runs that were abandoned
+max_age_seconds = 24 * 3600
+# seconds between checkpoints saved to the store while a run goes on
+save_interval_seconds = 30
+
+
+class Store(abc.ABC):
+    """Keeps checkpoints by key."""
+
+    @abc.abstractmethod
+    def load(self, key: str) -> Optional[dict]:
+        """Returns the checkpoint saved under key, None if there is none."""
+
+    @abc.abstractmethod
+    def save(self, key: str, state: dict):
+        """Saves state under key, replacing the checkpoint saved before."""
+
+    @abc.abstractmethod
+    def delete(self, key: str):
+        """Deletes the checkpoint saved under key, if there is one."""
+
+
+class FileStore(Store):
+    """Checkpoints as JSON files in a directory, for tests and local runs."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, key: str, state: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        # a checkpoint is replaced as a whole or not at all
+        tmp = self._path(key) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self._path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3Store(Store):
+    """Checkpoints as JSON objects under a prefix of an S3 bucket."""
+
+    def __init__(self, bucket: str, prefix: str = ""):
+        import boto3  # type: ignore
+
+        self.client = boto3.client("s3")
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}.json"
+
+    def load(self, key: str) -> Optional[dict]:
+        try:
+            resp = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return json.loads(resp["Body"].read())
+
+    def save(self, key: str, state: dict):
+        self.client.put_object(
+            Bucket=self.bucket, Key=self._key(key), Body=json.dumps(state).encode()
+        )
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+
+class DynamoDBStore(Store):
+    """Checkpoints as items of a DynamoDB table whose partition key is id."""
+
+    def __init__(self, table: str):
+        import boto3  # type: ignore
+
+        self.client = boto3.client("dynamodb")
+        self.table = table
+
+    def load(self, key: str) -> Optional[dict]:
+        resp = self.client.get_item(
+            TableName=self.table, Key={"id": {"S": key}}, ConsistentRead=True
+        )
+        if "Item" not in resp:
+            return None
+        return json.loads(resp["Item"]["state"]["S"])
+
+    def save(self, key: str, state: dict):
+        self.client.put_item(
+            TableName=self.table,
+            Item={"id": {"S": key}, "state": {"S": json.dumps(state)}},
+        )
+
+    def delete(self, key: str):
+        self.client.delete_item(TableName=self.table, Key={"id": {"S": key}})
+
+
+def select_store(url: str) -> Optional[Store]:
+    """
+    Returns the store of file:///path, s3://bucket/prefix or
+    dynamodb://table, None without one.
+    """
+    if url in ("", "none", "off"):
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        return FileStore(parsed.path)
+    if parsed.scheme == "s3":
+        prefix = parsed.path.lstrip("/")
+        if prefix and not prefix.endswith("/"):
+            prefix += "/"
+        return S3Store(parsed.netloc, prefix)
+    if parsed.scheme == "dynamodb":
+        return DynamoDBStore(parsed.netloc)
+    logger.warning(f"Unknown checkpoint store {url}, checkpoints are not stored")
+    return None
+
+
+store = select_store(store_url)
+
+
+def run_key(kind: str, config: dict) -> str:
+    """Key of the checkpoints of runs of kind with the same configuration."""
+    digest = hashlib.sha256(
+        json.dumps([kind, config], sort_keys=True).encode()
+    ).hexdigest()
+    return f"{kind}-{digest[:16]}"
+
+
+class _Page:
+    def __init__(self, cursor: dict):
+        self.cursor = cursor
+        self.outstanding: set = set()
+        self.finished: List[str] = []
+        # whether all log groups of the page were listed
+        self.complete = False
+
+
+class Progress:
+    """
+    Tracks which listed log groups are finished, to tell from which page the
+    listing has to be resumed and which log groups to skip then.
+
+    Log groups are listed with the cursor of their page, see
+    helpers.iter_matching_log_groups.
+    """
+
+    def __init__(self, cursor: Optional[dict] = None, done: Iterable[str] = ()):
+        self.cursor = cursor
+        # log groups finished by earlier invocations and not listed again yet
+        self.done = set(done)
+        self.listed_all = False
+        self.skipped = 0
+        self._pages: List[_Page] = []
+        self._page_of: Dict[str, _Page] = {}
+
+    def _page(self, cursor: dict) -> _Page:
+        if not self._pages or self._pages[-1].cursor != cursor:
+            if self._pages:
+                self._pages[-1].complete = True
+            self._pages.append(_Page(cursor))
+        return self._pages[-1]
+
+    def track(self, groups: Iterable[dict]) -> Iterator[dict]:
+        """Yields the listed log groups that are not finished yet."""
+        for group in groups:
+            page = self._page(group["cursor"])
+            name = group["name"]
+            if name in self.done:
+                self.done.discard(name)
+                page.finished.append(name)
+                self.skipped += 1
+                continue
+            page.outstanding.add(name)
+            self._page_of[name] = page
+            yield group
+        if self._pages:
+            self._pages[-1].complete = True
+        self.listed_all = True
+
+    @property
+    def pending(self) -> int:
+        """Log groups that were listed and are not finished."""
+        return len(self._page_of)
+
+    def finished(self, group: dict):
+        page = self._page_of.pop(group["name"], None)
+        if page is not None:
+            page.outstanding.discard(group["name"])
+            page.finished.append(group["name"])
+
+    def checkpoint(self) -> Optional[dict]:
+        """Where to resume, None once all log groups are finished."""
+        pages = self._pages
+        while pages and pages[0].complete and not pages[0].outstanding:
+            pages.pop(0)
+        if not pages:
+            if self.listed_all:
+                return None
+            return {"cursor": self.cursor, "done": sorted(self.done)}
+        done = set(self.done)
+        for page in pages:
+            done.update(page.finished)
+        return {"cursor": pages[0].cursor, "done": sorted(done)}
+
+
+def out_of_time(context, margin_ms: int) -> bool:
+    if not hasattr(context, "get_remaining_time_in_millis"):
+        return False
+    return context.get_remaining_time_in_millis() < margin_ms
+
+
+def continuation(event: dict) -> dict:
+    return event.get("continuation") or {}
+
+
+def resume(event: dict, key: str) -> Progress:
+    """The progress of the run the event continues, or of a failed run."""
+    state = continuation(event).get("checkpoint")
+    if state is None and store is not None:
+        state = store.load(key)
+        if (
+            state is not None
+            and time.time() - state.get("updated", 0) > max_age_seconds
+        ):
+            logger.info(f"Ignoring checkpoint {key} of an abandoned run")
+            state = None
+    if state is None:
+        return Progress()
+    logger.info(
+        f"Resuming from checkpoint {key}, {len(state['done'])} log groups are done"
+    )
+    return Progress(state["cursor"], state["done"])
+
+
+class Saver:
+    """Saves checkpoints to the store at most every save_interval_seconds."""
+
+    def __init__(self, key: str, progress: Progress):
+        self.key = key
+        self.progress = progress
+        self.saved_at = time.monotonic()
+
+    def save(self, force: bool = False):
+        if store is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.saved_at < save_interval_seconds:
+            return
+        self.saved_at = now
+        state = self.progress.checkpoint()
+        try:
+            if state is None:
+                store.delete(self.key)
+            else:
+                state["updated"] = time.time()
+                store.save(self.key, state)
+        except Exception as e:
+            logger.warning(f"failed to save checkpoint {self.key}, {e}")
+
+
+_lambda_client = None
+
+
+def _get_lambda_client():
+    global _lambda_client
+    if _lambda_client is None:
+        import boto3  # type: ignore
+
+        _lambda_client = boto3.client("lambda")
+    return _lambda_client
+
+
+def continue_in_background(event: dict, context, key: str, progress: Progress) -> bool:
+    """
+    Invokes the function again with the event to resume from the checkpoint,
+    returns False if the run may not be continued.
+    """
+    invocation = continuation(event).get("invocation", 0) + 1
+    if invocation > max_continuations:
+        logger.error(
+            f"run {key} was not finished in {max_continuations} continuations, "
+            "giving up"
+        )
+        return False
+    started = continuation(event).get("started", time.time())
+    if time.time() - started > max_run_seconds:
+        logger.error(
+            f"run {key} was not finished in {max_run_seconds} seconds, giving up"
+        )
+        return False
+    state = progress.checkpoint()
+    Saver(key, progress).save(force=True)
+    next_event = dict(event)
+    next_event["continuation"] = {
+        "key": key,
+        "invocation": invocation,
+        "started": started,
+        # the store holds the checkpoint if there is one
+        "checkpoint": state if store is None else None,
+    }
+    try:
+        _get_lambda_client().invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType="Event",
+            Payload=json.dumps(next_event).encode(),
+        )
+    except Exception as e:
+        logger.error(f"failed to continue run {key}, {e}")
+        return False
+    logger.info(f"continuing run {key} in invocation {invocation}")
+    return True
@@ -0,0 +1,59 @@
+"""Memory of the log event IDs a warm container has already pushed."""
+
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+
+class EventIds:
+    """
+    Time-windowed set of event IDs, oldest first.
+
+    IDs are forgotten after ttl_seconds, and the oldest ones are evicted once
+    more than max_size are remembered.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.suppressed = 0
+        self.evicted = 0
+        self._ids: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _expire(self, now: float):
+        ids = self._ids
+        cutoff = now - self.ttl_seconds
+        while ids:
+            oldest = next(iter(ids.values()))
+            if oldest > cutoff:
+                break
+            ids.popitem(last=False)
+
+    def seen(self, event_id: Optional[str], now: Optional[float] = None) -> bool:
+        """Returns whether event_id was remembered, counting it as suppressed."""
+        if event_id is None:
+            return False
+        if now is None:
+            now = time.monotonic()
+        added = self._ids.get(event_id)
+        if added is None or added <= now - self.ttl_seconds:
+            return False
+        self.suppressed += 1
+        return True
+
+    def add(self, event_ids: Iterable[Optional[str]], now: Optional[float] = None):
+        if now is None:
+            now = time.monotonic()
+        self._expire(now)
+        ids = self._ids
+        for event_id in event_ids:
+            if event_id is None:
+                continue
+            ids[event_id] = now
+            ids.move_to_end(event_id)
+        while len(ids) > self.max_size:
+            ids.popitem(last=False)
+            self.evicted += 1
@@ -0,0 +1,201 @@
+"""
+Rules that drop or sample log events before they are sent to Axiom.
+
+Rules are read from a JSON list, for example
+
+    [
+        {"type": "drop_platform", "lines": ["START", "END"]},
+        {"type": "drop_prefix", "value": "DEBUG"},
+        {"type": "drop_regex", "pattern": "GET /health"},
+        {"type": "drop_field", "field": "lambda.level", "values": ["debug"]},
+        {"type": "sample", "rate": 10}
+    ]
+
+and compiled once. An event is dropped by the first rule that matches it.
+Rules that only look at the message run before the message is parsed. Fields
+are dot-separated paths in the event as it is sent to Axiom, like the field
+routes of routing.py.
+"""
+
+import re
+import zlib
+from typing import Any, Iterable, List, Optional
+
+# START RequestId: ..., END RequestId: ... and their Lambda JSON log format
+# counterparts {"type": "platform.start", ...}
+_platform_prefixes = {
+    "START": "START RequestId:",
+    "END": "END RequestId:",
+    "REPORT": "REPORT RequestId:",
+}
+_platform_types = {
+    "START": "platform.start",
+    "END": "platform.end",
+    "REPORT": "platform.report",
+}
+
+
+class Rule:
+    """Base class of the rules, counts the events it dropped."""
+
+    # rules that look at the raw message run before it is parsed, rules that
+    # need the parsed message after
+    needs_message = False
+    needs_data = False
+
+    def __init__(self, name: str):
+        self.name = name
+        self.dropped = 0
+
+    def drops_message(self, message: str) -> bool:
+        return False
+
+    def drops_event(self, event: dict, data: Any) -> bool:
+        """event is the event as it is sent, data the parsed message."""
+        return False
+
+
+class DropPrefix(Rule):
+    needs_message = True
+
+    def __init__(self, name: str, prefixes: Iterable[str]):
+        super().__init__(name)
+        self.prefixes = tuple(prefixes)
+
+    def drops_message(self, message: str) -> bool:
+        return message.startswith(self.prefixes)
+
+
+class DropRegex(Rule):
+    needs_message = True
+
+    def __init__(self, name: str, pattern: str):
+        super().__init__(name)
+        self.pattern = re.compile(pattern)
+
+    def drops_message(self, message: str) -> bool:
+        return self.pattern.search(message) is not None
+
+
+class DropPlatform(Rule):
+    needs_message = True
+    needs_data = True
+
+    def __init__(self, name: str, lines: Iterable[str]):
+        super().__init__(name)
+        lines = [line.upper() for line in lines]
+        unknown = [line for line in lines if line not in _platform_prefixes]
+        if unknown:
+            raise ValueError(f"Unknown platform lines {unknown}")
+        self.prefixes = tuple(_platform_prefixes[line] for line in lines)
+        self.types = frozenset(_platform_types[line] for line in lines)
+
+    def drops_message(self, message: str) -> bool:
+        return message.startswith(self.prefixes)
+
+    def drops_event(self, event: dict, data: Any) -> bool:
+        return isinstance(data, dict) and data.get("type") in self.types
+
+
+class DropField(Rule):
+    needs_data = True
+
+    def __init__(self, name: str, field: str, values: list):
+        super().__init__(name)
+        self.path = field.split(".")
+        self.values = values
+
+    def drops_event(self, event: dict, data: Any) -> bool:
+        value: Any = event
+        for key in self.path:
+            if not isinstance(value, dict) or key not in value:
+                return False
+            value = value[key]
+        return value in self.values
+
+
+class Sample(Rule):
+    """
+    Keeps 1 in rate events, keyed by the request ID so that all lines of a
+    sampled invocation are kept. Events without a request ID are kept.
+    """
+
+    needs_data = True
+
+    def __init__(self, name: str, rate: int, field: str = "requestID"):
+        super().__init__(name)
+        if rate < 1:
+            raise ValueError(f"Sample rate must be at least 1, got {rate}")
+        self.rate = rate
+        self.field = field
+
+    def drops_event(self, event: dict, data: Any) -> bool:
+        if not isinstance(data, dict):
+            return False
+        key = data.get(self.field)
+        if key is None:
+            # Lambda's JSON log format
+            record = data.get("record")
+            key = record.get("requestId") if isinstance(record, dict) else None
+        if not isinstance(key, str):
+            return False
+        return zlib.crc32(key.encode("utf-8")) % self.rate != 0
+
+
+def _as_list(value) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+def _build(index: int, spec: dict) -> Rule:
+    kind = spec.get("type")
+    name = spec.get("name") or f"{kind}[{index}]"
+    if kind == "drop_prefix":
+        return DropPrefix(name, _as_list(spec["value"]))
+    if kind == "drop_regex":
+        return DropRegex(name, spec["pattern"])
+    if kind == "drop_platform":
+        return DropPlatform(name, _as_list(spec.get("lines", ["START", "END"])))
+    if kind == "drop_field":
+        return DropField(name, spec["field"], _as_list(spec["values"]))
+    if kind == "sample":
+        return Sample(name, int(spec["rate"]), spec.get("field", "requestID"))
+    raise ValueError(f"Unknown filter rule type {kind}")
+
+
+class Rules:
+    """Compiled filter rules with per-rule drop counters."""
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        self.message_rules = [r for r in rules if r.needs_message]
+        self.event_rules = [r for r in rules if r.needs_data]
+
+    @classmethod
+    def parse(cls, spec: Optional[list]) -> "Rules":
+        if not spec:
+            return cls([])
+        if not isinstance(spec, list):
+            raise ValueError("Filter rules must be a JSON list")
+        return cls([_build(i, rule) for i, rule in enumerate(spec)])
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def drops_message(self, message: str) -> bool:
+        """Evaluates the rules that only need the raw message."""
+        for rule in self.message_rules:
+            if rule.drops_message(message):
+                rule.dropped += 1
+                return True
+        return False
+
+    def drops_event(self, event: dict, data: Any) -> bool:
+        """Evaluates the rules that need the event or the parsed message."""
+        for rule in self.event_rules:
+            if rule.drops_event(event, data):
+                rule.dropped += 1
+                return True
+        return False
+
+    def dropped(self) -> dict:
+        return {rule.name: rule.dropped for rule in self.rules}
@@ -1,51 +1,100 @@
 import re
 import os
-import base64
-import gzip
+import functools
 import json
-import boto3  # type: ignore
 import logging
-import urllib.request
+import time
+from typing import Iterable, Iterator, List, Optional, Tuple
 from urllib.parse import urlparse
-from helpers import send_response, get_log_groups, cloudwatch_logs_client
+import awslogs
+import batching
+import dedup
+import filters
+import ingest
+import routing
+import jsoncodec
+import metrics
+from lambda_logs import parse_message, platform_fields
+import spool
 
 level = os.getenv("log_level", "INFO")
 logging.basicConfig(level=level)
 logger = logging.getLogger()
 logger.setLevel(level)
 
-# Standard out from Lambdas.
-std_matcher = re.compile(r"\d\d\d\d-\d\d-\d\d\S+\s+(?P<requestID>\S+)")
+# push events to axiom
+axiom_url = os.getenv("AXIOM_URL", "https://api.axiom.co").strip("/")
+axiom_token = os.getenv("AXIOM_TOKEN")
+axiom_dataset = os.getenv("AXIOM_DATASET")
+data_tags_string = os.getenv("DATA_TAGS")
+data_service_name = os.getenv("DATA_MESSAGE_KEY")
+# json sends a single JSON array per request, ndjson streams one event per line
+ingest_format = os.getenv("AXIOM_INGEST_FORMAT", "json").strip().lower()
+# time kept in reserve at the end of an invocation, retries of ingest requests
+# are not attempted past it
+retry_deadline_margin_ms = int(os.getenv("AXIOM_RETRY_DEADLINE_MARGIN_MS", "1000"))
+
+# Batching of events across invocations of a warm container (opt-in).
+# Buffered events are acknowledged to CloudWatch before they reach Axiom and
+# are lost if the container is shut down before they are flushed.
+batch_enabled = os.getenv("AXIOM_BATCH_ENABLED", "false").strip().lower() == "true"
+batch_max_events = int(os.getenv("AXIOM_BATCH_MAX_EVENTS", "10000"))
+batch_max_bytes = int(os.getenv("AXIOM_BATCH_MAX_BYTES", str(4 * 1024 * 1024)))
+batch_max_age_seconds = float(os.getenv("AXIOM_BATCH_MAX_AGE_SECONDS", "10"))
+# flush everything when the invocation has less than this left to run
+batch_flush_margin_ms = int(os.getenv("AXIOM_BATCH_FLUSH_MARGIN_MS", "1000"))
+batcher = (
+    batching.Batcher(batch_max_events, batch_max_bytes, batch_max_age_seconds)
+    if batch_enabled
+    else None
+)
 
-# END RequestId: b3be449c-8bd7-11e7-bb30-4f271af95c46
-end_matcher = re.compile(r"END RequestId:\s+(?P<requestID>\S+)")
+# Spooling of events that could not be ingested to local disk (opt-in). The
+# spool lives in the container's /tmp and is drained by later invocations of
+# the same warm container; it is lost when the container is shut down.
+spool_enabled = os.getenv("AXIOM_SPOOL_ENABLED", "false").strip().lower() == "true"
+spool_dir = os.getenv("AXIOM_SPOOL_DIR", "/tmp/axiom-spool")
+spool_max_bytes = int(os.getenv("AXIOM_SPOOL_MAX_BYTES", str(256 * 1024 * 1024)))
+# segments sent per invocation before new events
+spool_drain_max_segments = int(os.getenv("AXIOM_SPOOL_DRAIN_MAX_SEGMENTS", "10"))
+event_spool = spool.Spool(spool_dir, spool_max_bytes) if spool_enabled else None
+
+# Rules that drop or sample events before they are sent, see filters.py
+filter_rules = filters.Rules.parse(
+    jsoncodec.loads(os.getenv("AXIOM_FILTER_RULES") or "[]")
+)
 
-# START RequestId: b3be449c-8bd7-11e7-bb30-4f271af95c46
-# Version: $LATEST
-start_matcher = re.compile(
-    r"START RequestId:\s+(?P<requestID>\S+)\s+" "Version: (?P<version>\S+)"
+# Routing of events to datasets other than AXIOM_DATASET, see routing.py
+router = routing.Router.parse(
+    jsoncodec.loads(os.getenv("AXIOM_ROUTES") or "[]"), axiom_dataset
 )
 
-# REPORT RequestId: b3be449c-8bd7-11e7-bb30-4f271af95c46
-# Duration: 0.47 ms
-# Billed Duration: 100 ms
-# Memory Size: 128 MB
-# Max Memory Used: 20 MB
-report_matcher = re.compile(
-    "REPORT RequestId:\s+(?P<requestID>\S+)\s+"
-    "Duration: (?P<durationMS>\S+) ms\s+"
-    "Billed Duration: (?P<billedDurationMS>\S+) ms\s+"
-    "Memory Size: (?P<memorySizeMB>\S+) MB\s+"
-    "Max Memory Used: (?P<maxMemoryMB>\S+) MB"
+# Log groups named /aws/<prefix>/<name> get <prefix> as their service name
+service_prefixes = [
+    prefix.strip()
+    for prefix in os.getenv(
+        "AXIOM_SERVICE_PREFIXES", "lambda,apigateway,eks,rds"
+    ).split(",")
+    if prefix.strip()
+]
+log_group_matcher = re.compile(
+    "^/aws/(" + "|".join(re.escape(prefix) for prefix in service_prefixes) + ")/(.*)"
+    if service_prefixes
+    else r"(?!)"
 )
+# log streams whose aws fields are kept by a warm container
+aws_fields_cache_size = int(os.getenv("AXIOM_AWS_FIELDS_CACHE_SIZE", "1024"))
 
+# The aws fields are shared by all events of a delivery and serialized once
+# per delivery. orjson encodes them faster than the event can be copied.
+shared_event_key = None if jsoncodec.backend == "orjson" else "aws"
 
-# push events to axiom
-axiom_url = os.getenv("AXIOM_URL", "https://api.axiom.co").strip("/")
-axiom_token = os.getenv("AXIOM_TOKEN")
-axiom_dataset = os.getenv("AXIOM_DATASET")
-data_tags_string = os.getenv("DATA_TAGS")
-data_service_name = os.getenv("DATA_MESSAGE_KEY")
+# Skipping of events a warm container has already pushed (opt-in), e.g. when
+# Lambda retries a delivery that failed after some of its requests succeeded
+dedup_enabled = os.getenv("AXIOM_DEDUP_ENABLED", "false").strip().lower() == "true"
+dedup_max_ids = int(os.getenv("AXIOM_DEDUP_MAX_IDS", "100000"))
+dedup_ttl_seconds = float(os.getenv("AXIOM_DEDUP_TTL_SECONDS", "3600"))
+event_ids = dedup.EventIds(dedup_max_ids, dedup_ttl_seconds) if dedup_enabled else None
 
 # Edge-based ingestion configuration
 # Priority: AXIOM_EDGE_URL > AXIOM_EDGE > AXIOM_URL (legacy)
@@ -95,72 +144,216 @@ if data_tags_string != "" and data_tags_string is not None:
 # try to get json from message
 def structured_message(message: str):
     try:
-        return json.loads(message)
+        return jsoncodec.loads(message)
     except Exception:
         return None
 
 
-def push_events_to_axiom(events: list):
-    if len(events) == 0:
-        return
+def push_events_to_axiom(
+    events: Iterable[dict],
+    dataset: Optional[str] = None,
+    deadline: Optional[float] = None,
+) -> ingest.PushResult:
+    """
+    Pushes events to Axiom.
+
+    Events are serialized one at a time and split into requests that respect
+    the ingest request size limits. Up to AXIOM_MAX_IN_FLIGHT requests are
+    sent at the same time, and a failing request is retried on its own without
+    re-sending the others. Transient failures are retried with backoff until
+    deadline, a time.monotonic() timestamp.
+    """
+    if dataset is None:
+        dataset = axiom_dataset
+    return push_datasets([(dataset, events)], deadline)
 
-    url = get_ingest_url(axiom_dataset)
-    data = json.dumps(events)
-    req = urllib.request.Request(
-        url,
-        data=bytes(data, "utf-8"),
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {axiom_token}",
-            "User-Agent": "axiom-cloudwatch-forwarder/v1.1.0",
-        },
+
+def push_datasets(
+    groups: List[Tuple[str, Iterable[dict]]], deadline: Optional[float] = None
+) -> ingest.PushResult:
+    """
+    Pushes the events of several datasets like push_events_to_axiom. The
+    requests of all datasets share the AXIOM_MAX_IN_FLIGHT slots, offsets in
+    the result count events across the groups, in order.
+    """
+    return _send_chunks(_iter_group_chunks(groups), deadline)
+
+
+def push_encoded(
+    groups: List[Tuple[str, List[bytes]]], deadline: Optional[float] = None
+) -> ingest.PushResult:
+    """Pushes events already serialized by ingest.iter_encoded like push_datasets."""
+    return _send_chunks(_iter_group_chunks(groups, encoded=True), deadline)
+
+
+def _send_chunks(
+    chunks: Iterable[ingest.Chunk], deadline: Optional[float]
+) -> ingest.PushResult:
+    result = ingest.send_chunks(chunks, functools.partial(_push_chunk, deadline))
+    if result.failed:
+        if event_spool is None:
+            raise ingest.IngestError(result)
+        # keep the events on disk, a later invocation sends them once Axiom
+        # accepts requests again
+        for chunk, _ in result.failed:
+            event_spool.append(chunk.dataset, chunk.items)
+        logger.warning(
+            f"Spooled {sum(len(c.items) for c, _ in result.failed)} events to disk: "
+            f"{ingest.IngestError(result)}"
+        )
+    if result.requests > 0:
+        _log_pushed(result)
+    recorder = metrics.active
+    if recorder is not None:
+        recorder.add("EventsOut", result.events)
+        recorder.add("Requests", result.requests)
+        recorder.add("RawBytes", result.raw_bytes)
+        recorder.add("SentBytes", result.sent_bytes)
+    return result
+
+
+def _iter_group_chunks(
+    groups: List[Tuple[str, Iterable]], encoded: bool = False
+) -> Iterator[ingest.Chunk]:
+    offset = 0
+    for dataset, events in groups:
+        items = events if encoded else _encode(events)
+        for chunk in ingest.iter_chunks(items, dataset=dataset, offset=offset):
+            offset = chunk.offset + len(chunk.items)
+            yield chunk
+
+
+def _encode(events: Iterable[dict]) -> Iterator[bytes]:
+    return metrics.timed(
+        ingest.iter_encoded(events, shared_key=shared_event_key), "SerializeTime"
     )
 
-    result = urllib.request.urlopen(req)
-    if result.status != 200:
-        raise Exception(f"Unexpected status {result.status}")
+
+def _push_items(
+    items: Iterable[bytes], dataset: str, deadline: Optional[float]
+) -> ingest.PushResult:
+    chunks = ingest.iter_chunks(items, dataset=dataset)
+    return ingest.send_chunks(chunks, functools.partial(_push_chunk, deadline))
+
+
+def drain_spool(deadline: Optional[float]):
+    """
+    Sends the events spooled by earlier invocations, oldest first, and stops
+    at the first segment that still cannot be ingested.
+    """
+    if event_spool is None:
+        return
+    for path in event_spool.segments()[:spool_drain_max_segments]:
+        if deadline is not None and time.monotonic() >= deadline:
+            return
+        try:
+            dataset, items = event_spool.read(path)
+        except Exception as e:
+            logger.error(f"Dropping unreadable spool segment {path}: {e}")
+            event_spool.remove(path)
+            continue
+        result = _push_items(items, dataset, deadline)
+        if result.failed:
+            # keep what failed in the segment, ahead of newer ones, the
+            # endpoint is still not accepting events
+            failed = sorted(result.failed, key=lambda f: f[0].offset)
+            items = [item for chunk, _ in failed for item in chunk.items]
+            event_spool.rewrite(path, dataset, items, result.events)
+            logger.warning(f"Draining the spool failed: {ingest.IngestError(result)}")
+            return
+        event_spool.remove(path, result.events)
+        logger.info(f"Drained {result.events} spooled events to {dataset}")
+
+
+def _push_chunk(deadline: Optional[float], chunk: ingest.Chunk) -> int:
+    """Sends one chunk of serialized events, returns the number of bytes sent."""
+    url = get_ingest_url(chunk.dataset)
+    recorder = metrics.active
+    sent = {"bytes": 0}
+    if ingest_format == "ndjson":
+        content_type = "application/x-ndjson"
+        encoding = ingest.content_encoding
+        # small chunks are sent uncompressed, like small JSON array bodies
+        if chunk.size < ingest.compression_min_bytes:
+            encoding = None
+
+        # serialized events are compressed while the request is being written
+        def body():
+            sent["bytes"] = 0
+            for piece in ingest.iter_buffered(
+                ingest.iter_compressed(ingest.iter_ndjson(chunk.items), encoding)
+            ):
+                sent["bytes"] += len(piece)
+                yield piece
+
+        request_body: ingest.Body = body
     else:
-        logger.info(f"Successfully pushed {len(events)} events to axiom")
+        content_type = "application/json"
+        started = time.perf_counter()
+        request_body, encoding = ingest.compress(ingest.json_array(chunk.items))
+        if recorder is not None:
+            recorder.add_time("CompressTime", started)
+        sent["bytes"] = len(request_body)
+
+    headers = _ingest_headers(content_type, encoding)
+    # the connection pool keeps the TLS connection to the ingest host open
+    # across invocations of a warm container
+    started = time.perf_counter()
+    ingest.post_with_retry(url, request_body, headers, deadline)
+    if recorder is not None:
+        # ndjson bodies are compressed while they are sent, in HttpTime
+        recorder.add_time("HttpTime", started)
+    return sent["bytes"]
+
+
+def _ingest_headers(content_type: str, encoding: Optional[str]) -> dict:
+    headers = {
+        "Content-Type": content_type,
+        "Authorization": f"Bearer {axiom_token}",
+        "User-Agent": "axiom-cloudwatch-forwarder/v1.1.0",
+    }
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return headers
+
+
+def _log_pushed(result: ingest.PushResult):
+    stats = ingest.connection_stats()
+    logger.info(
+        f"Successfully pushed {result.events} events to axiom in "
+        f"{result.requests} requests ({result.raw_bytes} bytes raw, "
+        f"{result.sent_bytes} bytes sent {ingest.content_encoding or 'uncompressed'}, "
+        f"ratio {result.raw_bytes / max(result.sent_bytes, 1):.1f}; "
+        f"connections: reused={stats['reused']} new={stats['new']} stale={stats['stale']})"
+    )
+    if filter_rules:
+        dropped = " ".join(f"{k}={v}" for k, v in filter_rules.dropped().items())
+        logger.info(f"Events dropped by filter rules since cold start: {dropped}")
 
 
-def data_from_event(event: dict) -> dict:
+def delivery_from_event(event: dict) -> Optional[awslogs.Delivery]:
+    """
+    Starts decoding the awslogs payload of event. Its log events are decoded
+    while they are iterated, so the first requests to Axiom are sent while the
+    rest of the payload is still being decoded.
+    """
     if "awslogs" not in event or "data" not in event["awslogs"]:
         logger.warning(f"Unexpected event format: {json.dumps(event)}")
-        return {}
-
-    body = base64.b64decode(event["awslogs"]["data"])
-    data = gzip.decompress(body)
-    return json.loads(data)
-
-
-def parse_message(message):
-    m = None
-
-    # Determine which matcher to use depending on the message type.
-    if message.startswith("REPORT"):
-        m = report_matcher.match(message)
-        if m is not None:
-            m = m.groupdict()
-            # convert from string to number
-            m["durationMS"] = float(m["durationMS"])
-            m["billedDurationMS"] = int(m["billedDurationMS"])
-            m["memorySizeMB"] = int(m["memorySizeMB"])
-            m["maxMemoryMB"] = int(m["maxMemoryMB"])
-        return m
-    elif message.startswith("END"):
-        m = end_matcher.match(message)
-    elif message.startswith("START"):
-        m = start_matcher.match(message)
-    else:
-        m = std_matcher.match(message)
+        return None
 
-    return {} if m is None else m.groupdict()
+    recorder = metrics.active
+    if recorder is None:
+        return awslogs.Delivery(event["awslogs"]["data"])
+    started = time.perf_counter()
+    delivery = awslogs.Delivery(event["awslogs"]["data"])
+    recorder.add_time("DecodeTime", started)
+    recorder.add("PayloadBytes", len(event["awslogs"]["data"]))
+    return delivery
 
 
 def split_log_group(log_group: str):
     # this is an extra field, we can extend this without a problem
-    pattern_obj = re.compile("^/aws/(lambda|apigateway|eks|rds)/(.*)")
-    parsed = pattern_obj.match(log_group)
+    parsed = log_group_matcher.match(log_group)
     if parsed is None:
         return {
             "serviceName": (
@@ -180,49 +373,32 @@ def split_log_group(log_group: str):
     }
 
 
-def lambda_handler(event: dict, context=None):
-    # handle Cloudformation deletion of the stack
-    if "RequestType" in event and event["RequestType"] == "Delete":
-        # remove all related subscription filters, unforutunately deleting the lambda will
-        # not clear the subscription filters
-        # We can do so by looping over log groups and deleting the subscription filters
-        # 1. get lambda arn
-        fn_name = os.environ.get("AWS_LAMBDA_FUNCTION_NAME")
-        lambda_client = boto3.client("lambda")
-        response = lambda_client.get_function_configuration(FunctionName=fn_name)
-        # 2. get log groups
-        log_groups = get_log_groups()
-        for group in log_groups:
-            # 3. get subscription filters
-            filters = cloudwatch_logs_client.describe_subscription_filters(
-                logGroupName=group["logGroupName"]
-            )
-            for filter in filters["subscriptionFilters"]:
-                # 4. check if filter is related to the lambda
-                if filter["destinationArn"] == response["FunctionArn"]:
-                    # 5. delete subscription filter
-                    cloudwatch_logs_client.delete_subscription_filter(
-                        logGroupName=group["logGroupName"],
-                        filterName=filter["filterName"],
-                    )
-        send_response(event, context, "SUCCESS", {})
-        return
+def _as_tuple(value) -> Optional[tuple]:
+    return tuple(value) if isinstance(value, list) else value
 
-    if axiom_token is None:
-        raise Exception("AXIOM_TOKEN is not set")
-    if axiom_dataset is None:
-        raise Exception("AXIOM_DATASET is not set")
 
-    data = data_from_event(event)
-    if not data:
-        return
+@functools.lru_cache(maxsize=aws_fields_cache_size)
+def get_aws_fields(
+    owner: Optional[str],
+    log_group: Optional[str],
+    log_stream: Optional[str],
+    message_type: Optional[str],
+    subscription_filters: Optional[tuple],
+) -> dict:
+    """
+    Returns the aws object shared by all events of a log stream's deliveries.
 
+    The result is cached and shared between invocations, it must not be
+    modified.
+    """
     aws_fields = {
-        "owner": data.get("owner"),
-        "logGroup": data.get("logGroup"),
-        "logStream": data.get("logStream"),
-        "messageType": data.get("messageType"),
-        "subscriptionFilters": data.get("subscriptionFilters"),
+        "owner": owner,
+        "logGroup": log_group,
+        "logStream": log_stream,
+        "messageType": message_type,
+        "subscriptionFilters": (
+            list(subscription_filters) if subscription_filters is not None else None
+        ),
         "serviceName": "unknown",
         "logGroupName": "",
     }
@@ -231,14 +407,25 @@ def lambda_handler(event: dict, context=None):
         aws_fields.update({"tags": data_tags})
 
     # parse the loggroup to get the service and function
-    if aws_fields["logGroup"] is not None:
+    if log_group is not None:
         # add the service and function to the fields
-        extra = split_log_group(aws_fields["logGroup"])
+        extra = split_log_group(log_group)
         aws_fields.update(extra)
 
-    events = []
-    for log_event in data["logEvents"]:
+    return aws_fields
+
+
+def transform_events(
+    log_events: Iterable[dict], aws_fields: dict, ids: Optional[list] = None
+) -> Iterator[dict]:
+    """
+    Builds the events sent to Axiom from CloudWatch log events. The IDs of the
+    log events that are not dropped are appended to ids, in order.
+    """
+    for log_event in log_events:
         message = log_event["message"]
+        if filter_rules and filter_rules.drops_message(message):
+            continue
         ev = {
             "_time": log_event["timestamp"] * 1000,
             "aws": aws_fields,
@@ -253,6 +440,13 @@ def lambda_handler(event: dict, context=None):
             if json_data is not None:
                 # Data is parsed to JSON, so use it
                 lambda_data = json_data
+                # platform lines in Lambda's JSON log format get the same
+                # fields as their text counterparts
+                extra = (
+                    platform_fields(json_data) if isinstance(json_data, dict) else None
+                )
+                if extra:
+                    lambda_data = {**extra, **json_data}
 
         # Message is not JSON or parsing failed.
         if json_data is None:
@@ -265,10 +459,282 @@ def lambda_handler(event: dict, context=None):
             if service_name is not None:
                 ev.update({service_name: lambda_data})
 
-        events.append(ev)
+        if filter_rules.event_rules and filter_rules.drops_event(ev, lambda_data):
+            continue
+
+        if ids is not None:
+            ids.append(log_event.get("id"))
+        yield ev
+
+
+class EventsView:
+    """
+    View of the transformed log events of a delivery.
+
+    Events are built lazily while they are iterated, so streaming them to Axiom
+    never holds more than one transformed event in memory. The view can be
+    iterated again if log_events can.
+    """
+
+    def __init__(
+        self, log_events: Iterable[dict], aws_fields: dict, track_ids: bool = False
+    ):
+        self.log_events = log_events
+        self.aws_fields = aws_fields
+        # IDs of the events of the last iteration, by position
+        self.ids: Optional[list] = [] if track_ids else None
+
+    def __iter__(self) -> Iterator[dict]:
+        if self.ids is not None:
+            self.ids = []
+        return metrics.timed(
+            transform_events(self.log_events, self.aws_fields, self.ids), "ParseTime"
+        )
+
+
+def _route_events(
+    events: EventsView, field_routes: tuple, dataset: str
+) -> Tuple[list, Optional[list]]:
+    """
+    Splits the events of a delivery by the dataset of the first field route
+    they match. Returns the (dataset, events) groups and the IDs of the events
+    in the order of the groups.
+    """
+    groups: dict = {}
+    ids: dict = {}
+    for i, ev in enumerate(events):
+        target = router.route_event(ev, field_routes, dataset)
+        groups.setdefault(target, []).append(ev)
+        if events.ids is not None:
+            ids.setdefault(target, []).append(events.ids[i])
+    if events.ids is None:
+        return list(groups.items()), None
+    return list(groups.items()), [i for target in groups for i in ids[target]]
+
+
+def _log_suppressed(before: int):
+    if event_ids.suppressed > before:
+        logger.info(
+            f"Skipped {event_ids.suppressed - before} events that were already "
+            f"pushed ({event_ids.suppressed} since cold start)"
+        )
+
+
+def _remaining_ms(context) -> Optional[int]:
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return None
+    return context.get_remaining_time_in_millis()
+
+
+def _deadline(context) -> Optional[float]:
+    remaining_ms = _remaining_ms(context)
+    if remaining_ms is None:
+        return None
+    return time.monotonic() + (remaining_ms - retry_deadline_margin_ms) / 1000
+
+
+def _flush_batches(batches: list, deadline: Optional[float]):
+    for batch in batches:
+        try:
+            push_encoded([(batch.dataset, batch.events)], deadline)
+        except Exception as e:
+            logger.error(f"Error pushing events to axiom: {e}")
+            if not batch.buffered:
+                # the events of the current delivery, let CloudWatch retry them
+                raise e
+            batcher.restore(batch)
+            continue
+        logger.info(
+            f"Flushed batch of {len(batch.events)} events ({batch.size} bytes) "
+            f"to {batch.dataset}, reason={batch.reason}; "
+            f"flushes: {batcher.flushes}, {len(batcher)} events buffered"
+        )
+
+
+def _batch_groups(groups: list, routed_ids: Optional[list], events, context):
+    """
+    Buffers the groups of a delivery, or pushes them right away when they are
+    too large for the buffer, and flushes what is due before returning.
+    """
+    batcher.arrived()
+    for dataset, _ in groups:
+        if batcher.full(dataset):
+            # the buffer could not be flushed earlier, push back on
+            # CloudWatch instead of growing it without bounds
+            raise Exception("Batch buffer is full, Axiom ingest is failing")
+    # events are serialized once, so the byte limits apply to what is sent
+    pushed_ids = routed_ids if routed_ids is not None else events.ids
+    batches = []
+    for dataset, group in groups:
+        items = list(_encode(group))
+        size = sum(len(item) for item in items)
+        reason = batcher.oversized(len(items), size) or ""
+        batches.append(batching.Batch(dataset, items, size, reason, not reason))
+
+    # the groups that do not fit are pushed before anything is buffered, so
+    # a failed push leaves the buffer as it was and the retry of the delivery
+    # does not send buffered events twice
+    direct = [b for b in batches if not b.buffered]
+    if direct:
+        try:
+            push_encoded([(b.dataset, b.events) for b in direct], _deadline(context))
+        except ingest.IngestError as e:
+            if pushed_ids is not None:
+                direct_ids = _group_ids(batches, pushed_ids, buffered=False)
+                for offset, count in e.result.succeeded:
+                    event_ids.add(direct_ids[offset : offset + count])
+            logger.error(f"Error pushing events to axiom: {e}")
+            raise e
+        for batch in direct:
+            batcher.record(batch)
+
+    for batch in batches:
+        if batch.buffered:
+            _flush_batches(
+                batcher.add(batch.dataset, batch.events, batch.size),
+                _deadline(context),
+            )
+    if pushed_ids is not None:
+        # the events are either pushed or buffered
+        event_ids.add(pushed_ids)
+
+    if batcher.idle():
+        # no invocation may follow in time to flush the buffer, and Lambda
+        # may freeze the container for good once this one returns
+        _flush_batches(batcher.drain("idle"), _deadline(context))
+    else:
+        _flush_batches(
+            batcher.due(_remaining_ms(context), batch_flush_margin_ms),
+            _deadline(context),
+        )
+
+
+def _group_ids(batches: list, ids: list, buffered: bool) -> list:
+    """The IDs of the events of the batches that are buffered or not."""
+    selected = []
+    offset = 0
+    for batch in batches:
+        if batch.buffered == buffered:
+            selected.extend(ids[offset : offset + len(batch.events)])
+        offset += len(batch.events)
+    return selected
+
+
+def delete_subscription_filters(event: dict, context=None):
+    """
+    Removes the subscription filters that send to this Lambda when its
+    CloudFormation stack is deleted.
+
+    boto3 and helpers are imported here rather than at module load, so they do
+    not add to the cold start of invocations that forward logs.
+    """
+    import boto3  # type: ignore
+    from helpers import send_response, iter_log_groups, get_cloudwatch_logs_client
+
+    cloudwatch_logs_client = get_cloudwatch_logs_client()
+    # remove all related subscription filters, unforutunately deleting the lambda will
+    # not clear the subscription filters
+    # We can do so by looping over log groups and deleting the subscription filters
+    # 1. get lambda arn
+    fn_name = os.environ.get("AWS_LAMBDA_FUNCTION_NAME")
+    lambda_client = boto3.client("lambda")
+    response = lambda_client.get_function_configuration(FunctionName=fn_name)
+    # 2. get log groups
+    for group in iter_log_groups():
+        # 3. get subscription filters
+        subscription_filters = cloudwatch_logs_client.describe_subscription_filters(
+            logGroupName=group["logGroupName"]
+        )
+        for filter in subscription_filters["subscriptionFilters"]:
+            # 4. check if filter is related to the lambda
+            if filter["destinationArn"] == response["FunctionArn"]:
+                # 5. delete subscription filter
+                cloudwatch_logs_client.delete_subscription_filter(
+                    logGroupName=group["logGroupName"],
+                    filterName=filter["filterName"],
+                )
+    send_response(event, context, "SUCCESS", {})
+
+
+def lambda_handler(event: dict, context=None):
+    # handle Cloudformation deletion of the stack
+    if "RequestType" in event and event["RequestType"] == "Delete":
+        delete_subscription_filters(event, context)
+        return
+
+    recorder = metrics.begin()
+    retries = ingest.retry_stats["retries"]
+    try:
+        forward_logs(event, context)
+    finally:
+        if recorder is not None:
+            recorder.add("Retries", ingest.retry_stats["retries"] - retries)
+        metrics.end()
+
+
+def forward_logs(event: dict, context=None):
+    """Sends the log events of a CloudWatch Logs delivery to Axiom."""
+    if axiom_token is None:
+        raise Exception("AXIOM_TOKEN is not set")
+    if axiom_dataset is None:
+        raise Exception("AXIOM_DATASET is not set")
+
+    # send what earlier invocations could not ingest before new events
+    drain_spool(_deadline(context))
+
+    if batcher is not None:
+        # flush what previous invocations left in the buffer for too long
+        _flush_batches(batcher.due(), _deadline(context))
+
+    data = delivery_from_event(event)
+    if data is None:
+        return
+
+    aws_fields = get_aws_fields(
+        data.get("owner"),
+        data.get("logGroup"),
+        data.get("logStream"),
+        data.get("messageType"),
+        _as_tuple(data.get("subscriptionFilters")),
+    )
+
+    log_events = metrics.timed(data.log_events, "DecodeTime", count="EventsIn")
+    suppressed = 0
+    if event_ids is not None:
+        suppressed = event_ids.suppressed
+        log_events = (
+            log_event
+            for log_event in log_events
+            if not event_ids.seen(log_event.get("id"))
+        )
+
+    events = EventsView(log_events, aws_fields, track_ids=event_ids is not None)
+    field_routes, dataset = router.resolve(data.get("logGroup"))
+    routed_ids = None
+    if field_routes:
+        groups, routed_ids = _route_events(events, field_routes, dataset)
+    else:
+        groups = [(dataset, events)]
+
+    if batcher is not None:
+        _batch_groups(groups, routed_ids, events, context)
+        if event_ids is not None:
+            _log_suppressed(suppressed)
+        return
 
     try:
-        push_events_to_axiom(events)
+        push_datasets(groups, deadline=_deadline(context))
+    except ingest.IngestError as e:
+        if event_ids is not None:
+            # a retry of the delivery only needs to send what failed
+            pushed_ids = routed_ids if routed_ids is not None else events.ids
+            for offset, count in e.result.succeeded:
+                event_ids.add(pushed_ids[offset : offset + count])
+        logger.error(f"Error pushing events to axiom: {e}")
+        raise e
     except Exception as e:
         logger.error(f"Error pushing events to axiom: {e}")
         raise e
+    if event_ids is not None:
+        event_ids.add(routed_ids if routed_ids is not None else events.ids)
+        _log_suppressed(suppressed)
@@ -1,21 +1,46 @@
 import os
 import json
 import logging
-import boto3  # type: ignore
-import re
 import http.client
-from typing import Optional
+from typing import Iterator, List, Optional, Tuple
 from urllib.parse import urlparse
 
+from loggroups import LogGroupMatcher
 
+
+# page size of DescribeLogGroups, 50 is the most the API returns
 log_groups_return_limit = 50
+# up to this many log group names are looked up one by one instead of
+# listing all log groups
+log_group_names_lookup_max = 20
 
 level = os.getenv("log_level", "INFO")
 logging.basicConfig(level=level)
 logger = logging.getLogger()
 logger.setLevel(level)
 
-cloudwatch_logs_client = boto3.client("logs")
+_cloudwatch_logs_client = None
+
+
+def get_cloudwatch_logs_client():
+    """
+    Returns the CloudWatch Logs client, created on first use. boto3 is only
+    imported then, so modules that import helpers do not pay for it at cold
+    start.
+    """
+    global _cloudwatch_logs_client
+    if _cloudwatch_logs_client is None:
+        import boto3  # type: ignore
+
+        _cloudwatch_logs_client = boto3.client("logs")
+    return _cloudwatch_logs_client
+
+
+def __getattr__(name: str):
+    # cloudwatch_logs_client used to be created when helpers was imported
+    if name == "cloudwatch_logs_client":
+        return get_cloudwatch_logs_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def send_response(event, context, response_status, response_data):
@@ -71,22 +96,43 @@ def _send_cloudformation_response(event, context, response_status, response_data
     conn.close()
 
 
-def get_log_groups(nextToken=None):
+def iter_log_group_pages(
+    prefix: Optional[str] = None, nextToken: Optional[str] = None
+) -> Iterator[Tuple[Optional[str], List[dict]]]:
+    """
+    Yields the pages of log groups whose name starts with prefix, or all of
+    them, with the nextToken each page was requested with.
+    """
     # check docs:
     # 1. boto3 https://boto3.amazonaws.com/v1/documentation/api/1.9.42/reference/services/logs.html#CloudWatchLogs.Client.describe_log_groups
     # 2. AWS API https://docs.aws.amazon.com/AmazonCloudWatchLogs/latest/APIReference/API_DescribeLogGroups.html#API_DescribeLogGroups_RequestSyntax
-    resp = cloudwatch_logs_client.describe_log_groups(limit=log_groups_return_limit)
-    all_groups = resp["logGroups"]
-    nextToken = resp["nextToken"] if "nextToken" in resp else None
-    # continue fetching log groups until nextToken is None
-    while nextToken is not None:
-        resp = cloudwatch_logs_client.describe_log_groups(
-            limit=log_groups_return_limit, nextToken=nextToken
-        )
-        all_groups.extend(resp["logGroups"])
-        nextToken = resp["nextToken"] if "nextToken" in resp else None
+    kwargs: dict = {"limit": log_groups_return_limit}
+    if prefix:
+        kwargs["logGroupNamePrefix"] = prefix
+    while True:
+        if nextToken is not None:
+            kwargs["nextToken"] = nextToken
+        resp = get_cloudwatch_logs_client().describe_log_groups(**kwargs)
+        yield nextToken, resp["logGroups"]
+        nextToken = resp.get("nextToken")
+        # continue fetching log groups until nextToken is None
+        if nextToken is None:
+            return
+
+
+def iter_log_groups(
+    prefix: Optional[str] = None, nextToken: Optional[str] = None
+) -> Iterator[dict]:
+    """
+    Yields the log groups whose name starts with prefix, or all of them, page
+    by page as DescribeLogGroups returns them.
+    """
+    for _, groups in iter_log_group_pages(prefix, nextToken):
+        yield from groups
+
 
-    return all_groups
+def get_log_groups(nextToken=None):
+    return list(iter_log_groups(nextToken=nextToken))
 
 
 def build_groups_list(
@@ -94,38 +140,70 @@ def build_groups_list(
     names: Optional[list] = None,
     pattern: Optional[str] = None,
     prefix: Optional[str] = None,
+    match_all: bool = True,
 ):
-    # ensure filter params have correct values
-    if not names:
-        names = None
-    if not pattern:
-        pattern = None
-    if not prefix:
-        prefix = None
     # filter out the log groups based on the names, pattern, and prefix provided in the environment variables
+    matcher = LogGroupMatcher.from_config(names, pattern, prefix, match_all)
     groups = []
     for g in all_groups:
         group = {"name": g["logGroupName"].strip(), "arn": g["arn"]}
-        if names is None and pattern is None and prefix is None:
-            groups.append(group)
-            continue
-        elif names is not None and group["name"] in names:
-            groups.append(group)
-            continue
-        elif prefix is not None and group["name"].startswith(prefix):
-            groups.append(group)
-            continue
-        elif pattern is not None and re.match(pattern, group["name"]):
+        if matcher.matches(group["name"]):
             groups.append(group)
 
     return groups
 
 
+def iter_matching_log_groups(
+    matcher: LogGroupMatcher, start: Optional[dict] = None
+) -> Iterator[dict]:
+    """
+    Yields {"name", "arn", "cursor"} of the log groups matcher selects, while
+    they are listed. cursor is where the page of the log group starts, and
+    the listing can be started from a cursor with start.
+
+    Filters are pushed down to DescribeLogGroups where possible: prefixes and
+    the literal start of patterns are sent as logGroupNamePrefix, and a few
+    names are looked up one by one. Only a pattern without a literal start,
+    or a long list of names, requires listing all log groups.
+    """
+    queries = matcher.list_prefixes(log_group_names_lookup_max)
+    if queries is None:
+        # one pass over all log groups
+        queries = [""]
+    first = start["query"] if start else 0
+    # the prefixes do not overlap, a log group is listed at most once
+    for index in range(first, len(queries)):
+        token = start["token"] if start and index == first else None
+        for page_token, page in iter_log_group_pages(queries[index] or None, token):
+            cursor = {"query": index, "token": page_token}
+            for g in page:
+                name = g["logGroupName"].strip()
+                if matcher.matches(name):
+                    yield {"name": name, "arn": g["arn"], "cursor": cursor}
+
+
+def subscription_filter_name(log_group_name: str) -> str:
+    return "%s-axiom" % log_group_name
+
+
+def describe_subscription_filters(log_group_name: str) -> List[dict]:
+    """Returns the subscription filters of the log group."""
+    kwargs: dict = {"logGroupName": log_group_name}
+    filters: List[dict] = []
+    while True:
+        resp = get_cloudwatch_logs_client().describe_subscription_filters(**kwargs)
+        filters.extend(resp.get("subscriptionFilters", []))
+        if resp.get("nextToken") is None:
+            return filters
+        kwargs["nextToken"] = resp["nextToken"]
+
+
 def delete_subscription_filter(log_group_name: str):
     logger.info(f"Deleting subscription filter for {log_group_name}...")
 
-    cloudwatch_logs_client.delete_subscription_filter(
-        logGroupName=log_group_name, filterName="%s-axiom" % log_group_name
+    get_cloudwatch_logs_client().delete_subscription_filter(
+        logGroupName=log_group_name,
+        filterName=subscription_filter_name(log_group_name),
     )
 
     logger.info(f"{log_group_name} subscription filter has been deleted successfully.")
@@ -135,9 +213,9 @@ def create_subscription_filter(log_group_arn: str, lambda_arn: str):
     log_group_name = log_group_arn.split(":")[-2]
     logger.info(f"Creating subscription filter for {log_group_name}")
 
-    filter_name = "%s-axiom" % log_group_name
+    filter_name = subscription_filter_name(log_group_name)
 
-    cloudwatch_logs_client.put_subscription_filter(
+    get_cloudwatch_logs_client().put_subscription_filter(
         logGroupName=log_group_name,
         filterName=filter_name,
         filterPattern="",
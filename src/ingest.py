@@ -0,0 +1,636 @@
+"""HTTP transport used by the Forwarder to push events to Axiom."""
+
+import os
+import gzip
+import random
+import zlib
+import select
+import http.client
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import jsoncodec
+
+try:
+    import zstandard  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+level = os.getenv("log_level", "INFO")
+logging.basicConfig(level=level)
+logger = logging.getLogger()
+logger.setLevel(level)
+
+# seconds to wait for the ingest endpoint to accept a connection or answer
+http_timeout = float(os.getenv("AXIOM_HTTP_TIMEOUT", "30"))
+# idle keep-alive connections older than this are closed instead of reused,
+# load balancers usually drop idle connections after 60 seconds
+keepalive_idle_seconds = float(os.getenv("AXIOM_KEEPALIVE_IDLE_SECONDS", "50"))
+# maximum number of idle connections kept per ingest host
+pool_max_size = int(os.getenv("AXIOM_POOL_MAX_SIZE", "8"))
+
+# Content-Encoding of ingest requests: gzip, zstd or none
+compression = os.getenv("AXIOM_COMPRESSION", "gzip").strip().lower()
+# compression level, defaults to gzip level 1 and zstd level 3, which favour
+# speed over ratio
+compression_level = os.getenv("AXIOM_COMPRESSION_LEVEL", "")
+# bodies smaller than this are sent uncompressed, compressing them costs more
+# CPU than the bandwidth it saves
+compression_min_bytes = int(os.getenv("AXIOM_COMPRESSION_MIN_BYTES", "1024"))
+# streamed bodies are written to the socket in pieces of about this size
+stream_buffer_bytes = int(os.getenv("AXIOM_STREAM_BUFFER_BYTES", "65536"))
+# batches are split into requests of at most this many serialized bytes and
+# events, so a large delivery never exceeds the ingest request size limit
+max_request_bytes = int(os.getenv("AXIOM_MAX_REQUEST_BYTES", str(5 * 1024 * 1024)))
+max_request_events = int(os.getenv("AXIOM_MAX_REQUEST_EVENTS", "10000"))
+# maximum number of ingest requests sent at the same time, 1 sends the requests
+# of a batch one after the other in order
+max_in_flight = int(os.getenv("AXIOM_MAX_IN_FLIGHT", "4"))
+
+# transient ingest failures are retried with exponential backoff and full
+# jitter: the n-th retry waits a random delay of up to base * 2^n, capped at
+# max, or what the server asked for in Retry-After
+request_retries = int(os.getenv("AXIOM_REQUEST_RETRIES", "3"))
+retry_base_delay = float(os.getenv("AXIOM_RETRY_BASE_DELAY_MS", "100")) / 1000
+retry_max_delay = float(os.getenv("AXIOM_RETRY_MAX_DELAY_MS", "5000")) / 1000
+retryable_statuses = frozenset((408, 425, 429, 500, 502, 503, 504))
+
+# errors raised by http.client when the server closed a kept-alive connection
+# before (or while) we reused it
+_stale_errors = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    http.client.CannotSendRequest,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+
+def _resolve_compression(name: str, level: str) -> Tuple[Optional[str], int]:
+    if name in ("", "none", "identity"):
+        return None, 0
+    if name == "zstd":
+        if zstandard is not None:
+            return "zstd", int(level) if level else 3
+        logger.warning(
+            "AXIOM_COMPRESSION=zstd but zstandard is not installed, using gzip"
+        )
+        name = "gzip"
+    if name != "gzip":
+        logger.warning(f"Unknown AXIOM_COMPRESSION {name}, using gzip")
+    return "gzip", int(level) if level else 1
+
+
+content_encoding, _compression_level = _resolve_compression(
+    compression, compression_level
+)
+
+
+def compress(
+    data: bytes,
+    encoding: Optional[str] = content_encoding,
+    level: int = _compression_level,
+    min_bytes: int = compression_min_bytes,
+) -> Tuple[bytes, Optional[str]]:
+    """
+    Compresses an ingest body.
+
+    Returns the body to send and its Content-Encoding, None when the body was
+    left uncompressed.
+    """
+    if encoding is None or len(data) < min_bytes:
+        return data, None
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data), "zstd"
+    # mtime=0 keeps the output deterministic
+    return gzip.compress(data, compresslevel=level, mtime=0), "gzip"
+
+
+def iter_encoded(
+    events: Iterable[dict], shared_key: Optional[str] = None
+) -> Iterator[bytes]:
+    """
+    Serializes events one at a time.
+
+    Events usually reference the same object under shared_key, for example the
+    aws fields of a delivery. It is serialized once per object and its bytes
+    are written at the start of every event that references it.
+    """
+    dumps = jsoncodec.dumps
+    if shared_key is None:
+        for ev in events:
+            yield dumps(ev)
+        return
+
+    prefix = b"{" + dumps(shared_key) + b":"
+    shared = None
+    shared_bytes = b""
+    for ev in events:
+        value = ev.get(shared_key)
+        if not isinstance(value, dict):
+            yield dumps(ev)
+            continue
+        if value is not shared:
+            shared = value
+            shared_bytes = prefix + dumps(value)
+        rest = dict(ev)
+        del rest[shared_key]
+        encoded = dumps(rest)
+        if len(encoded) == 2:
+            yield shared_bytes + b"}"
+        else:
+            yield shared_bytes + b"," + encoded[1:]
+
+
+def iter_ndjson(items: Iterable[bytes]) -> Iterator[bytes]:
+    """Writes serialized events as newline delimited JSON."""
+    for item in items:
+        yield item + b"\n"
+
+
+def json_array(items: list) -> bytes:
+    """Writes serialized events as a JSON array."""
+    return b"[" + b",".join(items) + b"]"
+
+
+class Chunk(NamedTuple):
+    # position of the first event of the chunk in the batch
+    offset: int
+    # serialized events
+    items: list
+    # sum of the sizes of the serialized events
+    size: int
+    # dataset the events are sent to
+    dataset: Optional[str] = None
+
+
+def iter_chunks(
+    items: Iterable[bytes],
+    max_bytes: int = max_request_bytes,
+    max_events: int = max_request_events,
+    dataset: Optional[str] = None,
+    offset: int = 0,
+) -> Iterator[Chunk]:
+    """
+    Splits a stream of serialized events into chunks of at most max_events
+    events and max_bytes bytes. An event larger than max_bytes is sent alone.
+    Offsets of the chunks start at offset.
+    """
+    chunk: list = []
+    size = 0
+    for item in items:
+        if chunk and (len(chunk) >= max_events or size + len(item) > max_bytes):
+            yield Chunk(offset, chunk, size, dataset)
+            offset += len(chunk)
+            chunk, size = [], 0
+        chunk.append(item)
+        size += len(item) + 1
+    if chunk:
+        yield Chunk(offset, chunk, size, dataset)
+
+
+def iter_compressed(
+    chunks: Iterable[bytes],
+    encoding: Optional[str] = content_encoding,
+    level: int = _compression_level,
+) -> Iterator[bytes]:
+    """Compresses a stream of chunks without holding the whole body in memory."""
+    if encoding is None:
+        yield from chunks
+        return
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    else:
+        # wbits=31 writes a gzip header and trailer
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def iter_buffered(
+    chunks: Iterable[bytes], size: int = stream_buffer_bytes
+) -> Iterator[bytes]:
+    """Coalesces small chunks so each write to the socket carries enough data."""
+    buf = bytearray()
+    for chunk in chunks:
+        buf += chunk
+        if len(buf) >= size:
+            yield bytes(buf)
+            buf.clear()
+    if buf:
+        yield bytes(buf)
+
+
+# a request body is either bytes or a function returning the body as a stream
+# of chunks, the function is called again when the request must be re-sent
+Body = Union[bytes, Callable[[], Iterable[bytes]]]
+
+
+class Response(NamedTuple):
+    status: int
+    reason: str
+    headers: dict
+    body: bytes
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP/1.1 connections to a single ingest host.
+
+    The pool lives at module level so warm Lambda containers reuse the same
+    TCP/TLS connections across invocations.
+    """
+
+    def __init__(
+        self,
+        scheme: str,
+        host: str,
+        port: Optional[int] = None,
+        timeout: float = http_timeout,
+        max_size: int = pool_max_size,
+        idle_seconds: float = keepalive_idle_seconds,
+    ):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.stats = {"new": 0, "reused": 0, "stale": 0}
+        self._idle: list = []
+        self._lock = threading.Lock()
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            conn: http.client.HTTPConnection = http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+        else:
+            conn = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+        with self._lock:
+            self.stats["new"] += 1
+        return conn
+
+    def _get(self):
+        """Returns an idle connection if a healthy one is available, or a new one."""
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, released_at = self._idle.pop()
+            if now - released_at < self.idle_seconds and not _is_stale(conn):
+                with self._lock:
+                    self.stats["reused"] += 1
+                return conn, True
+            with self._lock:
+                self.stats["stale"] += 1
+            conn.close()
+        return self._new_connection(), False
+
+    def _put(self, conn: http.client.HTTPConnection):
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: Body,
+        headers: dict,
+        timeout: Optional[float] = None,
+    ) -> Response:
+        if timeout is None:
+            timeout = self.timeout
+        conn, reused = self._get()
+        try:
+            response = _send(conn, method, path, body, headers, timeout)
+        except _stale_errors:
+            conn.close()
+            if not reused:
+                raise
+            # the server closed the connection between our health check and the
+            # request, reconnect once transparently
+            with self._lock:
+                self.stats["stale"] += 1
+            conn = self._new_connection()
+            try:
+                response = _send(conn, method, path, body, headers, timeout)
+            except Exception:
+                conn.close()
+                raise
+        except Exception:
+            conn.close()
+            raise
+
+        if response.headers.get("connection", "").lower() == "close":
+            conn.close()
+        else:
+            self._put(conn)
+        return response
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+
+def _is_stale(conn: http.client.HTTPConnection) -> bool:
+    # an idle keep-alive socket must not be readable: readable means the
+    # server sent a FIN (or unexpected data) while we were not looking
+    sock = conn.sock
+    if sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+def _send(
+    conn: http.client.HTTPConnection,
+    method: str,
+    path: str,
+    body: Body,
+    headers: dict,
+    timeout: float,
+) -> Response:
+    # new connections connect with conn.timeout, kept-alive ones already have
+    # a socket
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+    if callable(body):
+        # streamed bodies are sent with Transfer-Encoding: chunked
+        conn.request(method, path, body=body(), headers=headers, encode_chunked=True)
+    else:
+        conn.request(method, path, body=body, headers=headers)
+    resp = conn.getresponse()
+    # read the whole body so the connection can be reused for the next request
+    data = resp.read()
+    return Response(
+        status=resp.status,
+        reason=resp.reason,
+        headers={k.lower(): v for k, v in resp.getheaders()},
+        body=data,
+    )
+
+
+_pools: dict = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(url: str) -> ConnectionPool:
+    """Returns the connection pool for the host of the given URL."""
+    parsed = urlparse(url)
+    key = (parsed.scheme, parsed.hostname, parsed.port)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(parsed.scheme, parsed.hostname, parsed.port)
+                _pools[key] = pool
+    return pool
+
+
+def request_path(url: str) -> str:
+    parsed = urlparse(url)
+    path = parsed.path or "/"
+    if parsed.query:
+        path += "?" + parsed.query
+    return path
+
+
+def post(
+    url: str, body: Body, headers: dict, timeout: Optional[float] = None
+) -> Response:
+    """
+    Sends a POST request to url over a pooled keep-alive connection. timeout
+    defaults to AXIOM_HTTP_TIMEOUT.
+    """
+    return get_pool(url).request("POST", request_path(url), body, headers, timeout)
+
+
+class StatusError(Exception):
+    """Raised when the ingest endpoint answers with a non-2xx status."""
+
+    def __init__(self, response: Response):
+        super().__init__(
+            f"Unexpected status {response.status}: "
+            f"{response.body[:512].decode('utf-8', 'replace')}"
+        )
+        self.response = response
+
+
+# retry counters over the lifetime of the container
+retry_stats = {"retries": 0, "exhausted": 0}
+_retry_stats_lock = threading.Lock()
+
+
+def post_with_retry(
+    url: str,
+    body: Body,
+    headers: dict,
+    deadline: Optional[float] = None,
+    retries: int = request_retries,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Response:
+    """
+    Sends a POST request, retrying 408, 425, 429 and 5xx answers, connection
+    errors and timeouts.
+
+    deadline is a time.monotonic() timestamp, no retry is attempted if waiting
+    for it would cross the deadline and no attempt waits for an answer past
+    it. Raises StatusError for non-retryable
+    answers and the last error once retries are exhausted.
+    """
+    attempt = 0
+    while True:
+        delay = None
+        try:
+            response = post(url, body, headers, _attempt_timeout(deadline))
+            if 200 <= response.status < 300:
+                return response
+            error: Exception = StatusError(response)
+            if response.status not in retryable_statuses:
+                raise error
+            delay = _retry_after(response)
+        except (OSError, http.client.HTTPException) as e:
+            error = e
+
+        backoff = random.uniform(0, min(retry_max_delay, retry_base_delay * 2**attempt))
+        delay = backoff if delay is None else delay
+        if attempt >= retries or (
+            deadline is not None and time.monotonic() + delay >= deadline
+        ):
+            with _retry_stats_lock:
+                retry_stats["exhausted"] += 1
+            raise error
+
+        attempt += 1
+        with _retry_stats_lock:
+            retry_stats["retries"] += 1
+        logger.warning(
+            f"Retrying ingest request in {delay:.2f}s ({attempt}/{retries}): {error}"
+        )
+        sleep(delay)
+
+
+def _attempt_timeout(deadline: Optional[float]) -> float:
+    """Returns http_timeout, shortened to the time left before the deadline."""
+    if deadline is None:
+        return http_timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("Ingest deadline passed")
+    return min(http_timeout, remaining)
+
+
+def _retry_after(response: Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def connection_stats() -> dict:
+    """Returns the new/reused/stale connection counters summed over all pools."""
+    totals = {"new": 0, "reused": 0, "stale": 0}
+    for pool in list(_pools.values()):
+        for k, v in pool.stats.items():
+            totals[k] += v
+    return totals
+
+
+class PushResult:
+    """Outcome of sending the chunks of a batch."""
+
+    def __init__(self):
+        self.events = 0
+        self.requests = 0
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+        # (offset, count) of the chunks that were ingested
+        self.succeeded: list = []
+        # (chunk, error) of the chunks that could not be ingested
+        self.failed: list = []
+
+    def add(self, chunk: Chunk, sent: int = 0, error: Optional[Exception] = None):
+        if error is not None:
+            self.failed.append((chunk, error))
+            return
+        self.events += len(chunk.items)
+        self.requests += 1
+        self.raw_bytes += chunk.size
+        self.sent_bytes += sent
+        self.succeeded.append((chunk.offset, len(chunk.items)))
+
+
+class IngestError(Exception):
+    """Raised when some chunks of a batch could not be ingested."""
+
+    def __init__(self, result: PushResult):
+        chunk, error = result.failed[0]
+        failed_events = sum(len(c.items) for c, _ in result.failed)
+        super().__init__(
+            f"{len(result.failed)} ingest requests ({failed_events} events) failed, "
+            f"first error: {error}"
+        )
+        self.result = result
+
+
+# executors by number of workers, kept across invocations of a warm container
+_executors: Dict[int, ThreadPoolExecutor] = {}
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers: int) -> ThreadPoolExecutor:
+    executor = _executors.get(workers)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(workers)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="axiom-ingest"
+                )
+                _executors[workers] = executor
+    return executor
+
+
+def send_chunks(
+    chunks: Iterable[Chunk],
+    send: Callable[[Chunk], int],
+    max_in_flight: int = max_in_flight,
+) -> PushResult:
+    """
+    Sends chunks with send, which returns the number of bytes it sent, keeping
+    at most max_in_flight requests in flight.
+
+    Chunks are pulled from the iterable only when a slot is free, so at most
+    max_in_flight + 1 chunks are held in memory. Every chunk is attempted even
+    if an earlier one failed; failures are reported in the result.
+    """
+    result = PushResult()
+    if max_in_flight <= 1:
+        for chunk in chunks:
+            try:
+                result.add(chunk, send(chunk))
+            except Exception as e:
+                result.add(chunk, error=e)
+        return result
+
+    executor = _get_executor(max_in_flight)
+    in_flight: deque = deque()
+    try:
+        for chunk in chunks:
+            if len(in_flight) >= max_in_flight:
+                _collect(in_flight.popleft(), result)
+            in_flight.append((chunk, executor.submit(send, chunk)))
+    finally:
+        # when producing a chunk fails, the requests in flight still finish
+        # before the error is raised
+        while in_flight:
+            _collect(in_flight.popleft(), result)
+    return result
+
+
+def _collect(entry: Tuple[Chunk, Future], result: PushResult):
+    chunk, future = entry
+    try:
+        result.add(chunk, future.result())
+    except Exception as e:
+        result.add(chunk, error=e)
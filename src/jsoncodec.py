@@ -0,0 +1,152 @@
+"""
+JSON decoding and encoding for the Forwarder's hot path.
+
+orjson or ujson are used when they can be imported (for example from a Lambda
+layer), the standard library otherwise. All backends produce compact UTF-8
+JSON and agree on the edge cases that matter for ingest:
+
+- NaN and Infinity are decoded and encoded as null, so the other fields of
+  a message survive and a request body is always valid JSON.
+- Values a fast backend cannot handle (integers beyond 64 bits, strings with
+  lone surrogates, ...) are handed to the standard library.
+
+Known differences that do not change the decoded value: orjson writes floats
+in exponent form without a plus sign (1e16 instead of 1e+16), ujson escapes
+U+2028 and U+2029.
+"""
+
+import json
+import logging
+import math
+import os
+from typing import Any, Union
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import ujson  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    ujson = None
+
+level = os.getenv("log_level", "INFO")
+logging.basicConfig(level=level)
+logger = logging.getLogger()
+logger.setLevel(level)
+
+# auto picks orjson, then ujson, then the standard library
+backend_name = os.getenv("AXIOM_JSON_BACKEND", "auto").strip().lower()
+
+_separators = (",", ":")
+# orjson decodes integers beyond 64 bits as floats. Such an integer is a run
+# of 20 digits, or 19 after a minus sign, found with a substring search once
+# digits and minus signs are mapped to 0 and other bytes to a space, which is
+# several times faster than a regex search for the run
+_digit_runs = bytes(48 if 48 <= i <= 57 or i == 45 else 32 for i in range(256))
+
+
+def _may_have_long_integer(data: Union[str, bytes]) -> bool:
+    if isinstance(data, str):
+        data = data.encode("utf-8", "surrogatepass")
+    return b"0" * 20 in data.translate(_digit_runs)
+
+
+def _null_constant(name: str) -> None:
+    return None
+
+
+def _finite(obj: Any) -> Any:
+    """Replaces NaN and Infinity with None."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    return obj
+
+
+# json.loads and json.dumps build a new decoder or encoder on every call
+# that passes options, so they are built once
+_decode = json.JSONDecoder(parse_constant=_null_constant).decode
+_encode = json.JSONEncoder(
+    ensure_ascii=False, separators=_separators, allow_nan=False
+).encode
+_encode_ascii = json.JSONEncoder(separators=_separators, allow_nan=False).encode
+
+
+def stdlib_loads(data: Union[str, bytes]) -> Any:
+    if not isinstance(data, str):
+        data = data.decode(json.detect_encoding(data), "surrogatepass")
+    return _decode(data)
+
+
+def stdlib_dumps(obj: Any) -> bytes:
+    try:
+        return _encode(obj).encode("utf-8")
+    except UnicodeEncodeError:
+        # lone surrogates cannot be written as UTF-8, escape them instead
+        return _encode_ascii(_finite(obj)).encode("ascii")
+    except ValueError:
+        return stdlib_dumps(_finite(obj))
+
+
+def orjson_loads(data: Union[str, bytes]) -> Any:
+    if _may_have_long_integer(data):
+        return stdlib_loads(data)
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # orjson is stricter than the standard library on a few inputs, e.g.
+        # escaped lone surrogates, NaN and Infinity
+        return stdlib_loads(data)
+
+
+def orjson_dumps(obj: Any) -> bytes:
+    try:
+        return orjson.dumps(obj)
+    except TypeError:
+        return stdlib_dumps(obj)
+
+
+def ujson_loads(data: Union[str, bytes]) -> Any:
+    value = ujson.loads(data)
+    # ujson decodes NaN and Infinity as floats, let the standard library map
+    # them to None
+    if isinstance(data, str):
+        suspicious = "NaN" in data or "Infinity" in data
+    else:
+        suspicious = b"NaN" in data or b"Infinity" in data
+    if suspicious:
+        return stdlib_loads(data)
+    return value
+
+
+def ujson_dumps(obj: Any) -> bytes:
+    try:
+        return ujson.dumps(
+            obj, ensure_ascii=False, escape_forward_slashes=False, allow_nan=False
+        ).encode("utf-8")
+    except (OverflowError, TypeError, ValueError):
+        return stdlib_dumps(obj)
+
+
+def _select(name: str) -> str:
+    if name in ("auto", "orjson") and orjson is not None:
+        return "orjson"
+    if name in ("auto", "ujson") and ujson is not None:
+        return "ujson"
+    if name not in ("auto", "json"):
+        logger.warning(f"JSON backend {name} is not available, using json")
+    return "json"
+
+
+backends = {
+    "json": (stdlib_loads, stdlib_dumps),
+    "orjson": (orjson_loads, orjson_dumps),
+    "ujson": (ujson_loads, ujson_dumps),
+}
+backend = _select(backend_name)
+loads, dumps = backends[backend]
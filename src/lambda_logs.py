@@ -0,0 +1,159 @@
+"""Parsing of the platform lines AWS Lambda writes to its log groups."""
+
+import re
+from typing import Optional
+
+# Standard out from Lambdas.
+# 2017-04-27T20:03:27.281Z	b3be449c-8bd7-11e7-bb30-4f271af95c46	INFO	message
+std_matcher = re.compile(r"\d\d\d\d-\d\d-\d\d\S+\s+(?P<requestID>\S+)")
+
+# END RequestId: b3be449c-8bd7-11e7-bb30-4f271af95c46
+end_matcher = re.compile(r"END RequestId:\s+(?P<requestID>\S+)")
+
+# START RequestId: b3be449c-8bd7-11e7-bb30-4f271af95c46 Version: $LATEST
+start_matcher = re.compile(
+    r"START RequestId:\s+(?P<requestID>\S+)\s+" r"Version: (?P<version>\S+)"
+)
+
+# REPORT RequestId: b3be449c-8bd7-11e7-bb30-4f271af95c46
+# Duration: 0.47 ms
+# Billed Duration: 100 ms
+# Memory Size: 128 MB
+# Max Memory Used: 20 MB
+#
+# followed by the optional fields of cold starts, SnapStart restores, failed
+# invocations and traced invocations, in this order:
+#
+# Init Duration: 120.33 ms
+# Restore Duration: 210.12 ms Billed Restore Duration: 95 ms
+# Status: timeout Error Type: Runtime.ExitError
+# XRAY TraceId: 1-5d9f6a1b-3c1d8a6f9b2c7e4d5f6a7b8c
+# SegmentId: 4b2c1a0f9e8d7c6b
+# Sampled: true
+report_matcher = re.compile(
+    r"REPORT RequestId:\s+(?P<requestID>\S+)\s+"
+    r"Duration: (?P<durationMS>\S+) ms\s+"
+    r"Billed Duration: (?P<billedDurationMS>\S+) ms\s+"
+    r"Memory Size: (?P<memorySizeMB>\S+) MB\s+"
+    r"Max Memory Used: (?P<maxMemoryMB>\S+) MB"
+    r"(?:\s+Init Duration: (?P<initDurationMS>\S+) ms)?"
+    # the other optional fields are only tried when one of them follows
+    r"(?:\s+(?=[RSEX])"
+    r"(?:Restore Duration: (?P<restoreDurationMS>\S+) ms\s+"
+    r"Billed Restore Duration: (?P<billedRestoreDurationMS>\S+) ms\s*)?"
+    r"(?:Status: (?P<status>\S+)\s*)?"
+    r"(?:Error Type: (?P<errorType>\S+)\s*)?"
+    r"(?:XRAY TraceId: (?P<xrayTraceId>\S+)\s+"
+    r"SegmentId: (?P<xraySegmentId>\S+)\s+"
+    r"Sampled: (?P<xraySampled>\S+))?"
+    r")?"
+)
+# groups of the mandatory fields, the optional ones follow
+_report_mandatory = 5
+
+
+def _to_bool(value: str) -> bool:
+    return value == "true"
+
+
+# optional REPORT fields and their converters, in the order of their groups
+report_fields = (
+    ("initDurationMS", float),
+    ("restoreDurationMS", float),
+    ("billedRestoreDurationMS", int),
+    ("status", str),
+    ("errorType", str),
+    ("xrayTraceId", str),
+    ("xraySegmentId", str),
+    ("xraySampled", _to_bool),
+)
+
+
+def parse_report(message: str) -> Optional[dict]:
+    m = report_matcher.match(message)
+    if m is None:
+        return None
+    groups = m.groups()
+    try:
+        fields = {
+            "requestID": groups[0],
+            "durationMS": float(groups[1]),
+            "billedDurationMS": int(groups[2]),
+            "memorySizeMB": int(groups[3]),
+            "maxMemoryMB": int(groups[4]),
+        }
+    except ValueError:
+        return None
+    # groups after lastindex did not match
+    for i in range(_report_mandatory, m.lastindex):
+        value = groups[i]
+        if value is not None:
+            name, convert = report_fields[i - _report_mandatory]
+            try:
+                fields[name] = convert(value)
+            except ValueError:
+                pass
+    return fields
+
+
+def parse_message(message: str) -> Optional[dict]:
+    """
+    Extracts the fields of a Lambda platform or standard out line.
+
+    Returns None for a REPORT line that misses one of its mandatory fields and
+    an empty dict for lines that are not recognized.
+    """
+    if message.startswith("REPORT"):
+        return parse_report(message)
+    if message.startswith("END"):
+        m = end_matcher.match(message)
+    elif message.startswith("START"):
+        m = start_matcher.match(message)
+    else:
+        m = std_matcher.match(message)
+    return {} if m is None else m.groupdict()
+
+
+# metrics of platform.report records written in Lambda's JSON log format
+_json_metrics = {
+    "durationMs": "durationMS",
+    "billedDurationMs": "billedDurationMS",
+    "memorySizeMB": "memorySizeMB",
+    "maxMemoryUsedMB": "maxMemoryMB",
+    "initDurationMs": "initDurationMS",
+    "restoreDurationMs": "restoreDurationMS",
+}
+
+
+def platform_fields(data: dict) -> Optional[dict]:
+    """
+    Returns the fields parse_message extracts from a text platform line for a
+    platform event written in Lambda's JSON log format, None for other JSON.
+
+    {"time": "...", "type": "platform.report", "record": {"requestId": "...",
+    "metrics": {"durationMs": 0.47, ...}, "tracing": {"value": "Root=..."}}}
+    """
+    event_type = data.get("type")
+    record = data.get("record")
+    if (
+        not isinstance(event_type, str)
+        or not event_type.startswith("platform.")
+        or not isinstance(record, dict)
+    ):
+        return None
+    fields = {}
+    if "requestId" in record:
+        fields["requestID"] = record["requestId"]
+    if "version" in record:
+        fields["version"] = record["version"]
+    if "status" in record:
+        fields["status"] = record["status"]
+    metrics = record.get("metrics")
+    if isinstance(metrics, dict):
+        for key, name in _json_metrics.items():
+            if key in metrics:
+                fields[name] = metrics[key]
+    tracing = record.get("tracing")
+    if isinstance(tracing, dict) and "value" in tracing:
+        fields["xrayTraceId"] = tracing["value"]
+    return fields
@@ -2,12 +2,16 @@
 import os
 import logging
 from helpers import create_subscription_filter
+from loggroups import LogGroupMatcher
 
 # Set environment variables.
 axiom_cloudwatch_forwarder_lambda_arn = os.getenv(
     "AXIOM_CLOUDWATCH_FORWARDER_LAMBDA_ARN"
 )
 log_group_prefix = os.getenv("LOG_GROUP_PREFIX", "")
+# without a prefix every new log group is subscribed, several prefixes are
+# separated by commas
+log_group_matcher = LogGroupMatcher.from_config(prefix=log_group_prefix)
 
 # set logger
 level = os.getenv("log_level", "INFO")
@@ -41,7 +45,7 @@ def lambda_handler(event, context):
 
     # Check whether the prefix is set - the prefix is used to determine which logs we want.
     # or whether the log group's name starts with the set prefix.
-    if not log_group_prefix or log_group_name.startswith(log_group_prefix):
+    if log_group_matcher.matches(log_group_name):
         create_subscription_filter(log_group_arn, axiom_cloudwatch_forwarder_lambda_arn)
 
     else:
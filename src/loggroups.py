@@ -0,0 +1,214 @@
+"""
+Selection of log groups by name.
+
+The Subscriber, Unsubscriber and Listener select log groups by exact names,
+name prefixes and regular expressions; a log group is selected if it matches
+any of them. LogGroupMatcher compiles them once: names go into a set,
+prefixes into a trie that is compiled to a regular expression and patterns
+are compiled, so checking a name hardly depends on how many names and
+prefixes are configured.
+"""
+
+import operator
+import re
+from typing import Callable, Iterable, List, Optional
+
+# characters log group names, and so logGroupNamePrefix, are made of
+name_chars = re.compile(r"[\.\-_/#A-Za-z0-9]*")
+
+_regex_special = set(".^$*+?{}[]()|\\")
+# marks the end of a prefix in the trie
+_end = ""
+# up to this many prefixes str.startswith is faster than the trie
+_startswith_max = 32
+
+
+def literal_prefix(pattern: str) -> str:
+    """
+    Returns the text every name matched by pattern with re.match starts with,
+    "" if it cannot be told.
+    """
+    if "|" in pattern:
+        return ""
+    prefix: List[str] = []
+    # re.match is anchored already
+    i = 1 if pattern.startswith("^") else 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            # escaped punctuation, e.g. \.
+            prefix.append(pattern[i + 1])
+            i += 2
+            continue
+        if char in _regex_special:
+            if char in "*?{" and prefix:
+                # the previous character is optional or repeated
+                prefix.pop()
+            break
+        prefix.append(char)
+        i += 1
+    return name_chars.match("".join(prefix)).group()
+
+
+def _trie_pattern(node: dict) -> str:
+    if _end in node:
+        # longer prefixes are covered by this one
+        return ""
+    branches = [
+        re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items())
+    ]
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
+
+
+class PrefixTrie:
+    """
+    Set of prefixes that finds whether a name starts with any of them.
+
+    Many prefixes are matched as a regular expression with a branch per
+    character where prefixes diverge, e.g. /aws/(?:lambda/|rds/) for
+    /aws/lambda/ and /aws/rds/, which looks at each character of the name
+    once however many prefixes there are.
+    """
+
+    def __init__(self, prefixes: Iterable[str] = ()):
+        self.root: dict = {}
+        self._match: Optional[Callable[[str], object]] = None
+        for prefix in prefixes:
+            self.add(prefix)
+
+    def add(self, prefix: str):
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[_end] = True
+        self._match = None
+
+    def __bool__(self) -> bool:
+        return bool(self.root)
+
+    def compile(self) -> Callable[[str], object]:
+        """Returns a function whose result is truthy if a name matches."""
+        if self._match is None:
+            prefixes = self.shortest()
+            if len(prefixes) <= _startswith_max:
+                self._match = operator.methodcaller("startswith", tuple(prefixes))
+            else:
+                self._match = re.compile(_trie_pattern(self.root)).match
+        return self._match
+
+    def match(self, name: str) -> bool:
+        return bool(self.compile()(name))
+
+    def shortest(self) -> List[str]:
+        """The prefixes that are not covered by a shorter one."""
+        found = []
+        stack = [("", self.root)]
+        while stack:
+            prefix, node = stack.pop()
+            if _end in node:
+                found.append(prefix)
+                continue
+            stack.extend((prefix + char, child) for char, child in node.items())
+        return sorted(found)
+
+
+class LogGroupMatcher:
+    """
+    Matches log group names against names, prefixes and patterns. Without
+    any of them, every name matches if match_all is set and none otherwise.
+    """
+
+    def __init__(
+        self,
+        names: Iterable[str] = (),
+        prefixes: Iterable[str] = (),
+        patterns: Iterable[str] = (),
+        match_all: bool = False,
+    ):
+        self.names = {name for name in names if name}
+        self.prefixes = PrefixTrie(prefix for prefix in prefixes if prefix)
+        self.patterns = [re.compile(pattern) for pattern in patterns if pattern]
+        self.match_all = match_all
+        self.matches = self._compile()
+
+    @classmethod
+    def from_config(
+        cls,
+        names: Optional[list] = None,
+        pattern: Optional[str] = None,
+        prefix: Optional[str] = None,
+        match_all: bool = True,
+    ) -> "LogGroupMatcher":
+        """
+        Builds the matcher of the CloudWatchLogGroupNames,
+        CloudWatchLogGroupPattern and CloudWatchLogGroupPrefix parameters.
+        prefix may hold several prefixes separated by commas.
+
+        Empty names, as in "".split(","), select no log group rather than
+        all of them.
+        """
+        prefixes = [p.strip() for p in (prefix or "").split(",") if p.strip()]
+        return cls(
+            names or [],
+            prefixes,
+            [pattern] if pattern else [],
+            match_all=match_all and not names,
+        )
+
+    def __bool__(self) -> bool:
+        """Whether any names, prefixes or patterns are configured."""
+        return bool(self.names or self.prefixes or self.patterns)
+
+    def _compile(self) -> Callable[[str], object]:
+        """
+        Returns a function whose result is truthy if a name matches. A single
+        check is returned as it is, as calling it through another function
+        costs as much as the check.
+        """
+        checks: List[Callable[[str], object]] = []
+        if self.names:
+            checks.append(self.names.__contains__)
+        if self.prefixes:
+            checks.append(self.prefixes.compile())
+        checks.extend(pattern.match for pattern in self.patterns)
+        if not checks:
+            match_all = self.match_all
+            return lambda name: match_all
+        if len(checks) == 1:
+            return checks[0]
+
+        def matches(name: str) -> bool:
+            for check in checks:
+                if check(name):
+                    return True
+            return False
+
+        return matches
+
+    def __call__(self, name: str) -> bool:
+        return bool(self.matches(name))
+
+    def list_prefixes(self, max_names: int = 20) -> Optional[List[str]]:
+        """
+        Returns the logGroupNamePrefix values whose log groups include every
+        name that matches, or None if all log groups have to be listed.
+        Names are looked up one by one if there are no more than max_names.
+        """
+        if not self:
+            return None if self.match_all else []
+        prefixes = PrefixTrie(self.prefixes.shortest())
+        for pattern in self.patterns:
+            start = literal_prefix(pattern.pattern)
+            if not start:
+                return None
+            prefixes.add(start)
+        names = [name for name in self.names if not prefixes.match(name)]
+        if len(names) > max_names:
+            return None
+        for name in names:
+            prefixes.add(name)
+        # prefixes that are not valid names match no log group, and the API
+        # would reject them
+        return [p for p in prefixes.shortest() if name_chars.fullmatch(p)]
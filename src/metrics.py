@@ -0,0 +1,182 @@
+"""
+Per-invocation metrics of the Forwarder.
+
+A sampled invocation records how long its stages took and how many events and
+bytes it handled, and hands them to a sink when it ends. Invocations that are
+not sampled only pay for a None check at each instrumentation point.
+
+Stages such as decoding and parsing run interleaved, as lazy iterators feeding
+each other. Their timers are exclusive: time spent in a nested iterator is
+only counted for the nested stage.
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+level = os.getenv("log_level", "INFO")
+logging.basicConfig(level=level)
+logger = logging.getLogger()
+logger.setLevel(level)
+
+# off, log or emf (CloudWatch Embedded Metric Format)
+sink_name = os.getenv("AXIOM_METRICS", "off").strip().lower()
+# share of invocations whose metrics are recorded
+sample_rate = float(os.getenv("AXIOM_METRICS_SAMPLE_RATE", "1"))
+namespace = os.getenv("AXIOM_METRICS_NAMESPACE", "AxiomCloudWatchForwarder")
+
+units = {
+    "HandlerTime": "Milliseconds",
+    "DecodeTime": "Milliseconds",
+    "ParseTime": "Milliseconds",
+    "SerializeTime": "Milliseconds",
+    "CompressTime": "Milliseconds",
+    "HttpTime": "Milliseconds",
+    "PayloadBytes": "Bytes",
+    "RawBytes": "Bytes",
+    "SentBytes": "Bytes",
+    "EventsIn": "Count",
+    "EventsOut": "Count",
+    "Requests": "Count",
+    "Retries": "Count",
+}
+
+
+class Recorder:
+    """Metrics of one invocation."""
+
+    def __init__(self):
+        self.values: Dict[str, float] = {}
+        self.started = time.perf_counter()
+        # [stage, start] of the timed iterators that are running, innermost last
+        self._stack: list = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, value: float):
+        with self._lock:
+            self.values[name] = self.values.get(name, 0) + value
+
+    def add_time(self, name: str, started: float):
+        """Adds the milliseconds since started, a time.perf_counter() value."""
+        self.add(name, (time.perf_counter() - started) * 1000)
+
+    def _charge(self, now: float):
+        stage, started = self._stack[-1]
+        self.add(stage, (now - started) * 1000)
+
+    def timed(
+        self, iterable: Iterable, stage: str, count: Optional[str] = None
+    ) -> Iterator:
+        """
+        Yields from iterable, adding the time spent producing items to stage
+        and the number of items to count.
+        """
+        it = iter(iterable)
+        stack = self._stack
+        items = 0
+        while True:
+            now = time.perf_counter()
+            if stack:
+                self._charge(now)
+            stack.append([stage, now])
+            try:
+                item = next(it)
+            except StopIteration:
+                if count is not None:
+                    self.add(count, items)
+                return
+            finally:
+                now = time.perf_counter()
+                self._charge(now)
+                stack.pop()
+                if stack:
+                    stack[-1][1] = now
+            items += 1
+            yield item
+
+
+# the recorder of the running invocation, None if it is not sampled
+active: Optional[Recorder] = None
+
+
+def begin() -> Optional[Recorder]:
+    """Starts recording the metrics of an invocation if it is sampled."""
+    global active
+    if sink is None or random.random() >= sample_rate:
+        active = None
+    else:
+        active = Recorder()
+    return active
+
+
+def end():
+    """Hands the metrics of the invocation to the sink."""
+    global active
+    recorder, active = active, None
+    if recorder is None or sink is None:
+        return
+    recorder.add_time("HandlerTime", recorder.started)
+    try:
+        sink(recorder.values)
+    except Exception as e:
+        logger.warning(f"Could not emit metrics: {e}")
+
+
+def timed(iterable: Iterable, stage: str, count: Optional[str] = None) -> Iterable:
+    """Times iterable under stage if the invocation is sampled."""
+    if active is None:
+        return iterable
+    return active.timed(iterable, stage, count)
+
+
+def log_sink(values: Dict[str, float]):
+    fields = " ".join(f"{k}={round(v, 3)}" for k, v in sorted(values.items()))
+    logger.info(f"Metrics: {fields}")
+
+
+def emf_sink(values: Dict[str, float]):
+    """Writes the metrics as a CloudWatch Embedded Metric Format log line."""
+    function_name = os.getenv("AWS_LAMBDA_FUNCTION_NAME", "unknown")
+    document = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": namespace,
+                    "Dimensions": [["FunctionName"]],
+                    "Metrics": [
+                        {"Name": name, "Unit": units.get(name, "None")}
+                        for name in values
+                    ],
+                }
+            ],
+        },
+        "FunctionName": function_name,
+    }
+    document.update({name: round(value, 3) for name, value in values.items()})
+    sys.stdout.write(json.dumps(document) + "\n")
+    sys.stdout.flush()
+
+
+# more sinks can be registered under a name before the sink is selected
+sinks: Dict[str, Callable[[Dict[str, float]], None]] = {
+    "log": log_sink,
+    "emf": emf_sink,
+}
+
+
+def select(name: str) -> Optional[Callable[[Dict[str, float]], None]]:
+    if name in ("", "off", "none"):
+        return None
+    if name not in sinks:
+        logger.warning(f"Unknown metrics sink {name}, metrics are disabled")
+        return None
+    return sinks[name]
+
+
+sink = select(sink_name)
@@ -0,0 +1,199 @@
+"""
+Rate limiting of calls to the CloudWatch Logs control plane.
+
+Calls such as PutSubscriptionFilter are limited per account and region (5
+transactions per second by default), and a throttled call fails with
+ThrottlingException. map_rate_limited runs calls on a few threads, takes a
+token of a shared bucket before each attempt and slows the bucket down when
+calls are throttled.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+level = os.getenv("log_level", "INFO")
+logging.basicConfig(level=level)
+logger = logging.getLogger()
+logger.setLevel(level)
+
+T = TypeVar("T")
+
+# error codes of throttled AWS API calls
+throttling_codes = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+}
+
+
+def error_code(error: Exception) -> Optional[str]:
+    """Returns the AWS error code of a botocore ClientError."""
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return None
+    return response.get("Error", {}).get("Code")
+
+
+def is_throttling(error: Exception) -> bool:
+    return error_code(error) in throttling_codes
+
+
+class TokenBucket:
+    """
+    Token bucket that refills at rate tokens per second and holds up to burst
+    tokens.
+
+    The rate is halved when a call is throttled, down to min_rate, and grows
+    back by a tenth of the configured rate per throttle-free second.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: Optional[float] = None,
+        min_rate: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.max_rate = rate
+        self.rate = rate
+        # without a burst calls are spread evenly, quotas such as 5 per second
+        # are enforced over windows shorter than a second
+        self.burst = burst if burst is not None else 1
+        self.min_rate = min_rate if min_rate is not None else rate / 8
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self.throttles = 0
+        self._updated = clock()
+        self._throttled_at = self._updated
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rate < self.max_rate:
+            # additive increase for the time since the last throttle
+            calm = min(elapsed, now - self._throttled_at)
+            self.rate = min(self.rate + self.max_rate * calm / 10, self.max_rate)
+        self.tokens = min(self.tokens + elapsed * self.rate, self.burst)
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self._lock:
+                self._refill(self.clock())
+                # tolerate rounding of the refill
+                if self.tokens >= 1 - 1e-9:
+                    self.tokens -= 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+            self.sleep(wait_seconds)
+
+    def throttled(self):
+        """Slows the bucket down after a call was throttled."""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self.rate = max(self.rate / 2, self.min_rate)
+            self.tokens = min(self.tokens, 0)
+            self._throttled_at = now
+            self.throttles += 1
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def call_rate_limited(
+    fn: Callable[[T], object],
+    item: T,
+    bucket: TokenBucket,
+    retries: int = 5,
+    base_delay: float = 0.2,
+    max_delay: float = 5,
+    sleep: Callable[[float], None] = time.sleep,
+):
+    """Calls fn(item) with a token of bucket, retrying throttled calls."""
+    attempt = 0
+    while True:
+        bucket.acquire()
+        try:
+            return fn(item)
+        except Exception as error:
+            if not is_throttling(error) or attempt >= retries:
+                raise
+            bucket.throttled()
+            sleep(backoff_delay(attempt, base_delay, max_delay))
+            attempt += 1
+
+
+def map_rate_limited(
+    fn: Callable[[T], object],
+    items: Iterable[T],
+    bucket: TokenBucket,
+    workers: int = 4,
+    retries: int = 5,
+    stop: Optional[Callable[[], bool]] = None,
+    label: str = "items",
+    progress_seconds: float = 10,
+) -> Iterator[Tuple[T, Optional[Exception]]]:
+    """
+    Calls fn on items on up to workers threads and yields (item, error) in
+    the order the calls complete; error is None if the call succeeded.
+
+    No more items are started once stop returns True; calls that are running
+    are still completed and yielded. Progress is logged every progress_seconds.
+    """
+    pending = iter(items)
+    running: Dict[Future, T] = {}
+    done = failed = 0
+    started = last_report = time.monotonic()
+
+    def report():
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Processed {done} {label} ({failed} failed) in {elapsed:.1f}s, "
+            f"{done / max(elapsed, 1e-9):.1f}/s, {bucket.throttles} throttled calls, "
+            f"rate limit {bucket.rate:.1f}/s"
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def submit() -> bool:
+            if stop is not None and stop():
+                return False
+            for item in pending:
+                future = executor.submit(call_rate_limited, fn, item, bucket, retries)
+                running[future] = item
+                return True
+            return False
+
+        # keep one call queued per worker, so items are not taken from the
+        # iterator long before they are processed
+        while len(running) < workers * 2 and submit():
+            pass
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                item = running.pop(future)
+                error = future.exception()
+                done += 1
+                if error is not None:
+                    failed += 1
+                yield item, error
+            while len(running) < workers * 2 and submit():
+                pass
+            if time.monotonic() - last_report >= progress_seconds:
+                last_report = time.monotonic()
+                report()
+    if done:
+        report()
@@ -0,0 +1,166 @@
+"""
+Reconciliation of subscription filters.
+
+By default the Subscriber puts the subscription filter of every matched log
+group and the Unsubscriber deletes it, whether or not it is there. In
+reconcile mode the subscription filters of each log group are described
+first, on a few threads under a rate limit, and only the puts and deletes
+that change something are made. In dry-run mode the filters are described
+and the plan is logged, but nothing is changed.
+"""
+
+import logging
+import os
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from helpers import describe_subscription_filters, subscription_filter_name
+from ratelimit import TokenBucket, error_code, map_rate_limited
+
+level = os.getenv("log_level", "INFO")
+logging.basicConfig(level=level)
+logger = logging.getLogger()
+logger.setLevel(level)
+
+modes = ("off", "on", "dry-run")
+# a log group has at most two subscription filters
+max_filters_per_group = 2
+# names of log groups logged per action, all of them are in the report
+log_names_max = 20
+
+
+def select_mode(name: str) -> str:
+    if name in ("", "false", "none"):
+        return "off"
+    if name not in modes:
+        logger.warning(f"Unknown reconcile mode {name}, log groups are not reconciled")
+        return "off"
+    return name
+
+
+mode = select_mode(os.getenv("AXIOM_RECONCILE", "off").strip().lower())
+
+
+def _own_filter(log_group_name: str, filters: List[dict]) -> Optional[dict]:
+    name = subscription_filter_name(log_group_name)
+    for f in filters:
+        if f.get("filterName") == name:
+            return f
+    return None
+
+
+def subscribe_action(
+    log_group_name: str, filters: List[dict], destination_arn: str
+) -> str:
+    """
+    What the Subscriber has to do to the log group: "create" or "update" its
+    subscription filter, nothing if it is "unchanged", or nothing as it is
+    "blocked" by the subscription filters of others.
+    """
+    own = _own_filter(log_group_name, filters)
+    if own is None:
+        if len(filters) >= max_filters_per_group:
+            return "blocked"
+        return "create"
+    if (
+        own.get("destinationArn") == destination_arn
+        and not own.get("filterPattern")
+        and own.get("distribution", "ByLogStream") == "ByLogStream"
+    ):
+        return "unchanged"
+    return "update"
+
+
+def unsubscribe_action(log_group_name: str, filters: List[dict]) -> str:
+    """Whether the subscription filter of the log group has to be deleted."""
+    return "delete" if _own_filter(log_group_name, filters) else "absent"
+
+
+def stale_action(log_group_name: str, filters: List[dict], destination_arn: str) -> str:
+    """
+    Whether the log group, which is no longer selected, still sends its logs
+    to the Forwarder and its subscription filter has to be deleted.
+    """
+    own = _own_filter(log_group_name, filters)
+    if own is not None and own.get("destinationArn") == destination_arn:
+        return "delete"
+    return "absent"
+
+
+class Plan:
+    """The action found for each log group, and the errors describing them."""
+
+    def __init__(self):
+        self.groups: Dict[str, List[str]] = {}
+        self.errors: Dict[str, str] = {}
+        self.planned = 0
+        self.applied = 0
+
+    def add(self, action: str, log_group_name: str):
+        self.groups.setdefault(action, []).append(log_group_name)
+        self.planned += 1
+
+    def counts(self) -> Dict[str, int]:
+        return {action: len(names) for action, names in self.groups.items()}
+
+    def summary(self) -> dict:
+        return {"counts": self.counts(), "groups": self.groups, "errors": self.errors}
+
+    def log(self, label: str, dry_run: bool = False):
+        prefix = "[dry-run] " if dry_run else ""
+        logger.info(f"{prefix}{label}: {self.counts() or 'no log groups'}")
+        for action, names in sorted(self.groups.items()):
+            shown = ", ".join(names[:log_names_max])
+            more = len(names) - log_names_max
+            if more > 0:
+                shown += f" and {more} more"
+            logger.info(f"{prefix}{label} {action}: {shown}")
+
+
+def plan_groups(
+    groups: Iterable[dict],
+    decide: Callable[[str, List[dict]], str],
+    plan: Plan,
+    bucket: TokenBucket,
+    apply: Iterable[str],
+    workers: int = 4,
+    stop: Optional[Callable[[], bool]] = None,
+    skipped: Optional[Callable[[dict], None]] = None,
+) -> Iterator[dict]:
+    """
+    Describes the subscription filters of groups, records the action decide
+    returns for each of them in plan, and yields the groups whose action is
+    in apply, so the changes can start while log groups are still described.
+    Log groups deleted in the meantime are "missing" and the ones that could
+    not be described are "failed". skipped is called with the groups that
+    are not yielded.
+    """
+    apply_actions = set(apply)
+
+    def describe(group: dict):
+        group["filters"] = describe_subscription_filters(group["name"])
+
+    described = map_rate_limited(
+        describe,
+        groups,
+        bucket,
+        workers=workers,
+        stop=stop,
+        label="described log groups",
+    )
+    for group, error in described:
+        if error is None:
+            action = decide(group["name"], group["filters"])
+        elif error_code(error) == "ResourceNotFoundException":
+            action = "missing"
+        else:
+            logger.error(
+                f"failed to describe subscription filters of {group['name']}, {error}"
+            )
+            plan.errors[group["name"]] = str(error)
+            action = "failed"
+        plan.add(action, group["name"])
+        if action in apply_actions:
+            plan.applied += 1
+            yield group
+        elif skipped is not None:
+            skipped(group)
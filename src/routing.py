@@ -0,0 +1,125 @@
+"""
+Routing of events to datasets.
+
+Routes are read from a JSON list and evaluated in order, the first matching
+route picks the dataset; events no route matches go to the default dataset.
+
+    [
+        {"log_group_prefix": "/aws/lambda/payments-", "dataset": "payments"},
+        {"log_group_pattern": "^/ecs/.*-prod$", "dataset": "ecs-prod"},
+        {"field": "lambda.level", "equals": "audit", "dataset": "audit"}
+    ]
+
+Log group routes apply to all events of a delivery. Field routes look up a
+dot-separated path in the event as it is sent to Axiom and compare it with
+equals, a value or a list of values.
+"""
+
+import re
+from typing import Any, Optional, Tuple
+
+# log groups whose routes are kept
+_cache_size = 1024
+
+
+class Route:
+    def __init__(
+        self,
+        dataset: str,
+        log_group_prefix: Optional[str] = None,
+        log_group_pattern: Optional[str] = None,
+        field: Optional[str] = None,
+        equals: Any = None,
+    ):
+        self.dataset = dataset
+        self.log_group_prefix = log_group_prefix
+        self.log_group_pattern = (
+            re.compile(log_group_pattern) if log_group_pattern is not None else None
+        )
+        self.path = field.split(".") if field is not None else None
+        self.values = equals if isinstance(equals, list) else [equals]
+
+    def matches_log_group(self, log_group: str) -> bool:
+        if self.log_group_prefix is not None:
+            return log_group.startswith(self.log_group_prefix)
+        if self.log_group_pattern is not None:
+            return self.log_group_pattern.search(log_group) is not None
+        return False
+
+    def matches_event(self, ev: Any) -> bool:
+        for key in self.path:
+            if not isinstance(ev, dict) or key not in ev:
+                return False
+            ev = ev[key]
+        return ev in self.values
+
+
+def _build(spec: dict) -> Route:
+    dataset = spec.get("dataset")
+    if not dataset:
+        raise ValueError(f"Route without a dataset: {spec}")
+    keys = [k for k in ("log_group_prefix", "log_group_pattern", "field") if k in spec]
+    if len(keys) != 1:
+        raise ValueError(
+            "Route needs exactly one of log_group_prefix, log_group_pattern and "
+            f"field: {spec}"
+        )
+    if "field" in spec and "equals" not in spec:
+        raise ValueError(f"Field route without equals: {spec}")
+    return Route(
+        dataset,
+        log_group_prefix=spec.get("log_group_prefix"),
+        log_group_pattern=spec.get("log_group_pattern"),
+        field=spec.get("field"),
+        equals=spec.get("equals"),
+    )
+
+
+class Router:
+    """Compiled routing table."""
+
+    def __init__(self, routes: list, default: Optional[str]):
+        self.routes = routes
+        self.default = default
+        self._resolved: dict = {}
+
+    @classmethod
+    def parse(cls, spec: Optional[list], default: Optional[str]) -> "Router":
+        if not spec:
+            return cls([], default)
+        if not isinstance(spec, list):
+            raise ValueError("Routes must be a JSON list")
+        return cls([_build(route) for route in spec], default)
+
+    def __bool__(self) -> bool:
+        return bool(self.routes)
+
+    def resolve(self, log_group: Optional[str]) -> Tuple[tuple, Optional[str]]:
+        """
+        Returns the field routes that have to be evaluated for each event of a
+        delivery from log_group, and the dataset of the events they do not
+        match.
+        """
+        resolved = self._resolved.get(log_group)
+        if resolved is not None:
+            return resolved
+        field_routes = []
+        dataset = self.default
+        for route in self.routes:
+            if route.path is not None:
+                field_routes.append(route)
+            elif log_group is not None and route.matches_log_group(log_group):
+                dataset = route.dataset
+                break
+        resolved = (tuple(field_routes), dataset)
+        if len(self._resolved) >= _cache_size:
+            self._resolved.clear()
+        self._resolved[log_group] = resolved
+        return resolved
+
+    @staticmethod
+    def route_event(ev: dict, field_routes: tuple, dataset: Optional[str]):
+        for route in field_routes:
+            if route.matches_event(ev):
+                return route.dataset
+        return dataset
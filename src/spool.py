@@ -0,0 +1,137 @@
+"""Disk-backed queue of events the Forwarder could not ingest."""
+
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from typing import List, Tuple
+
+level = os.getenv("log_level", "INFO")
+logging.basicConfig(level=level)
+logger = logging.getLogger()
+logger.setLevel(level)
+
+_suffix = ".ndjson.gz"
+
+
+class Spool:
+    """
+    Append-only segment files under directory, one per failed request.
+
+    A segment is a gzip-compressed file holding a JSON header line with the
+    dataset, followed by the serialized events one per line. Segments are
+    written to a temporary file and renamed into place, so a segment is either
+    complete or absent. When the segments use more than max_bytes on disk the
+    oldest ones are evicted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, compresslevel: int = 6):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compresslevel = compresslevel
+        self.stats = {
+            "spooled_events": 0,
+            "drained_events": 0,
+            "evicted_events": 0,
+            "evicted_segments": 0,
+        }
+        self._seq = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, dataset: str, items: list) -> str:
+        """Writes serialized events to a new segment, returns its path."""
+        with self._lock:
+            self._seq += 1
+            name = f"{time.time_ns():020d}-{os.getpid()}-{self._seq:06d}{_suffix}"
+        path = os.path.join(self.directory, name)
+        self._write(path, dataset, items)
+        self.stats["spooled_events"] += len(items)
+        self._evict()
+        return path
+
+    def rewrite(self, path: str, dataset: str, items: list, drained: int = 0):
+        """
+        Replaces the events of a segment with the ones that are left, keeping
+        its place in the queue.
+        """
+        self._write(path, dataset, items)
+        self.stats["drained_events"] += drained
+
+    def _write(self, path: str, dataset: str, items: list):
+        tmp = path + ".tmp"
+        with gzip.open(tmp, "wb", compresslevel=self.compresslevel) as f:
+            header = {"dataset": dataset, "events": len(items)}
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            for item in items:
+                f.write(item + b"\n")
+        os.replace(tmp, path)
+
+    def segments(self) -> List[str]:
+        """Returns the paths of the segments, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self.directory, name)
+            for name in sorted(names)
+            if name.endswith(_suffix)
+        ]
+
+    def read(self, path: str) -> Tuple[str, list]:
+        """Returns the dataset and serialized events of a segment."""
+        with gzip.open(path, "rb") as f:
+            header = json.loads(f.readline())
+            items = [line.rstrip(b"\n") for line in f]
+        return header["dataset"], items
+
+    def _header(self, path: str) -> dict:
+        # only the first line is decompressed
+        with gzip.open(path, "rb") as f:
+            return json.loads(f.readline())
+
+    def remove(self, path: str, drained: int = 0):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self.stats["drained_events"] += drained
+
+    def size(self) -> int:
+        total = 0
+        for path in self.segments():
+            try:
+                total += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return total
+
+    def _evict(self):
+        segments = self.segments()
+        sizes = {}
+        for path in segments:
+            try:
+                sizes[path] = os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        total = sum(sizes.values())
+        for path in segments:
+            if total <= self.max_bytes:
+                break
+            if path not in sizes:
+                continue
+            try:
+                dropped = self._header(path)["events"]
+            except Exception:
+                dropped = 0
+            self.remove(path)
+            total -= sizes[path]
+            self.stats["evicted_segments"] += 1
+            self.stats["evicted_events"] += dropped
+            logger.error(
+                f"Spool is over {self.max_bytes} bytes, dropped {dropped} events "
+                f"from {os.path.basename(path)}"
+            )
@@ -1,13 +1,16 @@
 import os
 import logging
-from typing import TypedDict
+from typing import Optional, TypedDict
 from helpers import (
     send_response,
-    build_groups_list,
-    get_log_groups,
+    iter_matching_log_groups,
     create_subscription_filter,
-    cloudwatch_logs_client,
+    delete_subscription_filter,
 )
+from loggroups import LogGroupMatcher
+from ratelimit import TokenBucket, error_code, map_rate_limited
+import checkpoint
+import reconcile
 
 level = os.getenv("log_level", "INFO")
 logging.basicConfig(level=level)
@@ -17,6 +20,14 @@ logger.setLevel(level)
 axiom_cloudwatch_forwarder_lambda_arn = os.getenv(
     "AXIOM_CLOUDWATCH_FORWARDER_LAMBDA_ARN"
 )
+# PutSubscriptionFilter calls per second, CloudWatch Logs allows 5 per account
+# and region unless the quota was raised
+subscribe_rate = float(os.getenv("AXIOM_SUBSCRIBE_RATE", "5"))
+# calls in flight at the same time
+subscribe_concurrency = int(os.getenv("AXIOM_SUBSCRIBE_CONCURRENCY", "4"))
+# no more subscription filters are created when the invocation has less than
+# this left to run, so the response to CloudFormation is still sent
+subscribe_margin_ms = int(os.getenv("AXIOM_SUBSCRIBE_MARGIN_MS", "20000"))
 
 
 def is_delete_event(invoke_source: str, event: dict) -> bool:
@@ -60,6 +71,29 @@ def get_log_group_config(invoke_source: str, event: dict):
     return config
 
 
+def get_previous_log_group_config(invoke_source: str, event: dict):
+    """The configuration before a CloudFormation update, None otherwise."""
+    if invoke_source != "cloudformation" or event["RequestType"] != "Update":
+        return None
+    if "OldResourceProperties" not in event:
+        return None
+    return get_log_group_config(
+        invoke_source, {"ResourceProperties": event["OldResourceProperties"]}
+    )
+
+
+def config_matcher(config) -> LogGroupMatcher:
+    log_group_names = config.get("log_group_names")
+    log_group_names_list = (
+        log_group_names.split(",") if log_group_names is not None else []
+    )
+    return LogGroupMatcher.from_config(
+        log_group_names_list,
+        config.get("log_group_pattern"),
+        config.get("log_group_prefix"),
+    )
+
+
 def lambda_handler(event: dict, context):
     # detect the source of the invocation
     invoke_source = None
@@ -77,9 +111,6 @@ def lambda_handler(event: dict, context):
 
     # extract the log group names, prefix and pattern from the event
     config = get_log_group_config(invoke_source, event)
-    log_group_names = config.get("log_group_names")
-    log_group_prefix = config.get("log_group_prefix")
-    log_group_pattern = config.get("log_group_pattern")
 
     if (
         axiom_cloudwatch_forwarder_lambda_arn is None
@@ -87,16 +118,23 @@ def lambda_handler(event: dict, context):
     ):
         raise Exception("AXIOM_CLOUDWATCH_LAMBDA_FORWARDER_ARN is not set")
 
-    log_group_names_list = (
-        log_group_names.split(",") if log_group_names is not None else []
+    matcher = config_matcher(config)
+    # runs that do not fit in one invocation are continued in the next one
+    key = checkpoint.run_key(
+        "subscribe",
+        dict(
+            config,
+            destination=axiom_cloudwatch_forwarder_lambda_arn,
+            reconcile=reconcile.mode,
+        ),
     )
-    log_groups = build_groups_list(
-        get_log_groups(), log_group_names_list, log_group_pattern, log_group_prefix
+    progress = checkpoint.resume(event, key)
+    saver = checkpoint.Saver(key, progress)
+    # log groups are subscribed while they are listed
+    log_groups = progress.track(
+        iter_matching_log_groups(matcher, start=progress.cursor)
     )
 
-    # report number of log groups found
-    logger.info(f"Found {len(log_groups)} log groups that matches the criteria.")
-
     Report = TypedDict(
         "Report",
         {
@@ -104,47 +142,169 @@ def lambda_handler(event: dict, context):
             "matched_log_groups": list,
             "added_groups": list,
             "added_groups_count": int,
+            "pending_groups_count": int,
+            "throttled_calls": int,
+            "removed_groups": list,
+            "reconcile": dict,
+            "invocation": int,
             "errors": dict,
         },
     )
     report: Report = {
-        "log_groups_count": len(log_groups),
+        "log_groups_count": 0,
         "matched_log_groups": [],
         "added_groups": [],
         "added_groups_count": 0,
+        "pending_groups_count": 0,
+        "throttled_calls": 0,
+        "removed_groups": [],
+        "reconcile": {},
+        "invocation": checkpoint.continuation(event).get("invocation", 0),
         "errors": {},
     }
-    for group in log_groups:
-        # skip the Forwarder lambda log group to avoid circular logging
-        if group["name"].startswith("/aws/axiom/"):
-            continue
 
-        report["matched_log_groups"].append(group["name"])
-        report["errors"][group["name"]] = []
+    def matched_groups():
+        for group in log_groups:
+            report["log_groups_count"] += 1
+            # skip the Forwarder lambda log group to avoid circular logging
+            if group["name"].startswith("/aws/axiom/"):
+                progress.finished(group)
+                continue
+            report["matched_log_groups"].append(group["name"])
+            report["errors"][group["name"]] = []
+            yield group
 
-        try:
-            create_subscription_filter(
-                group["arn"], axiom_cloudwatch_forwarder_lambda_arn
-            )
+    limit_exceeded = False
+
+    def stop() -> bool:
+        return limit_exceeded or checkpoint.out_of_time(context, subscribe_margin_ms)
+
+    groups = matched_groups()
+    plan: Optional[reconcile.Plan] = None
+    dry_run = reconcile.mode == "dry-run"
+    if reconcile.mode != "off":
+        # only the log groups whose filter is missing or differs are put
+        plan = reconcile.Plan()
+        groups = reconcile.plan_groups(
+            groups,
+            lambda name, filters: reconcile.subscribe_action(
+                name, filters, axiom_cloudwatch_forwarder_lambda_arn
+            ),
+            plan,
+            TokenBucket(subscribe_rate),
+            apply=() if dry_run else ("create", "update"),
+            workers=subscribe_concurrency,
+            stop=stop,
+            skipped=progress.finished,
+        )
+
+    bucket = TokenBucket(subscribe_rate)
+    results = map_rate_limited(
+        lambda group: create_subscription_filter(
+            group["arn"], axiom_cloudwatch_forwarder_lambda_arn
+        ),
+        groups,
+        bucket,
+        workers=subscribe_concurrency,
+        stop=stop,
+        label="log groups",
+    )
+    for group, error in results:
+        # failed log groups are reported, not retried by later invocations
+        progress.finished(group)
+        saver.save()
+        if error is None:
             report["added_groups_count"] += 1
             report["added_groups"].append(group["name"])
-        except cloudwatch_logs_client.exceptions.LimitExceededException as error:
-            report["errors"][group["name"]].append(str(error))
+            continue
+        report["errors"][group["name"]].append(str(error))
+        if error_code(error) == "LimitExceededException":
             logger.error(
                 "failed to create subscription filter for: %s. Cannot create more log groups. Create another Forwarder with different log groups configuration."
                 % group["name"]
             )
-            logger.error(error)
-            break
-        except Exception as error:
-            report["errors"][group["name"]].append(str(error))
+            limit_exceeded = True
+        else:
             logger.error("failed to create subscription filter for: %s" % group["name"])
-            logger.error(error)
-            continue
+        logger.error(error)
+
+    # report number of log groups found
+    logger.info(
+        f"Found {report['log_groups_count']} log groups that matches the criteria."
+    )
+    if plan is not None:
+        plan.log("subscription filters", dry_run)
+        report["reconcile"]["subscribe"] = plan.summary()
+    report["throttled_calls"] = bucket.throttles
+    # log groups that were listed but not subscribed
+    report["pending_groups_count"] = progress.pending
 
     logger.info(
         f"created subscription for {report['added_groups_count']} log groups out of {len(report['matched_log_groups'])} groups"
     )
+
+    unfinished = not limit_exceeded and progress.checkpoint() is not None
+    if unfinished and checkpoint.continue_in_background(event, context, key, progress):
+        # the last invocation responds
+        logger.info(report)
+        return
+    saver.save(force=True)
+    if unfinished:
+        logger.warning(
+            "ran out of time before all log groups were subscribed, "
+            f"{report['pending_groups_count']} listed log groups were not subscribed"
+        )
+
+    previous_config = get_previous_log_group_config(invoke_source, event)
+    if plan is not None and previous_config is not None and not stop():
+        stale_plan = remove_stale_subscriptions(
+            config_matcher(previous_config), matcher, stop, dry_run, report
+        )
+        stale_plan.log("stale subscription filters", dry_run)
+        report["reconcile"]["stale"] = stale_plan.summary()
+
     logger.info(report)
     responseData = {"success": True}
     send_response(event, context, "SUCCESS", responseData)
+
+
+def remove_stale_subscriptions(
+    previous: LogGroupMatcher, current: LogGroupMatcher, stop, dry_run: bool, report
+) -> "reconcile.Plan":
+    """
+    Deletes the subscription filters to the Forwarder of the log groups that
+    were selected before an update and no longer are.
+    """
+    plan = reconcile.Plan()
+    stale_groups = (
+        group
+        for group in iter_matching_log_groups(previous)
+        if not current.matches(group["name"])
+    )
+    groups = reconcile.plan_groups(
+        stale_groups,
+        lambda name, filters: reconcile.stale_action(
+            name, filters, axiom_cloudwatch_forwarder_lambda_arn
+        ),
+        plan,
+        TokenBucket(subscribe_rate),
+        apply=() if dry_run else ("delete",),
+        workers=subscribe_concurrency,
+        stop=stop,
+    )
+    results = map_rate_limited(
+        lambda group: delete_subscription_filter(group["name"]),
+        groups,
+        TokenBucket(subscribe_rate),
+        workers=subscribe_concurrency,
+        stop=stop,
+        label="stale log groups",
+    )
+    for group, error in results:
+        if error is None:
+            report["removed_groups"].append(group["name"])
+            continue
+        report["errors"].setdefault(group["name"], []).append(str(error))
+        logger.error(f"failed to delete subscription filter for {group['name']}")
+        logger.error(error)
+    return plan
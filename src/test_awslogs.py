@@ -0,0 +1,84 @@
+"""Tests for the streaming awslogs payload decoder in awslogs.py"""
+
+import base64
+import gzip
+import json
+import unittest
+from unittest import mock
+
+import awslogs
+
+
+def _payload(data: dict, **kwargs) -> str:
+    return base64.b64encode(gzip.compress(json.dumps(data, **kwargs).encode())).decode()
+
+
+def _delivery(n: int) -> dict:
+    return {
+        "messageType": "DATA_MESSAGE",
+        "owner": "123456789012",
+        "logGroup": "/aws/lambda/fn",
+        "logStream": "2024/01/01/[$LATEST]abc",
+        "subscriptionFilters": ["axiom"],
+        "logEvents": [
+            {"id": str(i), "timestamp": 1700000000000 + i, "message": f"héllo ☃ {i}"}
+            for i in range(n)
+        ],
+    }
+
+
+class TestDelivery(unittest.TestCase):
+    def assertDecodes(self, data: dict, payload: str, size: int):
+        delivery = awslogs.Delivery(payload, size)
+        self.assertEqual(list(delivery.log_events), data["logEvents"])
+        header = {k: v for k, v in data.items() if k != "logEvents"}
+        self.assertEqual(delivery.header, header)
+
+    def test_decode(self):
+        data = _delivery(200)
+        for kwargs in ({}, {"separators": (",", ":"), "ensure_ascii": False}):
+            payload = _payload(data, **kwargs)
+            # pieces that split base64 groups, UTF-8 sequences and JSON values
+            for size in (4, 28, 256, awslogs.read_size):
+                self.assertDecodes(data, payload, size)
+
+    def test_whitespace_between_events_takes_fast_path(self):
+        data = _delivery(200)
+        payload = _payload(data, indent=1)
+        value = awslogs._Reader.value
+        with mock.patch.object(
+            awslogs._Reader, "value", autospec=True, side_effect=value
+        ) as slow:
+            self.assertDecodes(data, payload, 1 << 20)
+        # the header keys and values, and the last event, which is followed by
+        # whitespace; all other events are decoded by the fast path
+        self.assertEqual(slow.call_count, 2 * (len(data) - 1) + 2)
+
+    def test_header_is_available_before_events(self):
+        delivery = awslogs.Delivery(_payload(_delivery(3)))
+        self.assertEqual(delivery.get("logGroup"), "/aws/lambda/fn")
+        self.assertEqual(next(delivery.log_events)["id"], "0")
+
+    def test_fields_after_events(self):
+        data = _delivery(10)
+        data["policyLevel"] = "ACCOUNT_LEVEL_POLICY"
+        self.assertDecodes(data, _payload(data), 16)
+
+    def test_events_before_header(self):
+        data = _delivery(10)
+        data = {"logEvents": data.pop("logEvents"), **data}
+        self.assertDecodes(data, _payload(data), 16)
+
+    def test_no_events(self):
+        self.assertDecodes(_delivery(0), _payload(_delivery(0)), 16)
+
+    def test_invalid_payload(self):
+        with self.assertRaises(awslogs.DecodeError):
+            list(awslogs.Delivery(_payload([1, 2])).log_events)
+        payload = base64.b64encode(gzip.compress(b'{"logEvents": [{"id": "1"},'))
+        with self.assertRaises(awslogs.DecodeError):
+            list(awslogs.Delivery(payload.decode()).log_events)
+
+
+if __name__ == "__main__":
+    unittest.main()
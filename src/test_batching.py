@@ -0,0 +1,94 @@
+"""Tests for the cross-invocation event buffer in batching.py"""
+
+import unittest
+
+from batching import Batcher
+
+
+def _events(n: int) -> list:
+    return [{"message": f"line {i}"} for i in range(n)]
+
+
+class TestBatcher(unittest.TestCase):
+    def setUp(self):
+        self.batcher = Batcher(max_events=10, max_bytes=1000, max_age_seconds=5)
+
+    def test_small_deliveries_are_buffered(self):
+        self.assertEqual(self.batcher.add("ds", _events(3), 30, now=0), [])
+        self.assertEqual(self.batcher.add("ds", _events(3), 30, now=1), [])
+        self.assertEqual(len(self.batcher), 6)
+
+    def test_flush_on_count(self):
+        self.batcher.add("ds", _events(6), 60, now=0)
+        ready = self.batcher.add("ds", _events(6), 60, now=1)
+        self.assertEqual(len(ready), 1)
+        self.assertEqual(len(ready[0].events), 6)
+        self.assertEqual(ready[0].reason, "count")
+        self.assertTrue(ready[0].buffered)
+        # the new delivery starts the next batch
+        self.assertEqual(len(self.batcher), 6)
+        self.assertEqual(self.batcher.flushes["count"], 1)
+
+    def test_flush_on_size(self):
+        self.batcher.add("ds", _events(1), 600, now=0)
+        ready = self.batcher.add("ds", _events(1), 600, now=1)
+        self.assertEqual([b.reason for b in ready], ["size"])
+        self.assertEqual(self.batcher.flushed_bytes, 600)
+
+    def test_large_delivery_is_flushed_directly(self):
+        self.batcher.add("ds", _events(2), 20, now=0)
+        ready = self.batcher.add("ds", _events(10), 100, now=1)
+        self.assertEqual([len(b.events) for b in ready], [2, 10])
+        self.assertEqual([b.buffered for b in ready], [True, False])
+        self.assertEqual(len(self.batcher), 0)
+
+    def test_datasets_are_buffered_separately(self):
+        self.batcher.add("a", _events(6), 60, now=0)
+        ready = self.batcher.add("b", _events(6), 60, now=0)
+        self.assertEqual(ready, [])
+        self.assertEqual(len(self.batcher), 12)
+
+    def test_flush_on_age(self):
+        self.batcher.add("ds", _events(2), 20, now=0)
+        self.assertEqual(self.batcher.due(now=4), [])
+        ready = self.batcher.due(now=5)
+        self.assertEqual([b.reason for b in ready], ["age"])
+        self.assertEqual(len(self.batcher), 0)
+
+    def test_flush_before_deadline(self):
+        self.batcher.add("a", _events(2), 20, now=0)
+        self.batcher.add("b", _events(2), 20, now=0)
+        self.assertEqual(self.batcher.due(remaining_ms=5000, margin_ms=1000, now=1), [])
+        ready = self.batcher.due(remaining_ms=900, margin_ms=1000, now=1)
+        self.assertEqual(sorted(b.dataset for b in ready), ["a", "b"])
+        self.assertEqual(self.batcher.flushes["deadline"], 2)
+
+    def test_restore(self):
+        self.batcher.add("ds", _events(6), 60, now=0)
+        (batch,) = self.batcher.add("ds", _events(6), 60, now=1)
+        self.batcher.restore(batch)
+        self.assertEqual(len(self.batcher), 12)
+        self.assertTrue(self.batcher.full("ds"))
+        self.assertEqual(self.batcher.flushes["count"], 0)
+        self.assertEqual(self.batcher.restored, 1)
+        (batch,) = self.batcher.drain("deadline")
+        self.assertEqual(batch.events[0], {"message": "line 0"})
+
+    def test_idle(self):
+        # a single invocation may not be followed by another one
+        self.assertTrue(self.batcher.idle())
+        self.batcher.arrived(now=0)
+        self.assertTrue(self.batcher.idle())
+        self.batcher.arrived(now=3)
+        self.assertFalse(self.batcher.idle())
+        self.batcher.arrived(now=9)
+        self.assertTrue(self.batcher.idle())
+
+    def test_oversized(self):
+        self.assertIsNone(self.batcher.oversized(9, 999))
+        self.assertEqual(self.batcher.oversized(10, 10), "count")
+        self.assertEqual(self.batcher.oversized(1, 1000), "size")
+
+
+if __name__ == "__main__":
+    unittest.main()
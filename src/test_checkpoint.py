@@ -0,0 +1,235 @@
+"""Tests for the checkpoints of Subscriber and Unsubscriber runs in checkpoint.py"""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import checkpoint
+import helpers
+import reconcile
+import subscriber
+import unsubscriber
+from checkpoint import FileStore, Progress, select_store
+from fakes import Logs
+from helpers import iter_matching_log_groups
+from loggroups import LogGroupMatcher
+
+forwarder_arn = "arn:aws:lambda:us-east-1:1:function:forwarder"
+
+
+def _group(name, query=0, token=None):
+    return {"name": name, "arn": name, "cursor": {"query": query, "token": token}}
+
+
+class _Context:
+    """Runs out of time after budget calls to CloudWatch Logs."""
+
+    invoked_function_arn = "arn:aws:lambda:us-east-1:1:function:subscriber"
+
+    def __init__(self, logs, budget):
+        self.logs = logs
+        self.deadline = len(logs.calls) + budget
+
+    def get_remaining_time_in_millis(self):
+        return 0 if len(self.logs.calls) >= self.deadline else 300_000
+
+
+class _Lambda:
+    def __init__(self):
+        self.events = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        assert InvocationType == "Event"
+        self.events.append(json.loads(Payload))
+
+
+class TestProgress(unittest.TestCase):
+    def test_resumes_from_first_unfinished_page(self):
+        progress = Progress()
+        groups = progress.track(
+            [_group("a"), _group("b"), _group("c", 0, "2"), _group("d", 0, "4")]
+        )
+        a, b, c = next(groups), next(groups), next(groups)
+        progress.finished(a)
+        progress.finished(c)
+        self.assertEqual(
+            progress.checkpoint(),
+            {"cursor": {"query": 0, "token": None}, "done": ["a", "c"]},
+        )
+        progress.finished(b)
+        # the page of c may still have log groups to list
+        self.assertEqual(
+            progress.checkpoint(), {"cursor": {"query": 0, "token": "2"}, "done": ["c"]}
+        )
+        progress.finished(next(groups))
+        self.assertEqual(list(groups), [])
+        self.assertIsNone(progress.checkpoint())
+
+    def test_done_log_groups_are_skipped(self):
+        progress = Progress({"query": 1, "token": "2"}, ["b", "x"])
+        listed = [g["name"] for g in progress.track([_group("a", 1), _group("b", 1)])]
+        self.assertEqual(listed, ["a"])
+        self.assertEqual(progress.skipped, 1)
+        self.assertEqual(progress.pending, 1)
+        state = progress.checkpoint()
+        self.assertEqual(state["done"], ["b", "x"])
+
+    def test_without_listed_log_groups(self):
+        progress = Progress({"query": 1, "token": "2"}, ["x"])
+        self.assertEqual(
+            progress.checkpoint(), {"cursor": {"query": 1, "token": "2"}, "done": ["x"]}
+        )
+
+
+class TestStores(unittest.TestCase):
+    def test_file_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = select_store(f"file://{directory}/checkpoints")
+            self.assertIsInstance(store, FileStore)
+            self.assertIsNone(store.load("run"))
+            store.save("run", {"cursor": None, "done": ["a"]})
+            self.assertEqual(store.load("run"), {"cursor": None, "done": ["a"]})
+            store.delete("run")
+            store.delete("run")
+            self.assertIsNone(store.load("run"))
+
+    def test_store_methods_are_abstract(self):
+        class Partial(checkpoint.Store):
+            def load(self, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            Partial()
+
+    def test_select_store(self):
+        self.assertIsNone(select_store(""))
+        self.assertIsNone(select_store("ftp://host/dir"))
+
+    def test_run_key(self):
+        key = checkpoint.run_key("subscribe", {"prefix": "/aws/", "names": ""})
+        self.assertEqual(
+            key, checkpoint.run_key("subscribe", {"names": "", "prefix": "/aws/"})
+        )
+        self.assertNotEqual(
+            key, checkpoint.run_key("subscribe", {"prefix": "/ecs/", "names": ""})
+        )
+
+
+class TestListingCursor(unittest.TestCase):
+    def test_listing_starts_at_cursor(self):
+        names = [f"/aws/lambda/fn-{i:03d}" for i in range(120)] + ["/ecs/web"]
+        logs = Logs(names)
+        matcher = LogGroupMatcher(prefixes=["/aws/lambda/", "/ecs/"])
+        with mock.patch.object(helpers, "_cloudwatch_logs_client", logs):
+            groups = list(iter_matching_log_groups(matcher))
+            self.assertEqual(groups[60]["cursor"], {"query": 0, "token": "50"})
+            self.assertEqual(groups[-1]["cursor"], {"query": 1, "token": None})
+            resumed = list(iter_matching_log_groups(matcher, groups[60]["cursor"]))
+        self.assertEqual(resumed, groups[50:])
+
+
+@mock.patch.object(subscriber, "axiom_cloudwatch_forwarder_lambda_arn", forwarder_arn)
+@mock.patch.object(subscriber, "subscribe_rate", 10_000)
+@mock.patch.object(reconcile, "mode", "off")
+class TestContinuation(unittest.TestCase):
+    def setUp(self):
+        self.logs = Logs([f"/aws/lambda/fn-{i:03d}" for i in range(230)])
+        self.lambda_client = _Lambda()
+        self.responses = []
+        for patcher in (
+            mock.patch.object(helpers, "_cloudwatch_logs_client", self.logs),
+            mock.patch.object(checkpoint, "_lambda_client", self.lambda_client),
+            mock.patch.object(
+                subscriber, "send_response", lambda *args: self.responses.append(args)
+            ),
+            mock.patch.object(
+                unsubscriber, "send_response", lambda *args: self.responses.append(args)
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.event = {
+            "RequestType": "Create",
+            "ResourceProperties": {
+                "CloudWatchLogGroupNames": "",
+                "CloudWatchLogGroupPrefix": "/aws/lambda/",
+                "CloudWatchLogGroupPattern": "",
+            },
+        }
+
+    def _run(self, handler, budget):
+        """Runs handler and its continuations, returns the invocations."""
+        event = self.event
+        invocations = 0
+        while event is not None:
+            invocations += 1
+            handler(event, _Context(self.logs, budget))
+            event = (
+                self.lambda_client.events.pop() if self.lambda_client.events else None
+            )
+        return invocations
+
+    def _run_once(self, handler):
+        handler(self.event, _Context(self.logs, 40))
+
+    def _assert_each_once(self, action):
+        calls = [name for kind, name in self.logs.calls if kind == action]
+        self.assertEqual(sorted(calls), self.logs.names)
+        self.assertEqual(len(self.responses), 1)
+
+    def test_subscriber_is_continued(self):
+        self.assertGreater(self._run(subscriber.lambda_handler, 40), 1)
+        self._assert_each_once("put")
+
+    def test_unsubscriber_is_continued(self):
+        self.assertGreater(self._run(unsubscriber.lambda_handler, 40), 1)
+        self._assert_each_once("delete")
+
+    def test_checkpoint_in_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.object(checkpoint, "store", FileStore(directory)):
+                self.assertGreater(self._run(subscriber.lambda_handler, 40), 1)
+                # the checkpoint is deleted once the run is finished
+                self.assertEqual(os.listdir(directory), [])
+        self._assert_each_once("put")
+
+    def test_failed_run_is_resumed_from_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.object(checkpoint, "store", FileStore(directory)):
+                subscriber.lambda_handler(self.event, _Context(self.logs, 40))
+                # the continuation is lost, the next run resumes
+                self.lambda_client.events.clear()
+                self._run(subscriber.lambda_handler, 1000)
+        self._assert_each_once("put")
+
+    def test_continuations_are_limited(self):
+        with mock.patch.object(checkpoint, "max_continuations", 2):
+            self.assertEqual(self._run(subscriber.lambda_handler, 40), 3)
+        self.assertEqual(len(self.responses), 1)
+        self.assertLess(len(self.logs.calls), len(self.logs.names))
+
+    def test_continuations_fit_in_an_hour(self):
+        # the first invocation and all continuations end before CloudFormation
+        # stops waiting for the response, with the maximum Lambda timeout
+        self.assertLessEqual((checkpoint.max_continuations + 1) * 300, 3600)
+        self.assertLess(checkpoint.max_run_seconds + 300, 3600)
+
+    def test_continuations_are_limited_by_time(self):
+        clock = mock.patch.object(checkpoint.time, "time")
+        now = clock.start()
+        self.addCleanup(clock.stop)
+        now.return_value = 1000.0
+        self._run_once(subscriber.lambda_handler)
+        self.assertEqual(len(self.lambda_client.events), 1)
+        event = self.lambda_client.events.pop()
+        self.assertEqual(event["continuation"]["started"], 1000.0)
+        now.return_value = 1000.0 + checkpoint.max_run_seconds + 1
+        subscriber.lambda_handler(event, _Context(self.logs, 40))
+        self.assertEqual(self.lambda_client.events, [])
+        self.assertEqual(len(self.responses), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
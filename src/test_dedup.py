@@ -0,0 +1,38 @@
+"""Tests for the memory of pushed event IDs in dedup.py"""
+
+import unittest
+
+from dedup import EventIds
+
+
+class TestEventIds(unittest.TestCase):
+    def test_seen(self):
+        ids = EventIds(max_size=10, ttl_seconds=60)
+        ids.add(["a", "b", None], now=0)
+        self.assertTrue(ids.seen("a", now=1))
+        self.assertFalse(ids.seen("c", now=1))
+        self.assertFalse(ids.seen(None, now=1))
+        self.assertEqual(ids.suppressed, 1)
+        self.assertEqual(len(ids), 2)
+
+    def test_ids_expire(self):
+        ids = EventIds(max_size=10, ttl_seconds=60)
+        ids.add(["a"], now=0)
+        ids.add(["b"], now=30)
+        self.assertFalse(ids.seen("a", now=60))
+        self.assertTrue(ids.seen("b", now=60))
+        ids.add(["c"], now=61)
+        self.assertEqual(len(ids), 2)
+
+    def test_oldest_ids_are_evicted(self):
+        ids = EventIds(max_size=3, ttl_seconds=60)
+        ids.add(["a", "b", "c"], now=0)
+        ids.add(["a"], now=1)
+        ids.add(["d"], now=2)
+        self.assertFalse(ids.seen("b", now=3))
+        self.assertTrue(ids.seen("a", now=3))
+        self.assertEqual(ids.evicted, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
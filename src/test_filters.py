@@ -0,0 +1,68 @@
+"""Tests for the event filter rules in filters.py"""
+
+import unittest
+
+from filters import Rules
+
+request_id = "b3be449c-8bd7-11e7-bb30-4f271af95c46"
+
+
+class TestRules(unittest.TestCase):
+    def test_no_rules(self):
+        rules = Rules.parse([])
+        self.assertFalse(rules)
+        self.assertFalse(rules.drops_message("hello"))
+        self.assertFalse(rules.drops_event({"message": "hello"}, None))
+
+    def test_drop_prefix_and_regex(self):
+        rules = Rules.parse(
+            [
+                {"type": "drop_prefix", "value": ["DEBUG", "TRACE"]},
+                {"type": "drop_regex", "pattern": r"GET /health\b", "name": "health"},
+            ]
+        )
+        self.assertTrue(rules.drops_message("DEBUG cache miss"))
+        self.assertTrue(rules.drops_message('10.0.0.1 "GET /health HTTP/1.1" 200'))
+        self.assertFalse(rules.drops_message("INFO GET /healthy"))
+        self.assertEqual(rules.dropped(), {"drop_prefix[0]": 1, "health": 1})
+
+    def test_drop_platform(self):
+        rules = Rules.parse([{"type": "drop_platform"}])
+        self.assertTrue(rules.drops_message(f"START RequestId: {request_id}"))
+        self.assertTrue(rules.drops_message(f"END RequestId: {request_id}"))
+        self.assertFalse(rules.drops_message(f"REPORT RequestId: {request_id}"))
+        self.assertTrue(rules.drops_event({}, {"type": "platform.start"}))
+        self.assertFalse(rules.drops_event({}, {"type": "platform.report"}))
+        with self.assertRaises(ValueError):
+            Rules.parse([{"type": "drop_platform", "lines": ["INIT"]}])
+
+    def test_drop_field(self):
+        rules = Rules.parse(
+            [{"type": "drop_field", "field": "lambda.level", "values": ["debug"]}]
+        )
+        # paths start at the event as it is sent, like those of field routes
+        data = {"level": "debug"}
+        self.assertTrue(rules.drops_event({"lambda": data}, data))
+        self.assertFalse(rules.drops_event({"lambda": {"level": "info"}}, None))
+        self.assertFalse(rules.drops_event({"lambda": "debug"}, None))
+        self.assertFalse(rules.drops_event({"message": "debug"}, data))
+
+    def test_sample_by_request_id(self):
+        rules = Rules.parse([{"type": "sample", "rate": 4}])
+        ids = [f"request-{i}" for i in range(1000)]
+        kept = [i for i in ids if not rules.drops_event({}, {"requestID": i})]
+        self.assertTrue(150 < len(kept) < 350, len(kept))
+        # all lines of a request share the decision
+        for i in ids[:50]:
+            first = rules.drops_event({}, {"requestID": i})
+            self.assertEqual(rules.drops_event({}, {"requestID": i}), first)
+        # lines without a request ID are kept
+        self.assertFalse(rules.drops_event({}, {"message": "hi"}))
+
+    def test_unknown_rule(self):
+        with self.assertRaises(ValueError):
+            Rules.parse([{"type": "drop_everything"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,25 @@
-"""Tests for edge URL configuration in forwarder.py"""
+"""Tests for edge URL configuration and forwarding in forwarder.py"""
 
+import base64
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
+from unittest import mock
 from urllib.parse import urlparse
 
+import batching
+import dedup
+import filters
+import forwarder
+import ingest
+import routing
+import spool
+from ingest_server import Faults, IngestServer
+
 
 def _url_has_path(url: str) -> bool:
     """Check if URL has a meaningful path (not empty or just '/')."""
@@ -156,5 +173,305 @@ class TestGetIngestUrl(unittest.TestCase):
         self.assertEqual(url, "https://axiom.mycompany.com/v1/datasets/logs/ingest")
 
 
+class TestColdStart(unittest.TestCase):
+    """The ingest path must not import boto3 at cold start."""
+
+    def test_import_does_not_load_boto3(self):
+        env = {k: v for k, v in os.environ.items() if not k.startswith("AWS_")}
+        code = (
+            "import sys, forwarder; "
+            "print(sorted(m for m in ('boto3', 'botocore', 'helpers') "
+            "if m in sys.modules))"
+        )
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        self.assertEqual(out.strip(), "[]")
+
+
+def _delivery(messages: list, start: int = 0, log_group="/aws/lambda/checkout"):
+    data = {
+        "messageType": "DATA_MESSAGE",
+        "owner": "123456789012",
+        "logGroup": log_group,
+        "logStream": "2024/01/01/[$LATEST]0123456789abcdef",
+        "subscriptionFilters": ["axiom"],
+        "logEvents": [
+            {"id": str(start + i), "timestamp": start + i, "message": m}
+            for i, m in enumerate(messages)
+        ],
+    }
+    payload = gzip.compress(json.dumps(data).encode())
+    return {"awslogs": {"data": base64.b64encode(payload).decode()}}
+
+
+class _Context:
+    invoked_function_arn = "arn:aws:lambda:us-east-1:123456789012:function:fwd"
+
+    def get_remaining_time_in_millis(self) -> int:
+        return 60_000
+
+
+class _ForwarderTest(unittest.TestCase):
+    """Runs forward_logs against the local ingest server."""
+
+    def setUp(self):
+        self.server = IngestServer(port=0, keep_events=True).start()
+        self.addCleanup(self.server.stop)
+        patcher = mock.patch.multiple(
+            forwarder,
+            axiom_url=self.server.url,
+            axiom_token="token",
+            axiom_dataset="logs",
+            axiom_edge_url="",
+            axiom_edge="",
+            batcher=None,
+            event_spool=None,
+            event_ids=None,
+            router=routing.Router.parse([], "logs"),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        delay = mock.patch.object(ingest, "retry_base_delay", 0.001)
+        delay.start()
+        self.addCleanup(delay.stop)
+
+    def forward(self, event: dict):
+        forwarder.forward_logs(event, _Context())
+
+    def received(self, dataset: str = "logs") -> list:
+        return [ev["message"] for ev in self.server.received.get(dataset, [])]
+
+    def fail_requests(self):
+        self.server.faults = Faults(error_rate=1)
+
+    def accept_requests(self):
+        self.server.faults = Faults()
+
+    def fail_dataset(self, dataset: str):
+        """Fails the requests to dataset until the test ends."""
+        push_chunk = forwarder._push_chunk
+
+        def failing(deadline, chunk):
+            if chunk.dataset == dataset:
+                raise Exception(f"{dataset} is unavailable")
+            return push_chunk(deadline, chunk)
+
+        patcher = mock.patch.object(forwarder, "_push_chunk", failing)
+        patcher.start()
+        return patcher
+
+
+class TestBatchedForwarding(_ForwarderTest):
+    def setUp(self):
+        super().setUp()
+        self.batcher = batching.Batcher(
+            max_events=100, max_bytes=1 << 20, max_age_seconds=10
+        )
+        forwarder.batcher = self.batcher
+
+    def test_single_invocation_is_flushed(self):
+        # no invocation follows to flush the buffer, so nothing is kept
+        self.forward(_delivery(["a", "b", "c"]))
+        self.assertEqual(self.received(), ["a", "b", "c"])
+        self.assertEqual(len(self.batcher), 0)
+        self.assertEqual(self.batcher.flushes["idle"], 1)
+
+    def test_steady_invocations_are_buffered(self):
+        self.forward(_delivery(["a"]))
+        self.forward(_delivery(["b", "c"], start=1))
+        self.assertEqual(self.received(), ["a"])
+        self.assertEqual(len(self.batcher), 2)
+        self.batcher.max_events = 3
+        self.forward(_delivery(["d", "e"], start=3))
+        self.assertEqual(self.received(), ["a", "b", "c"])
+        self.assertEqual(self.batcher.flushes["count"], 1)
+
+    def test_size_limit_applies_to_serialized_events(self):
+        self.batcher.arrived()
+        # the messages are 100 bytes, the events sent are several times larger
+        self.batcher.max_bytes = 1000
+        self.forward(_delivery(["x" * 10] * 10))
+        self.assertEqual(len(self.received()), 10)
+        self.assertEqual(self.batcher.flushes["size"], 1)
+        self.assertGreater(self.batcher.flushed_bytes, 1000)
+
+    def test_failed_push_buffers_nothing(self):
+        forwarder.router = routing.Router.parse(
+            [{"field": "lambda.level", "equals": "audit", "dataset": "audit"}], "logs"
+        )
+        self.batcher.arrived()
+        self.batcher.max_events = 3
+        delivery = _delivery(
+            ['{"level": "audit"}', "a", '{"level": "audit"}', '{"level": "audit"}']
+        )
+        self.fail_requests()
+        with self.assertRaises(ingest.IngestError):
+            self.forward(delivery)
+        # the event of the other dataset was not buffered, the retry of the
+        # delivery sends it once
+        self.assertEqual(len(self.batcher), 0)
+        self.accept_requests()
+        self.forward(delivery)
+        self.batcher.max_age_seconds = 0
+        self.forward(_delivery([], start=4))
+        self.assertEqual(len(self.received("audit")), 3)
+        self.assertEqual(self.received(), ["a"])
+
+    def test_failed_flush_is_restored(self):
+        self.batcher.arrived()
+        self.forward(_delivery(["a", "b"]))
+        self.fail_requests()
+        self.batcher.max_age_seconds = 0
+        self.forward(_delivery(["c"], start=2))
+        self.assertEqual(len(self.batcher), 3)
+        self.assertGreater(self.batcher.restored, 0)
+        self.accept_requests()
+        self.forward(_delivery(["d"], start=3))
+        self.assertEqual(self.received(), ["a", "b", "c", "d"])
+
+
+class TestNdjsonForwarding(_ForwarderTest):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(forwarder, "ingest_format", "ndjson")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_small_chunk_is_not_compressed(self):
+        self.forward(_delivery(["a", "b"]))
+        self.assertEqual(self.received(), ["a", "b"])
+        stats = self.server.stats()
+        self.assertEqual(stats["sent_bytes"], stats["raw_bytes"])
+
+    def test_large_chunk_is_compressed(self):
+        self.forward(_delivery(["x" * 100] * 50))
+        self.assertEqual(len(self.received()), 50)
+        stats = self.server.stats()
+        self.assertLess(stats["sent_bytes"], stats["raw_bytes"])
+
+
+class TestSpooledForwarding(_ForwarderTest):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.spool = spool.Spool(tmp.name, 1 << 20)
+        forwarder.event_spool = self.spool
+
+    def test_failed_events_are_sent_by_next_invocation(self):
+        self.fail_requests()
+        # the delivery is acknowledged, its events wait on disk
+        self.forward(_delivery(["a", "b"]))
+        self.assertEqual(len(self.spool.segments()), 1)
+        self.accept_requests()
+        self.forward(_delivery(["c"], start=2))
+        self.assertEqual(self.received(), ["a", "b", "c"])
+        self.assertEqual(self.spool.segments(), [])
+        self.assertEqual(self.spool.stats["drained_events"], 2)
+
+    def test_failed_drain_keeps_order(self):
+        self.fail_requests()
+        self.forward(_delivery(["a", "b"]))
+        (first,) = self.spool.segments()
+        self.forward(_delivery(["c"], start=2))
+        self.forward(_delivery(["d"], start=3))
+        # the events that still failed stay ahead of the newer ones
+        segments = self.spool.segments()
+        self.assertEqual(len(segments), 3)
+        self.assertEqual(segments[0], first)
+        self.accept_requests()
+        self.forward(_delivery(["e"], start=4))
+        self.assertEqual(self.received(), ["a", "b", "c", "d", "e"])
+
+
+class TestDedupForwarding(_ForwarderTest):
+    def setUp(self):
+        super().setUp()
+        forwarder.event_ids = dedup.EventIds(1000, 3600)
+        forwarder.router = routing.Router.parse(
+            [{"field": "lambda.level", "equals": "audit", "dataset": "audit"}], "logs"
+        )
+
+    def test_redelivery_is_skipped(self):
+        delivery = _delivery(["a", "b"])
+        self.forward(delivery)
+        self.forward(delivery)
+        self.assertEqual(self.received(), ["a", "b"])
+        self.assertEqual(forwarder.event_ids.suppressed, 2)
+
+    def test_retry_sends_only_what_failed(self):
+        # the audit events are sent first, and are not next to each other in
+        # the delivery
+        messages = ['{"level": "audit"}', "a", '{"level": "audit", "n": 1}', "b"]
+        delivery = _delivery(messages)
+        failing = self.fail_dataset("logs")
+        with self.assertRaises(ingest.IngestError):
+            self.forward(delivery)
+        self.assertEqual(len(self.received("audit")), 2)
+        failing.stop()
+        self.forward(delivery)
+        self.assertEqual(len(self.received("audit")), 2)
+        self.assertEqual(self.received(), ["a", "b"])
+        self.assertEqual(forwarder.event_ids.suppressed, 2)
+
+
+class TestRoutedForwarding(_ForwarderTest):
+    def setUp(self):
+        super().setUp()
+        forwarder.router = routing.Router.parse(
+            [
+                {"log_group_prefix": "/aws/lambda/payments-", "dataset": "payments"},
+                {"field": "lambda.level", "equals": "audit", "dataset": "audit"},
+            ],
+            "logs",
+        )
+
+    def test_events_fan_out(self):
+        self.forward(_delivery(["a", '{"level": "audit"}', "b"]))
+        self.forward(
+            _delivery(["c", '{"level": "audit"}'], 3, "/aws/lambda/payments-1")
+        )
+        self.assertEqual(self.received(), ["a", "b"])
+        self.assertEqual(self.received("audit"), ['{"level": "audit"}'])
+        self.assertEqual(self.received("payments"), ["c", '{"level": "audit"}'])
+
+    def test_filters_and_routes_share_field_paths(self):
+        rules = filters.Rules.parse(
+            [{"type": "drop_field", "field": "lambda.level", "values": ["debug"]}]
+        )
+        patcher = mock.patch.object(forwarder, "filter_rules", rules)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.forward(_delivery(['{"level": "debug"}', '{"level": "audit"}', "a"]))
+        self.assertEqual(self.received(), ["a"])
+        self.assertEqual(self.received("audit"), ['{"level": "audit"}'])
+
+    def test_failed_dataset_is_spooled_to_its_dataset(self):
+        with tempfile.TemporaryDirectory() as directory:
+            forwarder.event_spool = spool.Spool(directory, 1 << 20)
+            failing = self.fail_dataset("audit")
+            self.forward(_delivery(["a", '{"level": "audit"}']))
+            failing.stop()
+            self.assertEqual(self.received(), ["a"])
+            self.assertEqual(self.received("audit"), [])
+            self.forward(_delivery(["b"], start=2))
+            self.assertEqual(self.received(), ["a", "b"])
+            self.assertEqual(self.received("audit"), ['{"level": "audit"}'])
+
+    def test_failed_dataset_fails_the_invocation(self):
+        failing = self.fail_dataset("audit")
+        self.addCleanup(failing.stop)
+        with self.assertRaises(ingest.IngestError) as raised:
+            self.forward(_delivery(["a", '{"level": "audit"}', "b"]))
+        self.assertEqual(raised.exception.result.succeeded, [(0, 2)])
+        self.assertEqual(self.received(), ["a", "b"])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,103 @@
+"""Tests for the log group enumeration in helpers.py"""
+
+import re
+import unittest
+from unittest import mock
+
+import helpers
+from fakes import Logs
+from helpers import iter_matching_log_groups
+from loggroups import LogGroupMatcher
+
+
+def _select(names, pattern, prefix):
+    """Selection rules of the Subscriber, one log group at a time."""
+    if not names and not pattern and not prefix:
+        return list(_names)
+    return [
+        name
+        for name in _names
+        if (names and name in names)
+        or (prefix and name.startswith(prefix))
+        or (pattern and re.match(pattern, name))
+    ]
+
+
+_names = (
+    [f"/aws/lambda/fn-{i:03d}" for i in range(120)]
+    + [f"/aws/rds/db-{i}" for i in range(5)]
+    + ["/ecs/web-prod", "/ecs/web-dev"]
+)
+
+
+class TestIterMatchingLogGroups(unittest.TestCase):
+    def setUp(self):
+        self.logs = Logs(_names)
+        patcher = mock.patch.object(helpers, "_cloudwatch_logs_client", self.logs)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _names(self, *args, **kwargs):
+        matcher = LogGroupMatcher.from_config(*args, **kwargs)
+        return [g["name"] for g in iter_matching_log_groups(matcher)]
+
+    def test_all_log_groups_are_paged(self):
+        self.assertEqual(self._names(), sorted(_names))
+        self.assertEqual(len(self.logs.listings), 3)
+
+    def test_prefix_is_pushed_down(self):
+        names = self._names(prefix="/aws/rds/")
+        self.assertEqual(names, [f"/aws/rds/db-{i}" for i in range(5)])
+        self.assertEqual(self.logs.listings, [("/aws/rds/", None)])
+
+    def test_names_are_looked_up(self):
+        names = self._names(["/ecs/web-prod", "/aws/lambda/fn-001", "/missing"])
+        self.assertEqual(sorted(names), ["/aws/lambda/fn-001", "/ecs/web-prod"])
+        self.assertEqual(
+            sorted(prefix for prefix, _ in self.logs.listings),
+            ["/aws/lambda/fn-001", "/ecs/web-prod", "/missing"],
+        )
+
+    def test_pattern_prefix_is_pushed_down(self):
+        names = self._names(pattern=r"^/ecs/.*-prod$")
+        self.assertEqual(names, ["/ecs/web-prod"])
+        self.assertEqual(self.logs.listings, [("/ecs/", None)])
+
+    def test_pattern_without_prefix_lists_everything(self):
+        names = self._names(pattern=r".*-prod$")
+        self.assertEqual(names, ["/ecs/web-prod"])
+        self.assertEqual(len(self.logs.listings), 3)
+
+    def test_filters_are_combined_without_duplicates(self):
+        names = self._names(["/aws/rds/db-1"], r"/aws/rds/db-[0-2]", "/aws/rds/")
+        self.assertEqual(sorted(names), [f"/aws/rds/db-{i}" for i in range(5)])
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_empty_names_match_nothing(self):
+        self.assertEqual(self._names([""]), [])
+        self.assertEqual(self.logs.listings, [])
+
+    def test_without_filters_when_not_matching_all(self):
+        self.assertEqual(self._names(match_all=False), [])
+        self.assertEqual(self.logs.listings, [])
+
+    def test_invalid_names_are_not_sent(self):
+        self.assertEqual(self._names(["/ecs/web-prod", " spaced"]), ["/ecs/web-prod"])
+        self.assertEqual(self.logs.listings, [("/ecs/web-prod", None)])
+
+    def test_same_selection(self):
+        cases = [
+            ([], None, None),
+            (["/ecs/web-dev"], r"/aws/lambda/fn-0[0-4]\d", "/aws/rds/"),
+            ([], r"(?i)/ECS/", None),
+            ([], None, "/aws/lambda/fn-11"),
+        ]
+        for names, pattern, prefix in cases:
+            self.assertEqual(
+                sorted(self._names(names, pattern, prefix)),
+                sorted(_select(names, pattern, prefix)),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,439 @@
+"""Tests for the ingest HTTP transport in ingest.py"""
+
+import gzip
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ingest
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.server.received.append(self._read_body())
+        body = b'{"ingested": 1}'
+        status, headers = 200, {}
+        if self.server.responses:
+            status, headers = self.server.responses.pop(0)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if self.server.close_after_response:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+        if self.server.drop_after_response:
+            # hang up without telling the client, like an idle timeout would
+            self.close_connection = True
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding") != "chunked":
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b""
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            body += self.rfile.read(size)
+            self.rfile.readline()
+            if size == 0:
+                return body
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server:
+    def __init__(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.httpd.received = []
+        # (status, headers) answered to the next requests, then 200
+        self.httpd.responses = []
+        self.httpd.close_after_response = False
+        self.httpd.drop_after_response = False
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/ingest/test"
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.server = _Server()
+        self.pool = ingest.get_pool(self.server.url)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def test_connection_is_reused(self):
+        for _ in range(3):
+            resp = ingest.post(self.server.url, b"[]", {})
+            self.assertEqual(resp.status, 200)
+            self.assertEqual(resp.body, b'{"ingested": 1}')
+        self.assertEqual(self.pool.stats["new"], 1)
+        self.assertEqual(self.pool.stats["reused"], 2)
+        self.assertEqual(self.server.httpd.received, [b"[]"] * 3)
+
+    def test_server_closed_connection_is_replaced(self):
+        self.server.httpd.close_after_response = True
+        ingest.post(self.server.url, b"[]", {})
+        self.server.httpd.close_after_response = False
+        ingest.post(self.server.url, b"[]", {})
+        self.assertEqual(self.pool.stats["new"], 2)
+        self.assertEqual(self.pool.stats["reused"], 0)
+
+    def test_stale_connection_is_detected(self):
+        self.server.httpd.drop_after_response = True
+        ingest.post(self.server.url, b"[]", {})
+        self.assertEqual(len(self.pool._idle), 1)
+        # give the FIN time to arrive
+        time.sleep(0.05)
+        resp = ingest.post(self.server.url, b"[]", {})
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(self.pool.stats["stale"], 1)
+        self.assertEqual(self.pool.stats["new"], 2)
+        self.assertEqual(self.pool.stats["reused"], 0)
+
+    def test_stale_connection_reconnects_transparently(self):
+        self.server.httpd.drop_after_response = True
+        ingest.post(self.server.url, b"[]", {})
+        time.sleep(0.05)
+        # pretend the health check missed the hang up
+        with mock.patch.object(ingest, "_is_stale", return_value=False):
+            resp = ingest.post(self.server.url, b"[]", {})
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(self.pool.stats["reused"], 1)
+        self.assertEqual(self.pool.stats["stale"], 1)
+        self.assertEqual(self.pool.stats["new"], 2)
+
+    def test_streamed_body(self):
+        calls = []
+
+        def body():
+            calls.append(1)
+            return iter([b'{"a":1}\n', b'{"a":2}\n'])
+
+        resp = ingest.post(self.server.url, body, {})
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(self.server.httpd.received, [b'{"a":1}\n{"a":2}\n'])
+        self.assertEqual(len(calls), 1)
+
+    def test_streamed_body_is_regenerated_on_reconnect(self):
+        self.server.httpd.drop_after_response = True
+        ingest.post(self.server.url, b"[]", {})
+        time.sleep(0.05)
+        with mock.patch.object(ingest, "_is_stale", return_value=False):
+            resp = ingest.post(self.server.url, lambda: iter([b"x", b"y"]), {})
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(self.server.httpd.received[-1], b"xy")
+
+    def test_request_path_keeps_query(self):
+        self.assertEqual(
+            ingest.request_path("https://api.axiom.co/v1/ingest/ds?x=1"),
+            "/v1/ingest/ds?x=1",
+        )
+        self.assertEqual(ingest.request_path("http://localhost:3400"), "/")
+
+
+class TestCompress(unittest.TestCase):
+    def test_gzip(self):
+        data = b'{"message": "hello"}' * 100
+        body, encoding = ingest.compress(data, "gzip", 6, 10)
+        self.assertEqual(encoding, "gzip")
+        self.assertLess(len(body), len(data))
+        self.assertEqual(gzip.decompress(body), data)
+
+    def test_below_threshold_is_not_compressed(self):
+        body, encoding = ingest.compress(b"[]", "gzip", 6, 1024)
+        self.assertIsNone(encoding)
+        self.assertEqual(body, b"[]")
+
+    def test_disabled(self):
+        data = b"x" * 4096
+        self.assertEqual(ingest.compress(data, None, 0, 0), (data, None))
+
+    def test_resolve_compression(self):
+        self.assertEqual(ingest._resolve_compression("none", ""), (None, 0))
+        self.assertEqual(ingest._resolve_compression("gzip", ""), ("gzip", 1))
+        self.assertEqual(ingest._resolve_compression("gzip", "1"), ("gzip", 1))
+        self.assertEqual(ingest._resolve_compression("brotli", ""), ("gzip", 1))
+        with mock.patch.object(ingest, "zstandard", None):
+            self.assertEqual(ingest._resolve_compression("zstd", ""), ("gzip", 1))
+
+    @unittest.skipIf(ingest.zstandard is None, "zstandard is not installed")
+    def test_zstd(self):
+        data = b'{"message": "hello"}' * 100
+        body, encoding = ingest.compress(data, "zstd", 3, 10)
+        self.assertEqual(encoding, "zstd")
+        self.assertEqual(ingest.zstandard.ZstdDecompressor().decompress(body), data)
+
+
+class TestSerialization(unittest.TestCase):
+    events = [{"_time": i, "message": f"line {i}"} for i in range(100)]
+
+    def test_iter_ndjson(self):
+        lines = list(ingest.iter_ndjson(ingest.iter_encoded(self.events)))
+        self.assertEqual(len(lines), 100)
+        self.assertEqual([json.loads(line) for line in lines], self.events)
+        self.assertTrue(all(line.endswith(b"\n") for line in lines))
+
+    def test_iter_encoded_shared_key(self):
+        aws = {"logGroup": "/aws/lambda/fn", "tags": {"env": "prod"}}
+        events = [
+            {"_time": 1, "aws": aws, "message": "a"},
+            {"aws": aws},
+            {"_time": 2, "aws": None, "message": "b"},
+            {"_time": 3, "message": "c"},
+        ]
+        lines = list(ingest.iter_encoded(events, shared_key="aws"))
+        self.assertEqual([json.loads(line) for line in lines], events)
+        self.assertTrue(lines[0].startswith(b'{"aws":{"logGroup"'))
+
+    def test_json_array(self):
+        items = list(ingest.iter_encoded(self.events))
+        self.assertEqual(json.loads(ingest.json_array(items)), self.events)
+        self.assertEqual(ingest.json_array([]), b"[]")
+
+    def test_iter_compressed_gzip(self):
+        lines = list(ingest.iter_ndjson(ingest.iter_encoded(self.events)))
+        body = b"".join(ingest.iter_compressed(lines, "gzip", 6))
+        self.assertEqual(gzip.decompress(body), b"".join(lines))
+
+    def test_iter_compressed_none(self):
+        self.assertEqual(
+            list(ingest.iter_compressed([b"a", b"b"], None, 0)), [b"a", b"b"]
+        )
+
+    def test_iter_buffered(self):
+        chunks = list(ingest.iter_buffered([b"ab", b"cd", b"e"], 3))
+        self.assertEqual(chunks, [b"abcd", b"e"])
+
+
+class TestChunks(unittest.TestCase):
+    def test_single_chunk(self):
+        items = [b"x" * 10] * 5
+        chunks = list(ingest.iter_chunks(items, 1000, 100))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0].offset, 0)
+        self.assertEqual(chunks[0].items, items)
+
+    def test_dataset_and_offset(self):
+        items = [str(i).encode() for i in range(15)]
+        chunks = list(ingest.iter_chunks(items, 1000, 10, dataset="a", offset=5))
+        self.assertEqual([c.offset for c in chunks], [5, 15])
+        self.assertEqual({c.dataset for c in chunks}, {"a"})
+
+    def test_split_by_events(self):
+        items = [str(i).encode() for i in range(25)]
+        chunks = list(ingest.iter_chunks(items, 1000, 10))
+        self.assertEqual([len(c.items) for c in chunks], [10, 10, 5])
+        self.assertEqual([c.offset for c in chunks], [0, 10, 20])
+        self.assertEqual([i for c in chunks for i in c.items], items)
+
+    def test_split_by_bytes(self):
+        items = [b"x" * 40] * 5
+        chunks = list(ingest.iter_chunks(items, 100, 100))
+        self.assertEqual([len(c.items) for c in chunks], [2, 2, 1])
+        self.assertTrue(all(c.size <= 100 for c in chunks))
+
+    def test_oversized_event_is_sent_alone(self):
+        items = [b"a", b"x" * 500, b"b"]
+        chunks = list(ingest.iter_chunks(items, 100, 100))
+        self.assertEqual([c.items for c in chunks], [[b"a"], [b"x" * 500], [b"b"]])
+
+    def test_empty(self):
+        self.assertEqual(list(ingest.iter_chunks([], 100, 100)), [])
+
+
+class TestSendChunks(unittest.TestCase):
+    def _chunks(self, n: int) -> list:
+        return list(ingest.iter_chunks([b"x"] * n, 1000, 10))
+
+    def test_serial_keeps_order(self):
+        sent = []
+
+        def send(chunk):
+            sent.append(chunk.offset)
+            return 1
+
+        result = ingest.send_chunks(self._chunks(45), send, max_in_flight=1)
+        self.assertEqual(sent, [0, 10, 20, 30, 40])
+        self.assertEqual(result.events, 45)
+        self.assertEqual(result.requests, 5)
+        self.assertEqual(result.sent_bytes, 5)
+        self.assertEqual(result.failed, [])
+
+    def test_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        state = {"current": 0, "max": 0}
+
+        def send(chunk):
+            with lock:
+                state["current"] += 1
+                state["max"] = max(state["max"], state["current"])
+            time.sleep(0.01)
+            with lock:
+                state["current"] -= 1
+            return 1
+
+        result = ingest.send_chunks(self._chunks(200), send, max_in_flight=3)
+        self.assertEqual(result.requests, 20)
+        self.assertLessEqual(state["max"], 3)
+        self.assertGreater(state["max"], 1)
+
+    def test_concurrency_above_the_setting(self):
+        workers = ingest.max_in_flight + 2
+        # every request waits until all of them are in flight
+        barrier = threading.Barrier(workers, timeout=5)
+
+        def send(chunk):
+            barrier.wait()
+            return 1
+
+        result = ingest.send_chunks(self._chunks(10 * workers), send, workers)
+        self.assertEqual(result.failed, [])
+        self.assertEqual(result.requests, workers)
+
+    def test_failures_are_aggregated(self):
+        def send(chunk):
+            if chunk.offset in (10, 30):
+                raise Exception(f"boom {chunk.offset}")
+            return 1
+
+        result = ingest.send_chunks(self._chunks(50), send, max_in_flight=2)
+        self.assertEqual(sorted(result.succeeded), [(0, 10), (20, 10), (40, 10)])
+        self.assertEqual([c.offset for c, _ in result.failed], [10, 30])
+        error = ingest.IngestError(result)
+        self.assertIn("2 ingest requests (20 events) failed", str(error))
+        self.assertIs(error.result, result)
+
+    def test_requests_in_flight_finish_when_chunks_fail(self):
+        finished = []
+
+        def send(chunk):
+            time.sleep(0.02)
+            finished.append(chunk.offset)
+            return 1
+
+        def chunks():
+            yield from self._chunks(20)
+            raise ValueError("bad event")
+
+        with self.assertRaises(ValueError):
+            ingest.send_chunks(chunks(), send, max_in_flight=4)
+        self.assertEqual(sorted(finished), [0, 10])
+
+
+class TestPostWithRetry(unittest.TestCase):
+    def setUp(self):
+        self.server = _Server()
+        self.sleeps = []
+
+    def tearDown(self):
+        ingest.get_pool(self.server.url).close()
+        self.server.stop()
+
+    def _post(self, **kwargs):
+        return ingest.post_with_retry(
+            self.server.url, b"[]", {}, sleep=self.sleeps.append, **kwargs
+        )
+
+    def test_success_is_not_retried(self):
+        self.assertEqual(self._post().status, 200)
+        self.assertEqual(self.sleeps, [])
+
+    def test_transient_statuses_are_retried(self):
+        self.server.httpd.responses = [(503, {}), (500, {})]
+        self.assertEqual(self._post(retries=3).status, 200)
+        self.assertEqual(len(self.server.httpd.received), 3)
+        self.assertEqual(len(self.sleeps), 2)
+        # full jitter: the n-th retry waits at most base * 2^n
+        self.assertLessEqual(self.sleeps[0], ingest.retry_base_delay)
+        self.assertLessEqual(self.sleeps[1], ingest.retry_base_delay * 2)
+
+    def test_retry_after_is_respected(self):
+        self.server.httpd.responses = [(429, {"Retry-After": "2"})]
+        self.assertEqual(self._post().status, 200)
+        self.assertEqual(self.sleeps, [2.0])
+
+    def test_client_errors_are_not_retried(self):
+        self.server.httpd.responses = [(400, {})]
+        with self.assertRaises(ingest.StatusError) as ctx:
+            self._post()
+        self.assertEqual(ctx.exception.response.status, 400)
+        self.assertIn("Unexpected status 400", str(ctx.exception))
+        self.assertEqual(self.sleeps, [])
+
+    def test_retries_are_exhausted(self):
+        self.server.httpd.responses = [(503, {})] * 3
+        with self.assertRaises(ingest.StatusError):
+            self._post(retries=2)
+        self.assertEqual(len(self.server.httpd.received), 3)
+
+    def test_deadline_stops_retries(self):
+        self.server.httpd.responses = [(429, {"Retry-After": "30"})]
+        with self.assertRaises(ingest.StatusError):
+            self._post(deadline=time.monotonic() + 5)
+        self.assertEqual(self.sleeps, [])
+
+    def test_attempts_end_at_the_deadline(self):
+        timeouts = []
+
+        def post(url, body, headers, timeout):
+            timeouts.append(timeout)
+            raise TimeoutError("timed out")
+
+        with mock.patch.object(ingest, "post", post):
+            with self.assertRaises(TimeoutError):
+                self._post()
+            self.assertEqual(timeouts, [ingest.http_timeout] * 4)
+            timeouts.clear()
+            with self.assertRaises(TimeoutError):
+                self._post(deadline=time.monotonic() + 5)
+        self.assertEqual(len(timeouts), 4)
+        self.assertTrue(all(0 < t <= 5 for t in timeouts))
+
+    def test_timeout_applies_to_reused_connections(self):
+        self.assertEqual(self._post().status, 200)
+        pool = ingest.get_pool(self.server.url)
+        self._post(deadline=time.monotonic() + 5)
+        self.assertEqual(pool.stats["reused"], 1)
+        conn, _ = pool._idle[-1]
+        self.assertLessEqual(conn.sock.gettimeout(), 5)
+
+    def test_connection_errors_are_retried(self):
+        calls = []
+
+        def post(url, body, headers, timeout):
+            calls.append(url)
+            if len(calls) == 1:
+                raise ConnectionResetError("reset")
+            return ingest.Response(200, "OK", {}, b"")
+
+        with mock.patch.object(ingest, "post", post):
+            self.assertEqual(self._post().status, 200)
+        self.assertEqual(len(calls), 2)
+
+    def test_retry_after_http_date(self):
+        response = ingest.Response(
+            429, "", {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}, b""
+        )
+        self.assertEqual(ingest._retry_after(response), 0.0)
+        self.assertIsNone(
+            ingest._retry_after(ingest.Response(429, "", {"retry-after": "x"}, b""))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
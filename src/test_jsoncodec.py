@@ -0,0 +1,111 @@
+"""Tests for the pluggable JSON backends in jsoncodec.py"""
+
+import json
+import unittest
+
+import jsoncodec
+
+# every backend that can be imported here, the standard library always is
+_backends = [
+    name
+    for name in ("json", "orjson", "ujson")
+    if name == "json" or getattr(jsoncodec, name) is not None
+]
+
+_documents = [
+    {},
+    [],
+    {"level": "info", "msg": "hello world", "n": 42, "ok": True, "nothing": None},
+    {"nested": {"list": [1, 2.5, -3, {"deep": ["a", "b"]}]}},
+    {"unicode": "héllo wörld ✓ 日本語 🚀", "escapes": 'quote " backslash \\ tab \t'},
+    {"control": "\x00\x01\x1f", "slash": "/aws/lambda/fn", "newline": "a\nb\r"},
+    {"floats": [0.1, 1.5, -2.25, 3.141592653589793, 100.0, 0.0]},
+    {"ints": [0, -1, 2**31, -(2**53), 2**63 - 1]},
+    {"big": [123456789012345678901234567890, -(2**70), 2**64], "n": 1},
+    {"below_int64": -(2**63) - 1, "nanoseconds": 1700000000000000000},
+    {"_time": 1700000000000000, "aws": {"logGroup": "/aws/lambda/fn"}, "x": ""},
+]
+
+
+class TestBackends(unittest.TestCase):
+    def test_roundtrip_matches_stdlib(self):
+        for name in _backends:
+            loads, dumps = jsoncodec.backends[name]
+            for doc in _documents:
+                with self.subTest(backend=name, doc=doc):
+                    encoded = dumps(doc)
+                    self.assertIsInstance(encoded, bytes)
+                    self.assertEqual(json.loads(encoded), doc)
+                    self.assertEqual(loads(encoded), doc)
+                    self.assertEqual(loads(encoded.decode("utf-8")), doc)
+
+    def test_output_is_byte_for_byte_stdlib_compatible(self):
+        # ujson escapes U+2028/U+2029 and orjson writes exponents differently,
+        # none of the documents above trigger either
+        for name in _backends:
+            if name == "ujson":
+                continue
+            dumps = jsoncodec.backends[name][1]
+            for doc in _documents:
+                with self.subTest(backend=name, doc=doc):
+                    self.assertEqual(dumps(doc), jsoncodec.stdlib_dumps(doc))
+
+    def test_stdlib_output_is_compact_utf8(self):
+        self.assertEqual(
+            jsoncodec.stdlib_dumps({"a": [1, "é"]}), '{"a":[1,"é"]}'.encode("utf-8")
+        )
+
+    def test_non_finite_floats_are_written_as_null(self):
+        doc = {"a": float("nan"), "b": [float("inf"), -float("inf"), 1.5]}
+        for name in _backends:
+            with self.subTest(backend=name):
+                encoded = jsoncodec.backends[name][1](doc)
+                self.assertEqual(
+                    json.loads(encoded), {"a": None, "b": [None, None, 1.5]}
+                )
+
+    def test_non_finite_constants_are_null(self):
+        for name in _backends:
+            loads = jsoncodec.backends[name][0]
+            for text in ('{"a": NaN, "b": 1}', '{"a": Infinity, "b": 1}'):
+                with self.subTest(backend=name, text=text):
+                    self.assertEqual(loads(text), {"a": None, "b": 1})
+                    self.assertEqual(loads(text.encode()), {"a": None, "b": 1})
+            self.assertEqual(loads("[-Infinity]"), [None])
+
+    def test_nan_inside_strings_is_kept(self):
+        for name in _backends:
+            loads = jsoncodec.backends[name][0]
+            with self.subTest(backend=name):
+                self.assertEqual(loads('{"a": "NaN"}'), {"a": "NaN"})
+
+    def test_invalid_json_is_rejected(self):
+        for name in _backends:
+            loads = jsoncodec.backends[name][0]
+            for text in ("{", "{a: 1}", "{} trailing", ""):
+                with self.subTest(backend=name, text=text):
+                    with self.assertRaises(ValueError):
+                        loads(text)
+
+    def test_values_fast_backends_cannot_encode(self):
+        doc = {"big": 2**70, "surrogate": "\ud800"}
+        for name in _backends:
+            with self.subTest(backend=name):
+                encoded = jsoncodec.backends[name][1](doc)
+                self.assertEqual(json.loads(encoded), doc)
+
+    def test_escaped_surrogates_are_decoded(self):
+        for name in _backends:
+            with self.subTest(backend=name):
+                self.assertEqual(
+                    jsoncodec.backends[name][0]('{"s": "\\ud800"}'), {"s": "\ud800"}
+                )
+
+    def test_select(self):
+        self.assertEqual(jsoncodec._select("json"), "json")
+        self.assertEqual(jsoncodec._select("simdjson"), "json")
+        self.assertIn(jsoncodec.backend, _backends)
+
+
+if __name__ == "__main__":
+    unittest.main()
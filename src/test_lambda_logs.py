@@ -0,0 +1,118 @@
+"""Tests for the Lambda platform line parser in lambda_logs.py"""
+
+import unittest
+
+from lambda_logs import parse_message, platform_fields
+
+request_id = "b3be449c-8bd7-11e7-bb30-4f271af95c46"
+
+
+class TestParseMessage(unittest.TestCase):
+    def test_report_with_tabs(self):
+        message = (
+            f"REPORT RequestId: {request_id}\tDuration: 0.47 ms\t"
+            "Billed Duration: 100 ms\tMemory Size: 128 MB\tMax Memory Used: 20 MB\t"
+        )
+        self.assertEqual(
+            parse_message(message),
+            {
+                "requestID": request_id,
+                "durationMS": 0.47,
+                "billedDurationMS": 100,
+                "memorySizeMB": 128,
+                "maxMemoryMB": 20,
+            },
+        )
+
+    def test_report_with_spaces(self):
+        message = (
+            f"REPORT RequestId: {request_id} Duration: 1.5 ms "
+            "Billed Duration: 2 ms Memory Size: 512 MB Max Memory Used: 64 MB"
+        )
+        fields = parse_message(message)
+        self.assertEqual(fields["durationMS"], 1.5)
+        self.assertEqual(fields["maxMemoryMB"], 64)
+
+    def test_report_optional_fields(self):
+        message = (
+            f"REPORT RequestId: {request_id}\tDuration: 0.47 ms\t"
+            "Billed Duration: 100 ms\tMemory Size: 128 MB\tMax Memory Used: 20 MB\t"
+            "Init Duration: 120.33 ms\t\n"
+            "XRAY TraceId: 1-5d9f6a1b-3c1d8a6f9b2c7e4d5f6a7b8c\t"
+            "SegmentId: 4b2c1a0f9e8d7c6b\tSampled: true\t"
+        )
+        fields = parse_message(message)
+        self.assertEqual(fields["initDurationMS"], 120.33)
+        self.assertEqual(fields["xrayTraceId"], "1-5d9f6a1b-3c1d8a6f9b2c7e4d5f6a7b8c")
+        self.assertEqual(fields["xraySegmentId"], "4b2c1a0f9e8d7c6b")
+        self.assertTrue(fields["xraySampled"])
+
+    def test_report_failed_invocation(self):
+        message = (
+            f"REPORT RequestId: {request_id}\tDuration: 3000.00 ms\t"
+            "Billed Duration: 3000 ms\tMemory Size: 128 MB\tMax Memory Used: 90 MB\t"
+            "Status: timeout\tError Type: Runtime.ExitError"
+        )
+        fields = parse_message(message)
+        self.assertEqual(fields["status"], "timeout")
+        self.assertEqual(fields["errorType"], "Runtime.ExitError")
+
+    def test_report_missing_required_field(self):
+        message = f"REPORT RequestId: {request_id}\tDuration: 0.47 ms\t"
+        self.assertIsNone(parse_message(message))
+
+    def test_start_end_and_std(self):
+        self.assertEqual(
+            parse_message(f"START RequestId: {request_id} Version: $LATEST"),
+            {"requestID": request_id, "version": "$LATEST"},
+        )
+        self.assertEqual(
+            parse_message(f"END RequestId: {request_id}"), {"requestID": request_id}
+        )
+        self.assertEqual(
+            parse_message(f"2017-04-27T20:03:27.281Z\t{request_id}\tINFO\thello"),
+            {"requestID": request_id},
+        )
+
+    def test_unrecognized(self):
+        for message in ("", "hello", "STARTUP done", "ERROR boom", "Retrying"):
+            self.assertEqual(parse_message(message), {}, message)
+
+
+class TestPlatformFields(unittest.TestCase):
+    def test_report(self):
+        data = {
+            "time": "2023-11-01T12:00:00.000Z",
+            "type": "platform.report",
+            "record": {
+                "requestId": request_id,
+                "status": "success",
+                "metrics": {
+                    "durationMs": 0.47,
+                    "billedDurationMs": 1,
+                    "memorySizeMB": 128,
+                    "maxMemoryUsedMB": 20,
+                },
+                "tracing": {"type": "X-Amzn-Trace-Id", "value": "Root=1-abc"},
+            },
+        }
+        self.assertEqual(
+            platform_fields(data),
+            {
+                "requestID": request_id,
+                "status": "success",
+                "durationMS": 0.47,
+                "billedDurationMS": 1,
+                "memorySizeMB": 128,
+                "maxMemoryMB": 20,
+                "xrayTraceId": "Root=1-abc",
+            },
+        )
+
+    def test_other_json(self):
+        self.assertIsNone(platform_fields({"type": "order", "record": {}}))
+        self.assertIsNone(platform_fields({"message": "hello"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Tests for the log group matcher in loggroups.py"""
+
+import unittest
+
+from loggroups import LogGroupMatcher, PrefixTrie, literal_prefix
+
+
+class TestLiteralPrefix(unittest.TestCase):
+    def test_literal_prefix(self):
+        self.assertEqual(literal_prefix("/aws/lambda/.*"), "/aws/lambda/")
+        self.assertEqual(literal_prefix("^/ecs/"), "/ecs/")
+        self.assertEqual(literal_prefix(r"/aws/my\.fn"), "/aws/my.fn")
+        self.assertEqual(literal_prefix("/aws/lambdas?"), "/aws/lambda")
+        self.assertEqual(literal_prefix("/aws/a|/aws/b"), "")
+        self.assertEqual(literal_prefix("(?i)/aws"), "")
+        self.assertEqual(literal_prefix("/aws/my fn"), "/aws/my")
+
+
+class TestPrefixTrie(unittest.TestCase):
+    def test_match(self):
+        trie = PrefixTrie(["/aws/lambda/", "/aws/rds/prod-", "/ecs"])
+        self.assertTrue(trie.match("/aws/lambda/fn"))
+        self.assertTrue(trie.match("/aws/rds/prod-db"))
+        self.assertTrue(trie.match("/ecs"))
+        self.assertFalse(trie.match("/aws/rds/dev-db"))
+        self.assertFalse(trie.match("/aws/lambd"))
+        self.assertFalse(PrefixTrie().match("/aws"))
+
+    def test_match_many_prefixes(self):
+        trie = PrefixTrie(f"/aws/lambda/fn-{i}-" for i in range(100))
+        self.assertTrue(trie.match("/aws/lambda/fn-42-prod"))
+        self.assertTrue(trie.match("/aws/lambda/fn-9-dev"))
+        self.assertFalse(trie.match("/aws/lambda/fn-100-dev"))
+        self.assertFalse(trie.match("/aws/lambda/fn-4"))
+
+    def test_shortest(self):
+        trie = PrefixTrie(["/aws/lambda/fn", "/aws/lambda/", "/ecs/", "/aws/rds/"])
+        self.assertEqual(trie.shortest(), ["/aws/lambda/", "/aws/rds/", "/ecs/"])
+
+
+class TestLogGroupMatcher(unittest.TestCase):
+    def test_matches_any_filter(self):
+        matcher = LogGroupMatcher.from_config(
+            ["/ecs/web"], r"/aws/rds/.*-prod$", "/aws/lambda/, /aws/apigateway/"
+        )
+        self.assertTrue(matcher.matches("/ecs/web"))
+        self.assertFalse(matcher.matches("/ecs/web-2"))
+        self.assertTrue(matcher.matches("/aws/lambda/fn"))
+        self.assertTrue(matcher.matches("/aws/apigateway/api"))
+        self.assertTrue(matcher.matches("/aws/rds/db-prod"))
+        self.assertFalse(matcher.matches("/aws/rds/db-dev"))
+
+    def test_without_filters(self):
+        self.assertTrue(LogGroupMatcher.from_config().matches("/any"))
+        self.assertFalse(LogGroupMatcher.from_config(match_all=False).matches("/any"))
+        # "".split(",") selects nothing
+        self.assertFalse(LogGroupMatcher.from_config([""]).matches("/any"))
+
+    def test_list_prefixes(self):
+        matcher = LogGroupMatcher.from_config(
+            ["/aws/lambda/fn", "/ecs/web"], r"^/aws/rds/.*", "/aws/lambda/"
+        )
+        self.assertEqual(
+            matcher.list_prefixes(), ["/aws/lambda/", "/aws/rds/", "/ecs/web"]
+        )
+        self.assertIsNone(matcher.list_prefixes(max_names=0))
+        self.assertIsNone(
+            LogGroupMatcher.from_config(pattern=".*-prod").list_prefixes()
+        )
+        self.assertIsNone(LogGroupMatcher.from_config().list_prefixes())
+        self.assertEqual(LogGroupMatcher.from_config([""]).list_prefixes(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Tests for the invocation metrics in metrics.py"""
+
+import io
+import json
+import time
+import unittest
+from unittest import mock
+
+import metrics
+from metrics import Recorder
+
+
+def _slow(items, seconds):
+    for item in items:
+        time.sleep(seconds)
+        yield item
+
+
+class TestRecorder(unittest.TestCase):
+    def test_timed_counts_items(self):
+        recorder = Recorder()
+        self.assertEqual(list(recorder.timed([1, 2, 3], "Stage", "Items")), [1, 2, 3])
+        self.assertEqual(recorder.values["Items"], 3)
+        self.assertGreaterEqual(recorder.values["Stage"], 0)
+
+    def test_nested_stages_are_exclusive(self):
+        recorder = Recorder()
+        inner = recorder.timed(_slow(range(5), 0.01), "Inner")
+        outer = recorder.timed((i * 2 for i in inner), "Outer")
+        for _ in outer:
+            # time spent by the consumer is not counted for either stage
+            time.sleep(0.01)
+        self.assertGreaterEqual(recorder.values["Inner"], 45)
+        self.assertLess(recorder.values["Outer"], 20)
+
+    def test_add(self):
+        recorder = Recorder()
+        recorder.add("Requests", 1)
+        recorder.add("Requests", 2)
+        self.assertEqual(recorder.values["Requests"], 3)
+
+
+class TestInvocation(unittest.TestCase):
+    @mock.patch.object(metrics, "sample_rate", 0.0)
+    @mock.patch.object(metrics, "sink")
+    def test_not_sampled(self, sink):
+        self.assertIsNone(metrics.begin())
+        items = [1, 2]
+        self.assertIs(metrics.timed(items, "Stage"), items)
+        metrics.end()
+        sink.assert_not_called()
+
+    @mock.patch.object(metrics, "sample_rate", 1.0)
+    @mock.patch.object(metrics, "sink")
+    def test_sampled(self, sink):
+        recorder = metrics.begin()
+        self.assertIs(metrics.active, recorder)
+        recorder.add("EventsOut", 2)
+        metrics.end()
+        self.assertIsNone(metrics.active)
+        values = sink.call_args[0][0]
+        self.assertEqual(values["EventsOut"], 2)
+        self.assertIn("HandlerTime", values)
+
+    @mock.patch.object(metrics, "sample_rate", 1.0)
+    @mock.patch.object(metrics, "sink", side_effect=ValueError("boom"))
+    def test_sink_errors_are_logged(self, sink):
+        metrics.begin()
+        with self.assertLogs(level="WARNING"):
+            metrics.end()
+
+
+class TestSinks(unittest.TestCase):
+    def test_emf(self):
+        out = io.StringIO()
+        with mock.patch("sys.stdout", out):
+            with mock.patch.dict(
+                "os.environ", {"AWS_LAMBDA_FUNCTION_NAME": "forwarder"}
+            ):
+                metrics.emf_sink({"HttpTime": 12.3456, "Requests": 2})
+        document = json.loads(out.getvalue())
+        directive = document["_aws"]["CloudWatchMetrics"][0]
+        self.assertEqual(directive["Namespace"], metrics.namespace)
+        self.assertEqual(directive["Dimensions"], [["FunctionName"]])
+        self.assertIn(
+            {"Name": "HttpTime", "Unit": "Milliseconds"}, directive["Metrics"]
+        )
+        self.assertIn({"Name": "Requests", "Unit": "Count"}, directive["Metrics"])
+        self.assertEqual(document["FunctionName"], "forwarder")
+        self.assertEqual(document["HttpTime"], 12.346)
+
+    def test_select(self):
+        self.assertIsNone(metrics.select("off"))
+        self.assertIs(metrics.select("emf"), metrics.emf_sink)
+        with self.assertLogs(level="WARNING"):
+            self.assertIsNone(metrics.select("statsd"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+"""Tests for the rate limiting of control plane calls in ratelimit.py"""
+
+import threading
+import unittest
+from unittest import mock
+
+import ratelimit
+from ratelimit import TokenBucket, is_throttling, map_rate_limited
+
+
+class _ClientError(Exception):
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code, "Message": code}}
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate_is_respected(self):
+        clock = _Clock()
+        bucket = TokenBucket(5, burst=1, clock=clock, sleep=clock.sleep)
+        for _ in range(11):
+            bucket.acquire()
+        self.assertAlmostEqual(clock.now, 2.0)
+
+    def test_burst(self):
+        clock = _Clock()
+        bucket = TokenBucket(5, burst=5, clock=clock, sleep=clock.sleep)
+        for _ in range(5):
+            bucket.acquire()
+        self.assertEqual(clock.now, 0)
+
+    def test_throttling_halves_the_rate_and_recovers(self):
+        clock = _Clock()
+        bucket = TokenBucket(8, clock=clock, sleep=clock.sleep)
+        bucket.throttled()
+        bucket.throttled()
+        self.assertEqual(bucket.rate, 2)
+        for _ in range(10):
+            bucket.throttled()
+        self.assertEqual(bucket.rate, 1)
+        self.assertEqual(bucket.throttles, 12)
+        clock.now += 5
+        bucket.acquire()
+        self.assertEqual(bucket.rate, 5)
+        clock.now += 5
+        bucket.acquire()
+        self.assertEqual(bucket.rate, 8)
+
+
+class TestErrors(unittest.TestCase):
+    def test_is_throttling(self):
+        self.assertTrue(is_throttling(_ClientError("ThrottlingException")))
+        self.assertFalse(is_throttling(_ClientError("LimitExceededException")))
+        self.assertFalse(is_throttling(ValueError("boom")))
+
+
+@mock.patch.object(ratelimit, "backoff_delay", lambda *args: 0)
+class TestMapRateLimited(unittest.TestCase):
+    def test_results(self):
+        def fn(item):
+            if item == 3:
+                raise ValueError("boom")
+
+        bucket = TokenBucket(1000)
+        results = dict(map_rate_limited(fn, range(10), bucket, workers=3))
+        self.assertEqual(sorted(results), list(range(10)))
+        self.assertIsInstance(results[3], ValueError)
+        self.assertEqual(sum(e is None for e in results.values()), 9)
+
+    def test_throttled_calls_are_retried(self):
+        calls = {}
+        lock = threading.Lock()
+
+        def fn(item):
+            with lock:
+                calls[item] = calls.get(item, 0) + 1
+                if calls[item] <= 2:
+                    raise _ClientError("ThrottlingException")
+
+        bucket = TokenBucket(1000)
+        results = list(map_rate_limited(fn, range(4), bucket, retries=2))
+        self.assertTrue(all(error is None for _, error in results))
+        self.assertEqual(calls, {0: 3, 1: 3, 2: 3, 3: 3})
+        self.assertEqual(bucket.throttles, 8)
+
+    def test_retries_are_exhausted(self):
+        def fn(item):
+            raise _ClientError("ThrottlingException")
+
+        results = list(map_rate_limited(fn, [1], TokenBucket(1000), retries=1))
+        self.assertTrue(is_throttling(results[0][1]))
+
+    def test_stop(self):
+        stopped = []
+        results = map_rate_limited(
+            lambda item: None,
+            range(100),
+            TokenBucket(1000),
+            workers=1,
+            stop=lambda: bool(stopped),
+        )
+        done = []
+        for item, _ in results:
+            done.append(item)
+            stopped.append(True)
+        # calls that were already queued are completed
+        self.assertLessEqual(len(done), 2)
+        self.assertEqual(done, sorted(done))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+"""Tests for the reconciliation of subscription filters in reconcile.py"""
+
+import unittest
+from unittest import mock
+
+import helpers
+import reconcile
+import subscriber
+import unsubscriber
+from fakes import Logs
+from ratelimit import TokenBucket
+from reconcile import Plan, plan_groups, stale_action, subscribe_action
+
+forwarder_arn = "arn:aws:lambda:us-east-1:1:function:forwarder"
+other_arn = "arn:aws:lambda:us-east-1:1:function:other"
+
+
+def _filter(log_group_name, destination_arn=forwarder_arn, name=None, pattern=""):
+    return {
+        "filterName": name or f"{log_group_name}-axiom",
+        "logGroupName": log_group_name,
+        "filterPattern": pattern,
+        "destinationArn": destination_arn,
+        "distribution": "ByLogStream",
+    }
+
+
+class TestActions(unittest.TestCase):
+    def test_subscribe_action(self):
+        name = "/aws/lambda/fn"
+        self.assertEqual(subscribe_action(name, [], forwarder_arn), "create")
+        self.assertEqual(
+            subscribe_action(name, [_filter(name)], forwarder_arn), "unchanged"
+        )
+        self.assertEqual(
+            subscribe_action(name, [_filter(name, other_arn)], forwarder_arn), "update"
+        )
+        self.assertEqual(
+            subscribe_action(name, [_filter(name, pattern="ERROR")], forwarder_arn),
+            "update",
+        )
+        others = [_filter(name, other_arn, name=f"other-{i}") for i in range(2)]
+        self.assertEqual(subscribe_action(name, others, forwarder_arn), "blocked")
+        self.assertEqual(subscribe_action(name, others[:1], forwarder_arn), "create")
+
+    def test_stale_action(self):
+        name = "/aws/lambda/fn"
+        self.assertEqual(stale_action(name, [_filter(name)], forwarder_arn), "delete")
+        self.assertEqual(
+            stale_action(name, [_filter(name, other_arn)], forwarder_arn), "absent"
+        )
+        self.assertEqual(stale_action(name, [], forwarder_arn), "absent")
+
+    def test_select_mode(self):
+        self.assertEqual(reconcile.select_mode("dry-run"), "dry-run")
+        self.assertEqual(reconcile.select_mode(""), "off")
+        self.assertEqual(reconcile.select_mode("maybe"), "off")
+
+
+class TestPlanGroups(unittest.TestCase):
+    def setUp(self):
+        self.logs = Logs(
+            {
+                "/a": [],
+                "/b": [_filter("/b")],
+                "/c": [_filter("/c", other_arn)],
+            }
+        )
+        patcher = mock.patch.object(helpers, "_cloudwatch_logs_client", self.logs)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _plan(self, names, apply):
+        plan = Plan()
+        groups = plan_groups(
+            ({"name": name} for name in names),
+            lambda name, filters: subscribe_action(name, filters, forwarder_arn),
+            plan,
+            TokenBucket(1000),
+            apply=apply,
+            workers=2,
+        )
+        return plan, sorted(group["name"] for group in groups)
+
+    def test_only_changes_are_yielded(self):
+        plan, applied = self._plan(["/a", "/b", "/c", "/gone"], ("create", "update"))
+        self.assertEqual(applied, ["/a", "/c"])
+        self.assertEqual(
+            plan.counts(), {"create": 1, "unchanged": 1, "update": 1, "missing": 1}
+        )
+        self.assertEqual((plan.planned, plan.applied), (4, 2))
+
+    def test_dry_run(self):
+        plan, applied = self._plan(["/a", "/b", "/c"], ())
+        self.assertEqual(applied, [])
+        self.assertEqual(plan.groups["create"], ["/a"])
+        self.assertEqual(
+            sorted(c for c in self.logs.calls),
+            [("describe", "/a"), ("describe", "/b"), ("describe", "/c")],
+        )
+
+
+@mock.patch.object(subscriber, "axiom_cloudwatch_forwarder_lambda_arn", forwarder_arn)
+class TestHandlers(unittest.TestCase):
+    def setUp(self):
+        self.logs = Logs(
+            {
+                "/aws/lambda/a": [],
+                "/aws/lambda/b": [_filter("/aws/lambda/b")],
+                "/aws/rds/db": [_filter("/aws/rds/db")],
+                "/aws/rds/other": [_filter("/aws/rds/other", other_arn)],
+            }
+        )
+        for patcher in (
+            mock.patch.object(helpers, "_cloudwatch_logs_client", self.logs),
+            mock.patch.object(subscriber, "send_response"),
+            mock.patch.object(unsubscriber, "send_response"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _update(self, prefix, old_prefix):
+        def properties(prefix):
+            return {
+                "CloudWatchLogGroupNames": "",
+                "CloudWatchLogGroupPrefix": prefix,
+                "CloudWatchLogGroupPattern": "",
+            }
+
+        return {
+            "RequestType": "Update",
+            "ResourceProperties": properties(prefix),
+            "OldResourceProperties": properties(old_prefix),
+        }
+
+    def test_subscriber_puts_only_changes_and_removes_stale_filters(self):
+        with mock.patch.object(reconcile, "mode", "on"):
+            subscriber.lambda_handler(self._update("/aws/lambda/", "/aws/"), None)
+        self.assertEqual(
+            self.logs.changed(), [("delete", "/aws/rds/db"), ("put", "/aws/lambda/a")]
+        )
+
+    def test_subscriber_dry_run_changes_nothing(self):
+        with mock.patch.object(reconcile, "mode", "dry-run"):
+            subscriber.lambda_handler(self._update("/aws/lambda/", "/aws/"), None)
+        self.assertEqual(self.logs.changed(), [])
+
+    def test_subscriber_without_reconcile_puts_all(self):
+        with mock.patch.object(reconcile, "mode", "off"):
+            subscriber.lambda_handler(self._update("/aws/lambda/", "/aws/"), None)
+        self.assertEqual(
+            self.logs.changed(), [("put", "/aws/lambda/a"), ("put", "/aws/lambda/b")]
+        )
+
+    def test_unsubscriber_deletes_only_existing_filters(self):
+        event = self._update("/aws/", "/aws/")
+        with mock.patch.object(reconcile, "mode", "on"):
+            unsubscriber.lambda_handler(event, None)
+        self.assertEqual(
+            self.logs.changed(),
+            [
+                ("delete", "/aws/lambda/b"),
+                ("delete", "/aws/rds/db"),
+                ("delete", "/aws/rds/other"),
+            ],
+        )
+        self.logs.calls = []
+        self.logs.filters["/aws/lambda/b"] = []
+        with mock.patch.object(reconcile, "mode", "dry-run"):
+            unsubscriber.lambda_handler(event, None)
+        self.assertEqual(self.logs.changed(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""Tests for the dataset routing table in routing.py"""
+
+import unittest
+
+from routing import Router
+
+
+class TestRouter(unittest.TestCase):
+    def test_no_routes(self):
+        router = Router.parse([], "logs")
+        self.assertFalse(router)
+        self.assertEqual(router.resolve("/aws/lambda/fn"), ((), "logs"))
+
+    def test_log_group_routes(self):
+        router = Router.parse(
+            [
+                {"log_group_prefix": "/aws/lambda/payments-", "dataset": "payments"},
+                {"log_group_pattern": "^/ecs/.*-prod$", "dataset": "ecs"},
+            ],
+            "logs",
+        )
+        self.assertEqual(router.resolve("/aws/lambda/payments-api"), ((), "payments"))
+        self.assertEqual(router.resolve("/ecs/web-prod"), ((), "ecs"))
+        self.assertEqual(router.resolve("/ecs/web-dev"), ((), "logs"))
+        self.assertEqual(router.resolve(None), ((), "logs"))
+
+    def test_field_routes(self):
+        router = Router.parse(
+            [
+                {"field": "lambda.level", "equals": ["audit"], "dataset": "audit"},
+                {"log_group_prefix": "/aws/lambda/", "dataset": "lambdas"},
+                {"field": "lambda.level", "equals": "debug", "dataset": "debug"},
+            ],
+            "logs",
+        )
+        field_routes, dataset = router.resolve("/aws/lambda/fn")
+        self.assertEqual(dataset, "lambdas")
+        # routes after the matching log group route are not evaluated
+        self.assertEqual(len(field_routes), 1)
+        audit = {"lambda": {"level": "audit"}}
+        self.assertEqual(router.route_event(audit, field_routes, dataset), "audit")
+        debug = {"lambda": {"level": "debug"}}
+        self.assertEqual(router.route_event(debug, field_routes, dataset), "lambdas")
+
+        field_routes, dataset = router.resolve("/ecs/web")
+        self.assertEqual((len(field_routes), dataset), (2, "logs"))
+        self.assertEqual(router.route_event(debug, field_routes, dataset), "debug")
+        self.assertEqual(router.route_event({}, field_routes, dataset), "logs")
+
+    def test_invalid_routes(self):
+        for spec in (
+            [{"log_group_prefix": "/aws/"}],
+            [{"dataset": "logs"}],
+            [{"field": "level", "dataset": "logs"}],
+            [{"field": "a", "equals": 1, "log_group_prefix": "/", "dataset": "x"}],
+        ):
+            with self.assertRaises(ValueError):
+                Router.parse(spec, "logs")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Tests for the disk-backed queue of failed events in spool.py"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from spool import Spool
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = os.path.join(self.tmp.name, "spool")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append_and_read(self):
+        spool = Spool(self.dir, 1024 * 1024)
+        items = [b'{"message":"a"}', b'{"message":"b"}']
+        path = spool.append("logs", items)
+        self.assertEqual(spool.segments(), [path])
+        self.assertEqual(spool.read(path), ("logs", items))
+        self.assertEqual(spool.stats["spooled_events"], 2)
+
+    def test_segments_are_ordered_oldest_first(self):
+        spool = Spool(self.dir, 1024 * 1024)
+        paths = [spool.append("logs", [str(i).encode()]) for i in range(5)]
+        self.assertEqual(spool.segments(), paths)
+
+    def test_remove(self):
+        spool = Spool(self.dir, 1024 * 1024)
+        path = spool.append("logs", [b"{}"])
+        spool.remove(path, 1)
+        self.assertEqual(spool.segments(), [])
+        self.assertEqual(spool.stats["drained_events"], 1)
+        # removing twice is harmless
+        spool.remove(path)
+
+    def test_oldest_segments_are_evicted(self):
+        spool = Spool(self.dir, 1024 * 1024)
+        first = spool.append("logs", [os.urandom(512).hex().encode()])
+        spool.max_bytes = spool.size() + 100
+        second = spool.append("logs", [os.urandom(512).hex().encode()])
+        self.assertEqual(spool.segments(), [second])
+        self.assertFalse(os.path.exists(first))
+        self.assertEqual(spool.stats["evicted_segments"], 1)
+        self.assertEqual(spool.stats["evicted_events"], 1)
+
+    def test_eviction_reads_event_count_from_header(self):
+        spool = Spool(self.dir, 1024 * 1024)
+        spool.append("logs", [os.urandom(256).hex().encode() for _ in range(3)])
+        spool.max_bytes = spool.size() + 100
+        with mock.patch.object(Spool, "read", side_effect=AssertionError):
+            spool.append("logs", [os.urandom(512).hex().encode()])
+        self.assertEqual(spool.stats["evicted_events"], 3)
+
+    def test_rewrite_keeps_place_in_queue(self):
+        spool = Spool(self.dir, 1024 * 1024)
+        first = spool.append("logs", [b"1", b"2", b"3"])
+        second = spool.append("logs", [b"4"])
+        spool.rewrite(first, "logs", [b"3"], drained=2)
+        self.assertEqual(spool.segments(), [first, second])
+        self.assertEqual(spool.read(first), ("logs", [b"3"]))
+        self.assertEqual(spool.stats["drained_events"], 2)
+
+    def test_temporary_files_are_ignored(self):
+        spool = Spool(self.dir, 1024 * 1024)
+        with open(os.path.join(self.dir, "partial.ndjson.gz.tmp"), "wb") as f:
+            f.write(b"garbage")
+        self.assertEqual(spool.segments(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
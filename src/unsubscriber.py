@@ -1,77 +1,28 @@
 import logging
 import os
-import re
-from typing import Optional, TypedDict
-
-import boto3
-from helpers import send_response  # type: ignore
+from typing import TypedDict
+
+from helpers import (  # type: ignore
+    send_response,
+    iter_matching_log_groups,
+    delete_subscription_filter,
+)
+from loggroups import LogGroupMatcher
+from ratelimit import TokenBucket
+import checkpoint
+import reconcile
 
 level = os.getenv("log_level", "INFO")
 logging.basicConfig(level=level)
 logger = logging.getLogger()
 logger.setLevel(level)
 
-cloudwatch_logs_client = boto3.client("logs")
-lambda_client = boto3.client("lambda")
-
-log_groups_return_limit = 50
-
-
-def build_groups_list(
-    all_groups: list,
-    names: Optional[list],
-    pattern: Optional[str] = None,
-    prefix: Optional[str] = None,
-):
-    # ensure filter params have correct values
-    if not names:
-        names = None
-    if not pattern:
-        pattern = None
-    if not prefix:
-        prefix = None
-    # filter out the log groups based on the names, pattern, and prefix provided in the environment variables
-    groups = []
-    for g in all_groups:
-        group = {"name": g["logGroupName"].strip(), "arn": g["arn"]}
-        if names is not None and group["name"] in names:
-            groups.append(group)
-            continue
-        elif prefix is not None and group["name"].startswith(prefix):
-            groups.append(group)
-            continue
-        elif pattern is not None and re.match(pattern, group["name"]):
-            groups.append(group)
-
-    return groups
-
-
-def get_log_groups(nextToken=None):
-    # check docs:
-    # 1. boto3 https://boto3.amazonaws.com/v1/documentation/api/1.9.42/reference/services/logs.html#CloudWatchLogs.Client.describe_log_groups
-    # 2. AWS API https://docs.aws.amazon.com/AmazonCloudWatchLogs/latest/APIReference/API_DescribeLogGroups.html#API_DescribeLogGroups_RequestSyntax
-    resp = cloudwatch_logs_client.describe_log_groups(limit=log_groups_return_limit)
-    all_groups = resp["logGroups"]
-    nextToken = resp["nextToken"] if "nextToken" in resp else None
-    # continue fetching log groups until nextToken is None
-    while nextToken is not None:
-        resp = cloudwatch_logs_client.describe_log_groups(
-            limit=log_groups_return_limit, nextToken=nextToken
-        )
-        all_groups.extend(resp["logGroups"])
-        nextToken = resp["nextToken"] if "nextToken" in resp else None
-
-    return all_groups
-
-
-def delete_subscription_filter(log_group_name: str):
-    logger.info(f"Deleting subscription filter for {log_group_name}...")
-
-    cloudwatch_logs_client.delete_subscription_filter(
-        logGroupName=log_group_name, filterName="%s-axiom" % log_group_name
-    )
-
-    logger.info(f"{log_group_name} subscription filter has been deleted successfully.")
+# DescribeSubscriptionFilters calls per second and in flight in reconcile mode
+describe_rate = float(os.getenv("AXIOM_SUBSCRIBE_RATE", "5"))
+describe_concurrency = int(os.getenv("AXIOM_SUBSCRIBE_CONCURRENCY", "4"))
+# the run is continued in another invocation when this invocation has less
+# than this left to run
+margin_ms = int(os.getenv("AXIOM_SUBSCRIBE_MARGIN_MS", "20000"))
 
 
 def lambda_handler(event: dict, context=None):
@@ -82,9 +33,49 @@ def lambda_handler(event: dict, context=None):
     log_group_names_list = (
         log_group_names.split(",") if log_group_names is not None else []
     )
-    log_groups = build_groups_list(
-        get_log_groups(), log_group_names_list, log_group_pattern, log_group_prefix
+    # runs that do not fit in one invocation are continued in the next one
+    key = checkpoint.run_key(
+        "unsubscribe",
+        {
+            "log_group_names": log_group_names,
+            "log_group_prefix": log_group_prefix,
+            "log_group_pattern": log_group_pattern,
+            "reconcile": reconcile.mode,
+        },
     )
+    progress = checkpoint.resume(event, key)
+    saver = checkpoint.Saver(key, progress)
+
+    def stop() -> bool:
+        return checkpoint.out_of_time(context, margin_ms)
+
+    # unlike the Subscriber, no filters select no log groups
+    log_groups = progress.track(
+        iter_matching_log_groups(
+            LogGroupMatcher.from_config(
+                log_group_names_list,
+                log_group_pattern,
+                log_group_prefix,
+                match_all=False,
+            ),
+            start=progress.cursor,
+        )
+    )
+    plan = None
+    dry_run = reconcile.mode == "dry-run"
+    if reconcile.mode != "off":
+        # only the log groups that have the subscription filter are deleted
+        plan = reconcile.Plan()
+        log_groups = reconcile.plan_groups(
+            log_groups,
+            reconcile.unsubscribe_action,
+            plan,
+            TokenBucket(describe_rate),
+            apply=() if dry_run else ("delete",),
+            workers=describe_concurrency,
+            stop=stop,
+            skipped=progress.finished,
+        )
 
     Report = TypedDict(
         "Report",
@@ -93,19 +84,24 @@ def lambda_handler(event: dict, context=None):
             "matched_log_groups": list,
             "added_groups": list,
             "added_groups_count": int,
+            "reconcile": dict,
+            "invocation": int,
             "errors": dict,
         },
     )
     report: Report = {
-        "log_groups_count": len(log_groups),
+        "log_groups_count": 0,
         "matched_log_groups": [],
         "added_groups": [],
         "added_groups_count": 0,
+        "reconcile": {},
+        "invocation": checkpoint.continuation(event).get("invocation", 0),
         "errors": {},
     }
 
     responseData = {}
     for group in log_groups:
+        report["log_groups_count"] += 1
         report["matched_log_groups"].append(group["name"])
         report["errors"][group["name"]] = []
 
@@ -118,10 +114,30 @@ def lambda_handler(event: dict, context=None):
             )
 
         report["added_groups_count"] += 1
+        progress.finished(group)
+        saver.save()
 
         logger.info(
             f"unsubsribed from {report['added_groups_count']} log groups out of {len(report['matched_log_groups'])} groups"
         )
+        if stop():
+            break
+
+    if plan is not None:
+        plan.log("subscription filters to delete", dry_run)
+        report["reconcile"] = plan.summary()
+        logger.info(report)
+
+    unfinished = progress.checkpoint() is not None
+    if unfinished and checkpoint.continue_in_background(event, context, key, progress):
+        # the last invocation responds
+        return
+    saver.save(force=True)
+    if unfinished:
+        logger.warning(
+            "ran out of time before the subscription filters of all log groups "
+            f"were deleted, {progress.pending} listed log groups were not done"
+        )
 
     responseData["success"] = "True"
     send_response(event, context, "SUCCESS", responseData)
@@ -0,0 +1,53 @@
+"""Fake CloudWatch Logs client of the Subscriber and Unsubscriber tests."""
+
+
+class NotFound(Exception):
+    response = {"Error": {"Code": "ResourceNotFoundException"}}
+
+
+class Logs:
+    """
+    CloudWatch Logs of a fake account: log groups, paged like
+    DescribeLogGroups, and their subscription filters. groups holds the names
+    of the log groups, or their subscription filters by name.
+    """
+
+    def __init__(self, groups):
+        if not isinstance(groups, dict):
+            groups = {name: [] for name in groups}
+        self.filters = {name: list(fs) for name, fs in groups.items()}
+        self.names = sorted(self.filters)
+        # DescribeLogGroups calls, as (prefix, nextToken)
+        self.listings = []
+        # calls on a single log group, as (action, log group name)
+        self.calls = []
+
+    def describe_log_groups(self, limit, logGroupNamePrefix="", nextToken=None):
+        self.listings.append((logGroupNamePrefix, nextToken))
+        names = [n for n in self.names if n.startswith(logGroupNamePrefix)]
+        start = int(nextToken or 0)
+        resp = {
+            "logGroups": [
+                {"logGroupName": n, "arn": f"arn:aws:logs:us-east-1:1:log-group:{n}:*"}
+                for n in names[start : start + limit]
+            ]
+        }
+        if start + limit < len(names):
+            resp["nextToken"] = str(start + limit)
+        return resp
+
+    def describe_subscription_filters(self, logGroupName):
+        self.calls.append(("describe", logGroupName))
+        if logGroupName not in self.filters:
+            raise NotFound()
+        return {"subscriptionFilters": self.filters[logGroupName]}
+
+    def put_subscription_filter(self, logGroupName, filterName, **kwargs):
+        self.calls.append(("put", logGroupName))
+
+    def delete_subscription_filter(self, logGroupName, filterName):
+        self.calls.append(("delete", logGroupName))
+
+    def changed(self):
+        """The puts and deletes, sorted."""
+        return sorted(c for c in self.calls if c[0] != "describe")
@@ -0,0 +1,320 @@
+"""
+Local stand-in for the Axiom ingest endpoint.
+
+Serves the ingest routes the forwarder sends to, /v1/datasets/{dataset}/ingest
+and /v1/ingest/{dataset}, and accepts JSON arrays and NDJSON bodies that are
+uncompressed or gzip or zstd compressed. It counts the requests, events and
+bytes it received per dataset and can keep the events for correctness checks.
+
+Faults can be injected to test batching and retries: latency, 503 errors, 429
+responses with Retry-After and connections that are closed without a response.
+
+    python testing/ingest_server.py --port 3400 --latency-ms 50 --throttle-rate 0.1
+"""
+
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None
+
+_routes = (
+    re.compile(r"^/v1/datasets/([^/]+)/ingest$"),
+    re.compile(r"^/v1/ingest/([^/]+)$"),
+)
+
+
+class Faults(NamedTuple):
+    """Faults injected into ingest requests, rates are between 0 and 1."""
+
+    latency_ms: float = 0
+    # latency is drawn uniformly from latency_ms +/- jitter_ms
+    jitter_ms: float = 0
+    # requests answered with 503 Service Unavailable
+    error_rate: float = 0
+    # requests answered with 429 Too Many Requests and Retry-After
+    throttle_rate: float = 0
+    retry_after_seconds: float = 1
+    # requests whose connection is closed without a response
+    drop_rate: float = 0
+    seed: Optional[int] = None
+
+
+def dataset_of(path: str) -> Optional[str]:
+    for route in _routes:
+        match = route.match(urlsplit(path).path)
+        if match is not None:
+            return match.group(1)
+    return None
+
+
+def decode_body(raw: bytes, encoding: str) -> bytes:
+    if encoding in ("", "identity"):
+        return raw
+    if encoding == "gzip":
+        return gzip.decompress(raw)
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+    raise ValueError(f"Unsupported Content-Encoding {encoding}")
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately; with Nagle's algorithm the
+    # body waits for the delayed ACK of the headers on keep-alive connections
+    disable_nagle_algorithm = True
+    server: "IngestServer"
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b"".join(parts)
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _respond(self, status: int, document: dict, headers: Optional[dict] = None):
+        response = json.dumps(document).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(response)
+
+    def do_POST(self):
+        server = self.server
+        raw = self._read_body()
+        dataset = dataset_of(self.path)
+        if dataset is None:
+            server.count("not_found")
+            self._respond(404, {"message": f"No ingest route {self.path}"})
+            return
+
+        fault = server.next_fault()
+        delay = server.next_latency()
+        if delay > 0:
+            time.sleep(delay)
+        if fault == "drop":
+            server.count("dropped")
+            self.close_connection = True
+            return
+        if fault == "throttle":
+            server.count("throttled")
+            retry_after = f"{server.faults.retry_after_seconds:g}"
+            self._respond(
+                429, {"message": "rate limited"}, {"Retry-After": retry_after}
+            )
+            return
+        if fault == "error":
+            server.count("errors")
+            self._respond(503, {"message": "injected error"})
+            return
+
+        try:
+            body = decode_body(raw, self.headers.get("Content-Encoding", ""))
+            content_type = self.headers.get("Content-Type", "")
+            events = server.parse_events(body, content_type)
+        except ValueError as e:
+            server.count("bad_requests")
+            self._respond(400, {"message": str(e)})
+            return
+        server.record(dataset, events, len(raw), len(body))
+        count = events if isinstance(events, int) else len(events)
+        self._respond(
+            200,
+            {
+                "ingested": count,
+                "failed": 0,
+                "failures": [],
+                "processedBytes": len(body),
+            },
+        )
+
+    def log_message(self, format, *args):
+        pass
+
+
+class IngestServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        faults: Faults = Faults(),
+        keep_events: bool = False,
+    ):
+        super().__init__((host, port), IngestHandler)
+        self.faults = faults
+        # keep the decoded events per dataset in received
+        self.keep_events = keep_events
+        self._rng = random.Random(faults.seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.reset()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def next_fault(self) -> Optional[str]:
+        faults = self.faults
+        with self._lock:
+            draw = self._rng.random()
+        for name, rate in (
+            ("drop", faults.drop_rate),
+            ("throttle", faults.throttle_rate),
+            ("error", faults.error_rate),
+        ):
+            if draw < rate:
+                return name
+            draw -= rate
+        return None
+
+    def next_latency(self) -> float:
+        faults = self.faults
+        if faults.latency_ms <= 0 and faults.jitter_ms <= 0:
+            return 0
+        with self._lock:
+            jitter = self._rng.uniform(-faults.jitter_ms, faults.jitter_ms)
+        return max(faults.latency_ms + jitter, 0) / 1000
+
+    def parse_events(self, body: bytes, content_type: str):
+        """
+        Returns the events of a request body, or only their number if they
+        are not kept.
+        """
+        try:
+            if content_type.startswith("application/x-ndjson"):
+                if not self.keep_events:
+                    lines = body.count(b"\n")
+                    return lines + 1 if body and not body.endswith(b"\n") else lines
+                return [json.loads(line) for line in body.splitlines() if line]
+            events = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid body: {e}") from e
+        if not isinstance(events, list):
+            events = [events]
+        return events if self.keep_events else len(events)
+
+    def count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def record(self, dataset: str, events, sent_bytes: int, raw_bytes: int):
+        count = events if isinstance(events, int) else len(events)
+        with self._lock:
+            self.requests += 1
+            self.events += count
+            self.sent_bytes += sent_bytes
+            self.raw_bytes += raw_bytes
+            self.events_by_dataset[dataset] = (
+                self.events_by_dataset.get(dataset, 0) + count
+            )
+            if not isinstance(events, int):
+                self.received.setdefault(dataset, []).extend(events)
+
+    def reset(self):
+        with self._lock:
+            # accepted requests
+            self.requests = 0
+            self.events = 0
+            self.sent_bytes = 0
+            self.raw_bytes = 0
+            self.events_by_dataset: Dict[str, int] = {}
+            self.received: Dict[str, List[dict]] = {}
+            # rejected requests
+            self.errors = 0
+            self.throttled = 0
+            self.dropped = 0
+            self.not_found = 0
+            self.bad_requests = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "events": self.events,
+                "sent_bytes": self.sent_bytes,
+                "raw_bytes": self.raw_bytes,
+                "events_by_dataset": dict(self.events_by_dataset),
+                "errors": self.errors,
+                "throttled": self.throttled,
+                "dropped": self.dropped,
+                "not_found": self.not_found,
+                "bad_requests": self.bad_requests,
+            }
+
+    def start(self) -> "IngestServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3400)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    parser.add_argument("--retry-after", type=float, default=1)
+    parser.add_argument("--drop-rate", type=float, default=0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument(
+        "--stats-interval", type=float, default=10, help="seconds, 0 disables"
+    )
+    args = parser.parse_args()
+    faults = Faults(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after_seconds=args.retry_after,
+        drop_rate=args.drop_rate,
+        seed=args.seed,
+    )
+    server = IngestServer(args.host, args.port, faults)
+    print(f"Listening on {server.url} with {faults}", flush=True)
+
+    def print_stats():
+        while True:
+            time.sleep(args.stats_interval)
+            print(json.dumps(server.stats()), flush=True)
+
+    if args.stats_interval > 0:
+        threading.Thread(target=print_stats, daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats()), flush=True)
+
+
+if __name__ == "__main__":
+    main()